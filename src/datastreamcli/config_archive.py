@@ -0,0 +1,195 @@
+import os, io, gzip, tarfile, time, threading, shutil
+import concurrent.futures as cf
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Iterable, Tuple, List, Callable
+
+def tar_member(arcname : str, data : bytes=None, mtime : float=None) -> bytes:
+    """
+    Raw tar bytes (header, contents and padding) of a single file or directory
+
+    arcname (str) : name of member within the archive, directories end with "/"
+    data (bytes) : file contents, None for a directory
+    mtime (float) : modification time recorded for the member
+    """
+    tarinfo = tarfile.TarInfo(arcname.rstrip("/") if arcname != "./" else ".")
+    tarinfo.mtime = time.time() if mtime is None else mtime
+    if data is None:
+        tarinfo.type = tarfile.DIRTYPE
+        tarinfo.mode = 0o755
+        return tarinfo.tobuf(format=tarfile.PAX_FORMAT)
+    tarinfo.size = len(data)
+    tarinfo.mode = 0o644
+    padding = (tarfile.BLOCKSIZE - len(data) % tarfile.BLOCKSIZE) % tarfile.BLOCKSIZE
+    return tarinfo.tobuf(format=tarfile.PAX_FORMAT) + data + tarfile.NUL * padding
+
+def pack_fragment(members : Iterable[Tuple[str, bytes]],
+                  compresslevel : int=6,
+                  mtime : float=None,
+                  fragment_file : str=None
+                  ) -> bytes:
+    """
+    Compress a batch of files into a gzip member holding a headless, endless tar stream.
+    Fragments concatenated in any order followed by end_fragment() form a valid .tar.gz.
+
+    members (iterable) : (arcname, contents) pairs
+    compresslevel (int) : gzip compression level
+    mtime (float) : modification time recorded for the members
+    fragment_file (str) : stream the fragment to this file instead of returning it
+
+    Returns:
+        the fragment, None if written to fragment_file
+    """
+    fp = io.BytesIO() if fragment_file is None else open(fragment_file, 'wb')
+    with fp:
+        with gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=compresslevel, mtime=0) as gz:
+            for arcname, data in members:
+                gz.write(tar_member(arcname, data, mtime))
+        if fragment_file is None:
+            return fp.getvalue()
+
+def read_files(paths : List[Tuple[str, str]]) -> Iterable[Tuple[str, bytes]]:
+    """
+    Lazily read files from disk as (arcname, contents) pairs
+
+    paths (list) : (arcname, path on disk) pairs
+    """
+    for arcname, path in paths:
+        with open(path, 'rb') as fp:
+            yield arcname, fp.read()
+
+def pack_files(paths : List[Tuple[str, str]], compresslevel : int=6, fragment_file : str=None) -> bytes:
+    """
+    Read files from disk and pack them into a fragment
+
+    paths (list) : (arcname, path on disk) pairs
+    compresslevel (int) : gzip compression level
+    fragment_file (str) : stream the fragment to this file instead of returning it
+    """
+    return pack_fragment(read_files(paths), compresslevel, fragment_file=fragment_file)
+
+def end_fragment() -> bytes:
+    """
+    gzip member holding the tar end-of-archive marker
+    """
+    return gzip.compress(tarfile.NUL * tarfile.RECORDSIZE, mtime=0)
+
+class ConfigArchive:
+    """
+    Compressed tar of BMI configs built from fragments as configs are rendered, so the
+    config tarball costs no extra pass over the config directory. Member names mirror
+    `tar -C config .`, e.g. ./cat_config/CFE/CFE_cat-1.ini
+    """
+    def __init__(self, path : str, compresslevel : int=6):
+        self.path = Path(path)
+        self.compresslevel = compresslevel
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        self._fp = open(self._tmp_path, 'wb')
+        self._lock = threading.Lock()
+        self._dirs = set()
+        self.add_dir("./")
+
+    def add_fragment(self, fragment : bytes) -> None:
+        """
+        Append an already compressed fragment (see pack_fragment)
+
+        fragment (bytes) : gzip compressed tar members
+        """
+        with self._lock:
+            self._fp.write(fragment)
+
+    def add_fragment_file(self, fragment_file : str) -> None:
+        """
+        Append a fragment written to disk (e.g. by a worker process) and remove the file
+
+        fragment_file (str) : path to gzip compressed tar members
+        """
+        with self._lock:
+            with open(fragment_file, 'rb') as fp:
+                shutil.copyfileobj(fp, self._fp, 1024 * 1024)
+        os.unlink(fragment_file)
+
+    def fragment_path(self, key : str) -> str:
+        """
+        Path a worker can write a fragment to, on the same filesystem as the archive
+
+        key (str) : unique name of the fragment
+        """
+        return str(self._tmp_path) + f".{key}.part"
+
+    def add_dir(self, arcname : str) -> None:
+        """
+        Add a directory entry (and its parents) if not already present
+
+        arcname (str) : directory name within the archive, e.g. ./cat_config/CFE/
+        """
+        name = arcname.removeprefix("./").strip("/")
+        parts = name.split("/") if name else []
+        dirs = ["./"] + ["./" + "/".join(parts[:j + 1]) + "/" for j in range(len(parts))]
+        new_dirs = [x for x in dirs if x not in self._dirs]
+        if new_dirs:
+            self._dirs.update(new_dirs)
+            self.add_fragment(pack_fragment([(x, None) for x in new_dirs], self.compresslevel))
+
+    def add_files(self, members : Iterable[Tuple[str, bytes]]) -> None:
+        """
+        Compress and append a batch of in-memory files
+
+        members (iterable) : (arcname, contents) pairs
+        """
+        self.add_fragment(pack_fragment(members, self.compresslevel))
+
+    def add_paths(self, paths : List[Tuple[str, str]], batch : int=1000, nthreads : int=None) -> None:
+        """
+        Pack files that already exist on disk, compressing batches in a thread pool
+
+        paths (list) : (arcname, path on disk) pairs
+        batch (int) : number of files per fragment
+        nthreads (int) : number of threads, defaults to os.cpu_count()
+        """
+        batches = [paths[i:i + batch] for i in range(0, len(paths), batch)]
+        with cf.ThreadPoolExecutor(max_workers=nthreads) as pool:
+            for fragment in pool.map(pack_files, batches, [self.compresslevel for x in batches]):
+                self.add_fragment(fragment)
+
+    def add_tree(self, root : str, exclude : List[str]=[], skip : Callable[[str, str], bool]=None, nthreads : int=None) -> None:
+        """
+        Pack every file and directory under root, as `tar -C root .` would
+
+        root (str) : directory to pack
+        exclude (list) : glob patterns of file and directory names left out, as tar --exclude
+        skip (callable) : called with (directory, file name), true for files already in the archive
+        nthreads (int) : number of threads, defaults to os.cpu_count()
+        """
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted([x for x in dirnames if not any(fnmatch(x, y) for y in exclude)])
+            rel_dir = Path(dirpath).relative_to(root).as_posix()
+            arc_dir = "./" if rel_dir == "." else f"./{rel_dir}/"
+            self.add_dir(arc_dir)
+            for jfile in sorted(filenames):
+                if any(fnmatch(jfile, y) for y in exclude): continue
+                if skip is not None and skip(dirpath, jfile): continue
+                paths.append((arc_dir + jfile, os.path.join(dirpath, jfile)))
+        self.add_paths(paths, nthreads=nthreads)
+
+    def close(self) -> None:
+        """
+        Write the end-of-archive marker and move the archive into place
+        """
+        self.add_fragment(end_fragment())
+        self._fp.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fp.close()
+            self._tmp_path.unlink(missing_ok=True)
+            for jfile in self._tmp_path.parent.glob(self._tmp_path.name + ".*.part"):
+                jfile.unlink(missing_ok=True)
@@ -0,0 +1,139 @@
+import os, hashlib, json
+from pathlib import Path
+from typing import Tuple, List
+import pandas as pd
+
+MANIFEST_NAME = ".manifest.parquet"
+MANIFEST_COLUMNS = ["model", "divide_id", "row_hash", "context"]
+
+# File name of each model's config for a given divide id
+CONFIG_FILENAMES = {
+    "CFE"     : "CFE_{}.ini",
+    "PET"     : "PET_{}.ini",
+    "NoahOWP" : "noah-owp-modular-init-{}.namelist.input",
+    "bmi_rust": "{}.yml",
+}
+
+def context_hash(*fields) -> str:
+    """
+    Hash of everything shared by all divides of a model, e.g. realization fields and template version
+
+    fields : json serializable values
+    """
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+def row_hashes(df : pd.DataFrame, id_col : str="divide_id") -> pd.Series:
+    """
+    Hash of each row of an input table, indexed by divide id
+
+    df (pd.DataFrame) : input table, any geometry column must already be encoded (e.g. WKB)
+    id_col (str) : column holding the divide id
+    """
+    df = df.sort_values(by=id_col)
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    hashes.index = df[id_col].values
+    return hashes
+
+def load_manifest(config_dir : str) -> pd.DataFrame:
+    """
+    Read the config manifest, empty if it does not exist yet
+
+    config_dir (str) : path to cat_config
+    """
+    manifest_file = Path(config_dir, MANIFEST_NAME)
+    if manifest_file.exists():
+        return pd.read_parquet(manifest_file)
+    return pd.DataFrame({"model": pd.Series(dtype=str),
+                         "divide_id": pd.Series(dtype=str),
+                         "row_hash": pd.Series(dtype="uint64"),
+                         "context": pd.Series(dtype=str)})
+
+def write_manifest(config_dir : str, manifest : pd.DataFrame) -> None:
+    """
+    Atomically write the config manifest
+
+    config_dir (str) : path to cat_config
+    manifest (pd.DataFrame) : manifest to write
+    """
+    Path(config_dir).mkdir(parents=True, exist_ok=True)
+    manifest_file = Path(config_dir, MANIFEST_NAME)
+    tmp_file = manifest_file.with_suffix(f".{os.getpid()}.tmp")
+    manifest[MANIFEST_COLUMNS].to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, manifest_file)
+
+def plan_model(manifest : pd.DataFrame,
+               model : str,
+               hashes : pd.Series,
+               context : str,
+               existing : List[str]
+               ) -> Tuple[List[str], List[str]]:
+    """
+    Decide which divides of a model need to be (re)generated and which configs are orphaned
+
+    manifest (pd.DataFrame) : current manifest
+    model (str) : model name as found in the realization
+    hashes (pd.Series) : input row hash per divide id
+    context (str) : context hash of the model
+    existing (list) : divide ids that currently have a config file on disk
+
+    Returns:
+        stale : divide ids whose inputs changed, are new, or whose config is missing
+        removed : divide ids that are in the manifest but no longer in the inputs
+    """
+    recorded = manifest.loc[manifest["model"] == model].set_index("divide_id")
+    current = pd.DataFrame({"row_hash": hashes.values}, index=hashes.index)
+    joined = current.join(recorded[["row_hash", "context"]], rsuffix="_recorded")
+    unchanged = (joined["row_hash"] == joined["row_hash_recorded"]) & (joined["context"] == context)
+    unchanged &= joined.index.isin(existing)
+    stale = joined.index[~unchanged].tolist()
+    removed = recorded.index[~recorded.index.isin(hashes.index)].tolist()
+    return stale, removed
+
+def update_manifest(manifest : pd.DataFrame,
+                    model : str,
+                    hashes : pd.Series,
+                    context : str
+                    ) -> pd.DataFrame:
+    """
+    Replace a model's entries in the manifest with the current input hashes
+
+    manifest (pd.DataFrame) : current manifest
+    model (str) : model name as found in the realization
+    hashes (pd.Series) : input row hash per divide id
+    context (str) : context hash of the model
+    """
+    entries = pd.DataFrame({"model": model,
+                            "divide_id": hashes.index.astype(str),
+                            "row_hash": hashes.values.astype("uint64"),
+                            "context": context})
+    manifest = manifest.loc[manifest["model"] != model]
+    return pd.concat([manifest, entries], ignore_index=True)[MANIFEST_COLUMNS]
+
+def existing_configs(model_dir : str, model : str) -> List[str]:
+    """
+    Divide ids that have a config file for a model on disk
+
+    model_dir (str) : directory holding the model's configs
+    model (str) : model name as found in the realization
+    """
+    if not os.path.isdir(model_dir):
+        return []
+    prefix, suffix = CONFIG_FILENAMES[model].split("{}")
+    ids = []
+    for jfile in os.listdir(model_dir):
+        if jfile.startswith(prefix) and jfile.endswith(suffix):
+            ids.append(jfile[len(prefix):len(jfile) - len(suffix)])
+    return ids
+
+def remove_configs(model_dir : str, model : str, divide_ids : List[str]) -> None:
+    """
+    Delete the configs of divides that are no longer in the hydrofabric
+
+    model_dir (str) : directory holding the model's configs
+    model (str) : model name as found in the realization
+    divide_ids (list) : divide ids to remove configs for
+    """
+    for jcatch in divide_ids:
+        jfile = Path(model_dir, CONFIG_FILENAMES[model].format(jcatch))
+        if jfile.exists():
+            jfile.unlink()
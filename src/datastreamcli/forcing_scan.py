@@ -0,0 +1,228 @@
+import os, json, time, threading
+import concurrent.futures as cf
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Callable, IO, Union
+import numpy as np
+import h5py
+
+# Plausible physical range of each ngen forcing variable, values outside are flagged
+DEFAULT_BOUNDS = {
+    "precip_rate"         : [0.0, 0.1],        # kg m-2 s-1 (360 mm/hr)
+    "APCP_surface"        : [0.0, 360.0],      # kg m-2 per hour
+    "TMP_2maboveground"   : [180.0, 340.0],    # K
+    "SPFH_2maboveground"  : [0.0, 0.05],       # kg kg-1
+    "UGRD_10maboveground" : [-100.0, 100.0],   # m s-1
+    "VGRD_10maboveground" : [-100.0, 100.0],   # m s-1
+    "PRES_surface"        : [30000.0, 110000.0], # Pa
+    "DSWRF_surface"       : [0.0, 1500.0],     # W m-2
+    "DLWRF_surface"       : [0.0, 800.0],      # W m-2
+}
+
+# Variables that are legitimately constant for long stretches (e.g. no rain)
+CONSTANT_OK = {"precip_rate", "APCP_surface"}
+
+# Variables in a forcing file that are not forcing data
+NON_DATA_VARIABLES = {"ids", "Time", "catchment-id", "time"}
+
+def load_bounds(bounds_file : str=None) -> Dict[str, List[float]]:
+    """
+    Default bounds updated with any given in a json file of {variable : [min, max]}
+
+    bounds_file (str) : path to json file, None for the defaults
+    """
+    bounds = {x : list(y) for x, y in DEFAULT_BOUNDS.items()}
+    if bounds_file is not None:
+        with open(bounds_file, 'r') as fp:
+            bounds.update(json.load(fp))
+    return bounds
+
+def block_shape(dataset : h5py.Dataset, target_bytes : int=32 * 1024 * 1024) -> Tuple[int, int]:
+    """
+    Rows and columns read per block. Blocks hold whole HDF5 chunks, span the full time axis when
+    a row of chunks fits in target_bytes and are split along time as well otherwise.
+
+    dataset (h5py.Dataset) : (catchment, time) forcing variable
+    target_bytes (int) : approximate size of a block
+    """
+    nrows, ncols = dataset.shape
+    chunk_rows, chunk_cols = dataset.chunks if dataset.chunks is not None else (1, ncols)
+    itemsize = dataset.dtype.itemsize
+    row_bytes = max(ncols * itemsize, 1)
+    if chunk_rows * row_bytes <= target_bytes:
+        block_rows = max(chunk_rows, target_bytes // row_bytes // chunk_rows * chunk_rows)
+        block_cols = ncols
+    else:
+        block_rows = chunk_rows
+        block_cols = max(chunk_cols, target_bytes // (chunk_rows * itemsize) // chunk_cols * chunk_cols)
+    return max(1, min(nrows, block_rows)), max(1, min(ncols, block_cols))
+
+def scan_block(dataset : h5py.Dataset, r0 : int, r1 : int, t0 : int, t1 : int, lower : float, upper : float) -> dict:
+    """
+    Reductions over one (catchment, time) block of a forcing variable
+
+    dataset (h5py.Dataset) : (catchment, time) forcing variable
+    r0, r1 (int) : rows (catchments) to read
+    t0, t1 (int) : columns (times) to read
+    lower, upper (float) : bounds, values outside are flagged
+    """
+    block = dataset[r0:r1, t0:t1]
+    nan = np.isnan(block)
+    out = (block < lower) | (block > upper)
+    return {
+        "nbytes"   : block.nbytes,
+        "nan"      : int(nan.sum()),
+        "count"    : int(block.size - nan.sum()),
+        "sum"      : float(np.nansum(block, dtype=np.float64)),
+        "min"      : float(np.fmin.reduce(block, axis=None)) if block.size > 0 else np.nan,
+        "max"      : float(np.fmax.reduce(block, axis=None)) if block.size > 0 else np.nan,
+        "r0"       : r0,
+        "row_min"  : np.fmin.reduce(block, axis=1),
+        "row_max"  : np.fmax.reduce(block, axis=1),
+        "bad_rows" : np.flatnonzero(out.any(axis=1) | nan.any(axis=1)) + r0,
+        "bad_cols" : np.flatnonzero(out.any(axis=0) | nan.any(axis=0)) + t0,
+    }
+
+def time_ranges(indices : List[int], times : np.ndarray) -> List[str]:
+    """
+    Contiguous runs of time indices as "start - end" strings
+    """
+    ranges = []
+    indices = sorted(indices)
+    j = 0
+    while j < len(indices):
+        k = j
+        while k + 1 < len(indices) and indices[k + 1] == indices[k] + 1:
+            k += 1
+        start = datetime.fromtimestamp(times[indices[j]], timezone.utc).strftime('%Y-%m-%d %H:%M')
+        end = datetime.fromtimestamp(times[indices[k]], timezone.utc).strftime('%Y-%m-%d %H:%M')
+        ranges.append(start if j == k else f"{start} - {end}")
+        j = k + 1
+    return ranges
+
+def scan_forcings(nc_file : Union[str, Callable[[], IO]],
+                  ids : np.ndarray,
+                  times : np.ndarray,
+                  bounds : Dict[str, List[float]]=None,
+                  nthreads : int=None,
+                  max_listed : int=10
+                  ) -> dict:
+    """
+    Stream a NetCDF forcing file block by block across catchments and time in a thread pool
+    and reduce every forcing variable to its min, max, mean and NaN count. Catchments and time
+    ranges with NaNs or values outside the bounds are flagged, as are catchments whose series
+    is constant. Only a bounded number of blocks is in flight, so memory does not grow with
+    the size of the file.
+
+    nc_file (str) : path to forcing file, or a function returning a new file object of it
+    ids (np.ndarray) : catchment id of each row
+    times (np.ndarray) : time axis in epoch seconds
+    bounds (dict) : {variable : [min, max]}, DEFAULT_BOUNDS if None
+    nthreads (int) : number of threads, cpu count if None
+    max_listed (int) : number of flagged catchments and time ranges listed per variable
+
+    Returns:
+        summary of the scan, including a list of issues
+    """
+    bounds = load_bounds() if bounds is None else bounds
+    nthreads = os.cpu_count() if nthreads is None else nthreads
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def open_file() -> h5py.File:
+        # one handle per thread
+        if not hasattr(local, "fp"):
+            local.fp = h5py.File(nc_file() if callable(nc_file) else nc_file, 'r')
+            with handles_lock:
+                handles.append(local.fp)
+        return local.fp
+
+    def task(var, r0, r1, t0, t1, lower, upper):
+        return var, scan_block(open_file()[var], r0, r1, t0, t1, lower, upper)
+
+    with h5py.File(nc_file() if callable(nc_file) else nc_file, 'r') as fp:
+        variables = [x for x in fp if x not in NON_DATA_VARIABLES and fp[x].ndim == 2 and fp[x].dtype.kind == 'f']
+        dtypes = {x : fp[x].dtype for x in variables}
+        blocks = []
+        for var in variables:
+            lower, upper = bounds.get(var, [-np.inf, np.inf])
+            nrows, ncols = fp[var].shape
+            block_rows, block_cols = block_shape(fp[var])
+            for r0 in range(0, nrows, block_rows):
+                for t0 in range(0, ncols, block_cols):
+                    blocks.append((var, r0, min(r0 + block_rows, nrows), t0, min(t0 + block_cols, ncols), lower, upper))
+
+    stats = {}
+    for var in variables:
+        stats[var] = {"min": np.nan, "max": np.nan, "sum": 0.0, "count": 0, "nan": 0,
+                      "row_min": np.full(len(ids), np.nan, dtype=dtypes[var]),
+                      "row_max": np.full(len(ids), np.nan, dtype=dtypes[var]),
+                      "bad_rows": set(), "bad_cols": set()}
+
+    nbytes = 0
+    t_start = time.perf_counter()
+    try:
+        with cf.ThreadPoolExecutor(max_workers=nthreads) as pool:
+            pending = set()
+            for jblock in blocks + [None]:
+                if jblock is not None:
+                    pending.add(pool.submit(task, *jblock))
+                if len(pending) < 2 * nthreads and jblock is not None:
+                    continue
+                done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED if jblock is not None else cf.ALL_COMPLETED)
+                for future in done:
+                    var, result = future.result()
+                    jstats = stats[var]
+                    nbytes += result["nbytes"]
+                    jstats["min"] = np.fmin(jstats["min"], result["min"])
+                    jstats["max"] = np.fmax(jstats["max"], result["max"])
+                    jstats["sum"] += result["sum"]
+                    jstats["count"] += result["count"]
+                    jstats["nan"] += result["nan"]
+                    rows = slice(result["r0"], result["r0"] + len(result["row_min"]))
+                    jstats["row_min"][rows] = np.fmin(jstats["row_min"][rows], result["row_min"])
+                    jstats["row_max"][rows] = np.fmax(jstats["row_max"][rows], result["row_max"])
+                    jstats["bad_rows"].update(result["bad_rows"].tolist())
+                    jstats["bad_cols"].update(result["bad_cols"].tolist())
+    finally:
+        for jfp in handles:
+            jfp.close()
+    elapsed = time.perf_counter() - t_start
+
+    summary = {"variables": {}, "issues": [], "warnings": [], "bytes": nbytes, "seconds": elapsed,
+               "gb_per_s": nbytes / 1e9 / elapsed if elapsed > 0 else float("inf")}
+    for var in variables:
+        jstats = stats[var]
+        lower, upper = bounds.get(var, [-np.inf, np.inf])
+        summary["variables"][var] = {
+            "min"  : float(jstats["min"]),
+            "max"  : float(jstats["max"]),
+            "mean" : jstats["sum"] / jstats["count"] if jstats["count"] > 0 else float("nan"),
+            "nan"  : jstats["nan"],
+            "bounds" : [lower, upper],
+            "flagged_catchments" : len(jstats["bad_rows"]),
+        }
+        if len(jstats["bad_rows"]) > 0:
+            bad_ids = [str(ids[x]) for x in sorted(jstats["bad_rows"])]
+            ranges = time_ranges(list(jstats["bad_cols"]), times)
+            listed_ids = ", ".join(bad_ids[:max_listed]) + (" ..." if len(bad_ids) > max_listed else "")
+            listed_ranges = ", ".join(ranges[:max_listed]) + (" ..." if len(ranges) > max_listed else "")
+            summary["issues"].append(
+                f"{var} has NaNs or values outside [{lower}, {upper}] for {len(bad_ids)} catchment(s) ({listed_ids}) during {listed_ranges}")
+        if var not in CONSTANT_OK and len(times) > 2:
+            constant = np.flatnonzero(jstats["row_min"] == jstats["row_max"])
+            if len(constant) > 0:
+                listed_ids = ", ".join([str(ids[x]) for x in constant[:max_listed]]) + (" ..." if len(constant) > max_listed else "")
+                summary["warnings"].append(f"{var} is constant in time for {len(constant)} catchment(s) ({listed_ids})")
+    return summary
+
+def print_scan_summary(summary : dict) -> None:
+    """
+    Print a scan_forcings summary
+    """
+    print(f"\n{'variable':<22}{'min':>12}{'max':>12}{'mean':>12}{'NaNs':>10}{'flagged':>10}", flush=True)
+    for var, jstats in summary["variables"].items():
+        print(f"{var:<22}{jstats['min']:>12.4g}{jstats['max']:>12.4g}{jstats['mean']:>12.4g}{jstats['nan']:>10}{jstats['flagged_catchments']:>10}", flush=True)
+    for jwarning in summary["warnings"]:
+        print(f"WARNING: {jwarning}", flush=True)
+    print(f"Scanned {summary['bytes'] / 1e9:.3f} GB of forcings in {summary['seconds']:.2f} s ({summary['gb_per_s']:.2f} GB/s)\n", flush=True)
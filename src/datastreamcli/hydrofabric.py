@@ -0,0 +1,187 @@
+import os, json, hashlib
+from pathlib import Path
+from typing import Union, List
+import pandas as pd
+import pyarrow.parquet as pq
+import pyogrio
+import geopandas as gpd
+gpd.options.io_engine = "pyogrio"
+
+# Layers read back by more than one stage, every other layer is read straight from the geopackage
+CACHE_LAYERS = ["divides", "divide-attributes", "model-attributes"]
+CACHE_DIR_ENV = "DATASTREAM_HF_CACHE_DIR"
+CACHE_DIR_NAME = ".hfcache"
+
+def get_cache_dir(gpkg : str, cache_dir : str=None) -> Path:
+    """
+    Resolve the directory hydrofabric layer caches are stored in.
+    Order of precedence is the cache_dir argument, the DATASTREAM_HF_CACHE_DIR
+    environment variable and finally a hidden directory beside the geopackage.
+
+    gpkg (str) : path to geopackage
+    cache_dir (str) : optional path to cache directory
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir is None:
+        cache_dir = Path(gpkg).parent / CACHE_DIR_NAME
+    return Path(cache_dir)
+
+def gpkg_hash(gpkg : str, chunk_size : int=8 * 1024 * 1024) -> str:
+    """
+    sha256 of the geopackage contents
+
+    gpkg (str) : path to geopackage
+    chunk_size (int) : number of bytes read at a time
+    """
+    sha = hashlib.sha256()
+    with open(gpkg, 'rb') as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def cache_key(gpkg : str, cache_dir : str=None) -> str:
+    """
+    Content hash identifying a geopackage in the cache. The (size, mtime) of the
+    geopackage is recorded next to the hash so that unchanged files are not rehashed.
+    A geopackage that is copied (new mtime) but otherwise identical resolves to the
+    same key after being rehashed once.
+
+    gpkg (str) : path to geopackage
+    cache_dir (str) : optional path to cache directory
+    """
+    cache_path = get_cache_dir(gpkg, cache_dir)
+    stat = os.stat(gpkg)
+    stat_file = cache_path / f"{Path(gpkg).stem}.stat.json"
+    if stat_file.exists():
+        with open(stat_file, 'r') as fp:
+            recorded = json.load(fp)
+        if recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+            return recorded["sha256"]
+
+    sha = gpkg_hash(gpkg)
+    cache_path.mkdir(parents=True, exist_ok=True)
+    tmp_file = stat_file.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as fp:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha}, fp)
+    os.replace(tmp_file, stat_file)
+    return sha
+
+def layer_cache_file(gpkg : str, layer : str, cache_dir : str=None) -> Path:
+    """
+    Path to the parquet cache file of a geopackage layer
+
+    gpkg (str) : path to geopackage
+    layer (str) : name of layer
+    cache_dir (str) : optional path to cache directory
+    """
+    key = cache_key(gpkg, cache_dir)
+    return get_cache_dir(gpkg, cache_dir) / key[:16] / f"{layer}.parquet"
+
+def read_cached_layer(cache_file : Path) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    """
+    Read a cached layer, as GeoParquet if the layer has geometry
+
+    cache_file (Path) : path to parquet file
+    """
+    if b"geo" in (pq.read_schema(cache_file).metadata or {}):
+        return gpd.read_parquet(cache_file)
+    return pd.read_parquet(cache_file)
+
+def write_cached_layer(df : Union[gpd.GeoDataFrame, pd.DataFrame], cache_file : Path) -> None:
+    """
+    Atomically write a layer to the cache so concurrent stages never read a partial file
+
+    df (DataFrame) : layer read from the geopackage
+    cache_file (Path) : path to parquet file
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    df.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, cache_file)
+
+def read_layer(gpkg : str, layer : str, cache_dir : str=None) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    """
+    Read a hydrofabric layer through the Arrow/GeoParquet cache. The layer is decoded
+    by GDAL and converted on first touch, later reads of the same geopackage contents
+    load the parquet file instead. Falls back to reading the geopackage directly if the
+    cache cannot be written.
+
+    gpkg (str) : path to geopackage
+    layer (str) : name of layer
+    cache_dir (str) : optional path to cache directory
+    """
+    if layer not in CACHE_LAYERS:
+        return gpd.read_file(gpkg, layer=layer)
+
+    try:
+        cache_file = layer_cache_file(gpkg, layer, cache_dir)
+    except OSError as e:
+        print(f"Hydrofabric cache unavailable ({e}), reading {layer} from {gpkg}", flush=True)
+        return gpd.read_file(gpkg, layer=layer)
+
+    if cache_file.exists():
+        return read_cached_layer(cache_file)
+
+    df = gpd.read_file(gpkg, layer=layer)
+    try:
+        write_cached_layer(df, cache_file)
+    except OSError as e:
+        print(f"Unable to cache {layer} of {gpkg} ({e})", flush=True)
+    return df
+
+def read_attributes(gpkg : str, layer : str, columns : List[str]=None, cache_dir : str=None) -> pd.DataFrame:
+    """
+    Read only the requested columns of a hydrofabric layer with geometry skipped.
+    Column projection is served from the parquet cache when the layer has been cached,
+    otherwise from pyogrio's Arrow reader. Geometry-free layers are cached on first touch,
+    layers with geometry are never decoded just to populate the cache here.
+
+    gpkg (str) : path to geopackage
+    layer (str) : name of layer
+    columns (list) : columns to read, all non-geometry columns if None
+    cache_dir (str) : optional path to cache directory
+    """
+    cache_file = None
+    if layer in CACHE_LAYERS:
+        try:
+            cache_file = layer_cache_file(gpkg, layer, cache_dir)
+        except OSError as e:
+            print(f"Hydrofabric cache unavailable ({e}), reading {layer} from {gpkg}", flush=True)
+
+    if cache_file is not None and not cache_file.exists():
+        if pyogrio.read_info(gpkg, layer=layer)["geometry_type"] is None:
+            read_layer(gpkg, layer, cache_dir)
+
+    if cache_file is not None and cache_file.exists():
+        schema = pq.read_schema(cache_file)
+        if columns is None:
+            geo_columns = []
+            if b"geo" in (schema.metadata or {}):
+                geo_columns = json.loads(schema.metadata[b"geo"])["columns"].keys()
+            columns = [x for x in schema.names if x not in geo_columns]
+        return pd.read_parquet(cache_file, columns=columns)
+
+    df = pyogrio.read_dataframe(gpkg, layer=layer, columns=columns, read_geometry=False, use_arrow=True)
+    if columns is not None:
+        df = df[columns]
+    return pd.DataFrame(df)
+
+def attributes_layer(gpkg : str) -> str:
+    """
+    Name of the divide attributes layer
+        v2.1 -> model-attributes
+        v2.2 -> divide-attributes
+
+    gpkg (str) : path to geopackage
+    """
+    layers = list(gpd.list_layers(gpkg).name)
+    if "model-attributes" in layers:
+        return "model-attributes"
+    elif "divide-attributes" in layers:
+        return "divide-attributes"
+    else:
+        raise Exception(f"Can't find attributes!")
@@ -4,16 +4,654 @@ nc2parquet: Convert NetCDF files to Parquet format with optimal compression.
 """
 
 import argparse
+import os
 import sys
+import shutil
+import io
+import json
+import time
+import inspect
+import concurrent.futures as cf
 from pathlib import Path
+from typing import Iterator, Tuple, NamedTuple
+import numpy as np
+import pandas as pd
 import xarray as xr
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def nc2parquet(nc_file: str, out_dir: str) -> None:
+# Memory budget of one conversion, in MB
+DEFAULT_MAX_MEMORY_MB = 1024
+
+# Peak memory of converting a chunk relative to its raw size
+# (xarray slice, pandas frame, Arrow table and the encoded row group)
+CHUNK_OVERHEAD = 4
+
+# Assumed size of a string value
+STRING_BYTES = 64
+
+# Table builders: "arrow" straight from the numpy buffers, "pandas" through to_dataframe
+ENGINES = ["arrow", "pandas"]
+
+# Partitioning of a consolidated dataset, by day of time or by feature_id % buckets
+PARTITION_SCHEMES = ["date", "feature_bucket"]
+DEFAULT_FEATURE_BUCKETS = 16
+
+# Sort order of the rows of each dataset partition
+SORT_COLUMNS = ["feature_id", "time"]
+
+# Rows per row group of dataset partitions, small enough for readers to skip most of a partition
+DATASET_ROW_GROUP_ROWS = 256 * 1024
+
+# Peak memory of sorting and writing a partition relative to its staged size
+# (staged tables, sorted copy and the encoded row groups)
+SORT_OVERHEAD = 3
+
+# False positive rate of the feature_id bloom filters
+BLOOM_FILTER_FPP = 0.01
+
+# Column types: "compact" stores each column at its source precision, "pandas" those of to_dataframe
+SCHEMA_POLICIES = ["compact", "pandas"]
+# CF time units whose integer multiples are whole milliseconds
+MILLISECOND_MULTIPLES = ["days", "day", "d", "hours", "hour", "hr", "h", "minutes", "minute", "min",
+                         "seconds", "second", "sec", "s", "milliseconds", "millisecond", "msec", "ms"]
+
+# Parquet codecs, "auto" picks one of AUTO_CODECS by encoding a sample of the data
+CODECS = ["zstd", "lz4", "brotli", "snappy", "gzip", "none", "auto"]
+DEFAULT_CODEC = "zstd"
+DEFAULT_COMPRESSION_LEVEL = {"zstd": 3}
+AUTO_CODECS = [("lz4", None), ("zstd", 1), ("zstd", 3), ("zstd", 9), ("brotli", 4), ("brotli", None)]
+AUTO_SAMPLE_ROWS = 256 * 1024
+
+# Encoding throughput --codec auto aims for when no target is given, in MB/s of Arrow data
+DEFAULT_TARGET_MBPS = 100
+
+class Compression(NamedTuple):
+    """
+    Codec of the Parquet output, with the targets of codec "auto"
+    """
+    codec : str = DEFAULT_CODEC
+    level : int = None
+    target_ratio : float = None
+    target_mbps : float = None
+
+def row_bytes(ds: xr.Dataset) -> int:
+    """
+    Approximate size of one row of the flattened dataset.
+    Args:
+        ds: Dataset to be flattened into a table
+    """
+    nbytes = 0
+    for var in ds.variables.values():
+        nbytes += STRING_BYTES if var.dtype.kind in "OUS" else var.dtype.itemsize
+    return max(nbytes, 1)
+
+def chunk_length(ds: xr.Dataset, max_memory_mb: float = DEFAULT_MAX_MEMORY_MB, chunk_size: int = None) -> int:
+    """
+    Number of entries of the outermost dimension converted at a time.
+    Chunks are taken along the outermost dimension only, so the rows come out in the same
+    order as a conversion of the whole dataset. A chunk is never less than one entry.
+    Args:
+        ds: Dataset to be flattened into a table
+        max_memory_mb: Memory budget of the conversion in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+    """
+    dims = list(ds.dims)
+    if len(dims) == 0:
+        return 1
+    inner = int(np.prod([ds.sizes[x] for x in dims[1:]])) if len(dims) > 1 else 1
+    if chunk_size is None:
+        chunk_size = int(max_memory_mb * 1024 * 1024 / (CHUNK_OVERHEAD * row_bytes(ds)))
+    return max(1, chunk_size // max(inner, 1))
+
+def iter_chunks(ds: xr.Dataset, length: int) -> Iterator[xr.Dataset]:
+    """
+    Slices of the dataset along its outermost dimension.
+    Args:
+        ds: Dataset to be sliced
+        length: Entries of the outermost dimension per slice
+    """
+    dims = list(ds.dims)
+    if len(dims) == 0:
+        yield ds
+        return
+    outer = dims[0]
+    for start in range(0, ds.sizes[outer], length):
+        yield ds.isel({outer: slice(start, start + length)})
+
+def chunk_table(chunk: xr.Dataset, schema: pa.Schema = None) -> pa.Table:
+    """
+    Flatten a slice of the dataset into a table with the columns of to_dataframe().reset_index(), through pandas.
+    Args:
+        chunk: Slice of the dataset
+        schema: Schema of the table (e.g. of the first chunk), chunks are cast to it
+    """
+    df = chunk.to_dataframe().reset_index()
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    return table if schema is None else table.replace_schema_metadata(schema.metadata)
+
+def arrow_table(chunk: xr.Dataset, schema: pa.Schema) -> pa.Table:
+    """
+    Flatten a slice of the dataset into a table with the columns of to_dataframe().reset_index(),
+    built straight from the numpy buffers of its variables without going through pandas.
+    Dimension columns are generated with repeat/tile. Variables spanning every dimension (in
+    dimension order) are wrapped without copying, others are broadcast. NaNs become nulls as
+    in the pandas path.
+    Args:
+        chunk: Slice of the dataset
+        schema: Schema of the table, see table_schema
+    """
+    dims = list(chunk.dims)
+    shape = [chunk.sizes[x] for x in dims]
+    arrays = {}
+    for j, dim in enumerate(dims):
+        values = chunk[dim].values if dim in chunk.variables else np.arange(shape[j], dtype="int64")
+        values = np.repeat(values, int(np.prod(shape[j + 1:])))
+        arrays[dim] = np.tile(values, int(np.prod(shape[:j])))
+    for name, var in chunk.variables.items():
+        if name in chunk.dims:
+            continue
+        var_dims = [x for x in dims if x in var.dims]
+        values = var.transpose(*var_dims).values
+        if var_dims == dims:
+            arrays[name] = pa.array(values.ravel(), from_pandas=True)
+        else:
+            # converted once, then gathered, so e.g. strings are not converted per row
+            index = np.arange(values.size).reshape([chunk.sizes[x] if x in var_dims else 1 for x in dims])
+            arrays[name] = pa.array(values.ravel(), from_pandas=True).take(np.broadcast_to(index, shape).ravel())
+    columns = []
+    for field in schema:
+        column = arrays[field.name]
+        column = column if isinstance(column, pa.Array) else pa.array(column, from_pandas=True)
+        columns.append(column if column.type == field.type else column.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+def table_schema(ds: xr.Dataset, schema_policy: str = "pandas") -> pa.Schema:
+    """
+    Schema (with pandas metadata) of the flattened dataset, that of the pandas path
+    (derived from the first entry of the outermost dimension) or its compact form.
+    Args:
+        ds: Dataset to be flattened into a table
+        schema_policy: "pandas" for the types of to_dataframe, "compact" see compact_schema
+    """
+    if schema_policy not in SCHEMA_POLICIES:
+        raise ValueError(f"Unknown schema policy {schema_policy}, use {' or '.join(SCHEMA_POLICIES)}")
+    dims = list(ds.dims)
+    first = ds.isel({dims[0]: slice(0, 1)}) if len(dims) > 0 else ds
+    schema = chunk_table(first).schema
+    return compact_schema(ds, schema) if schema_policy == "compact" else schema
+
+def compact_schema(ds: xr.Dataset, schema: pa.Schema) -> pa.Schema:
+    """
+    Store each column at the precision of its source rather than that of the decoded values.
+    Floats decoded to float64 from float32 or packed 8/16 bit integers become float32, integers
+    stored as int32 or narrower stay int32 and datetimes encoded as whole days, hours, minutes,
+    seconds or milliseconds become timestamps in milliseconds. The types follow from the dtypes
+    and encodings only, so the files of one run get the same schema. The pandas metadata follows
+    the new types.
+    Args:
+        ds: Dataset to be flattened into a table
+        schema: Schema of the pandas path, see table_schema
+    """
+    fields = []
+    for field in schema:
+        var = ds.variables.get(field.name)
+        if var is None:
+            fields.append(field)
+            continue
+        new_type = field.type
+        source = np.dtype(var.encoding.get("dtype", var.dtype))
+        if pa.types.is_float64(field.type):
+            if (source.kind == "f" and source.itemsize <= 4) or (source.kind in "iu" and source.itemsize <= 2):
+                new_type = pa.float32()
+        elif pa.types.is_int64(field.type):
+            if source.kind in "iu" and np.can_cast(source, np.int32):
+                new_type = pa.int32()
+        elif pa.types.is_timestamp(field.type) and field.type.unit == "ns":
+            if source.kind in "iu" and whole_milliseconds(var.encoding.get("units")):
+                new_type = pa.timestamp("ms", tz=field.type.tz)
+        fields.append(field.with_type(new_type))
+    return retype_metadata(schema, pa.schema(fields))
+
+def whole_milliseconds(units: str) -> bool:
+    """
+    Whether integers in CF time units (e.g. "hours since 2026-01-01 01:00:00") are whole milliseconds.
+    """
+    if not isinstance(units, str) or " since " not in units:
+        return False
+    step, reference = units.split(" since ", 1)
+    if step.strip().lower() not in MILLISECOND_MULTIPLES:
+        return False
+    try:
+        return pd.Timestamp(reference.strip()).value % 1000000 == 0
+    except ValueError:
+        return False
+
+def retype_metadata(schema: pa.Schema, new_schema: pa.Schema) -> pa.Schema:
+    """
+    Give new_schema the pandas metadata of schema, with the types of the columns that differ updated.
+    Args:
+        schema: Schema carrying the pandas metadata
+        new_schema: Schema with the same columns, some of another type
+    """
+    metadata = dict(schema.metadata or {})
+    if b"pandas" in metadata:
+        pandas_metadata = json.loads(metadata[b"pandas"])
+        for column in pandas_metadata["columns"]:
+            name = column.get("field_name", column["name"])
+            if name in new_schema.names and new_schema.field(name).type != schema.field(name).type:
+                new_type = new_schema.field(name).type
+                dtype = f"datetime64[{new_type.unit}]" if pa.types.is_timestamp(new_type) else str(np.dtype(new_type.to_pandas_dtype()))
+                column["numpy_type"] = dtype
+                if column["pandas_type"] != "datetime":
+                    column["pandas_type"] = dtype
+        metadata[b"pandas"] = json.dumps(pandas_metadata).encode()
+    return new_schema.with_metadata(metadata)
+
+def dataset_schema(nc_files: list, schema_policy: str = "compact") -> pa.Schema:
+    """
+    One schema for the files of a dataset, so their staged partitions can be merged. Where the
+    files' own schemas differ (e.g. int32 feature_id in one file, int64 in another), a column
+    takes the wider of the types.
+    Args:
+        nc_files: Paths to input NetCDF files
+        schema_policy: "compact" or "pandas", see table_schema
+    """
+    schemas = []
+    for file_path in nc_files:
+        with xr.open_dataset(file_path, cache=False) as ds:
+            schemas.append(table_schema(ds, schema_policy))
+    for file_path, schema in zip(nc_files, schemas):
+        if schema.names != schemas[0].names:
+            raise ValueError(f"{file_path} has columns {', '.join(schema.names)}, {nc_files[0]} has {', '.join(schemas[0].names)}")
+    return retype_metadata(schemas[0], pa.unify_schemas(schemas, promote_options="permissive"))
+
+def write_options(schema: pa.Schema, codec: str, level: int = None, schema_policy: str = "compact") -> dict:
+    """
+    ParquetWriter options of a codec and, for compact schemas, of encodings suited to each column:
+    byte stream split floats (without dictionaries, float values rarely repeat), delta encoded integers and
+    timestamps, dictionary encoded strings.
+    Args:
+        schema: Schema of the output
+        codec: Parquet codec, e.g. zstd, lz4 or brotli
+        level: Compression level of the codec, its default if None
+        schema_policy: "compact" or "pandas" (default encodings)
+    """
+    options = {"compression": codec}
+    level = DEFAULT_COMPRESSION_LEVEL.get(codec) if level is None else level
+    if level is not None:
+        options["compression_level"] = level
+    if schema_policy == "compact":
+        encodings = {}
+        for field in schema:
+            if pa.types.is_floating(field.type):
+                encodings[field.name] = "BYTE_STREAM_SPLIT"
+            elif pa.types.is_integer(field.type) or pa.types.is_timestamp(field.type):
+                encodings[field.name] = "DELTA_BINARY_PACKED"
+        options["use_dictionary"] = [x for x in schema.names if x not in encodings]
+        options["column_encoding"] = encodings
+    return options
+
+def codec_label(codec: str, level: int = None) -> str:
+    level = DEFAULT_COMPRESSION_LEVEL.get(codec) if level is None else level
+    return codec if level is None else f"{codec} (level {level})"
+
+def choose_codec(sample: pa.Table, compression: Compression, schema_policy: str = "compact") -> Tuple[str, int]:
+    """
+    Resolve the codec of a table. With codec "auto", each of AUTO_CODECS encodes a sample of the
+    table. With a target_ratio, the fastest codec reaching it is chosen, otherwise the smallest
+    output among the codecs encoding at target_mbps or more. If no codec meets the target, the
+    best ratio (respectively the fastest) is taken.
+    Args:
+        sample: Table, or its first rows, to be written
+        compression: Codec and targets
+        schema_policy: "compact" or "pandas", see write_options
+    Returns:
+        Codec and compression level
+    """
+    if compression.codec != "auto":
+        return compression.codec, compression.level
+    sample = sample.slice(0, AUTO_SAMPLE_ROWS)
+    results = []
+    for codec, level in AUTO_CODECS:
+        buffer = io.BytesIO()
+        t0 = time.perf_counter()
+        pq.write_table(sample, buffer, **write_options(sample.schema, codec, level, schema_policy))
+        elapsed = max(time.perf_counter() - t0, 1e-9)
+        results.append((codec, level, sample.nbytes / max(buffer.tell(), 1), sample.nbytes / 1024 / 1024 / elapsed))
+    if compression.target_ratio is not None:
+        meets = [x for x in results if x[2] >= compression.target_ratio]
+        best = max(meets, key=lambda x: x[3]) if meets else max(results, key=lambda x: x[2])
+    else:
+        target_mbps = DEFAULT_TARGET_MBPS if compression.target_mbps is None else compression.target_mbps
+        meets = [x for x in results if x[3] >= target_mbps]
+        best = max(meets, key=lambda x: x[2]) if meets else max(results, key=lambda x: x[3])
+    print(f"  Codec auto: {codec_label(best[0], best[1])}, {best[2]:.2f}x at {best[3]:.0f} MB/s on {sample.num_rows:,} sample rows", flush=True)
+    return best[0], best[1]
+
+def convert_file(file_path: Path, output_file: Path, max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+                 chunk_size: int = None, engine: str = "arrow", compression: Compression = Compression(),
+                 schema_policy: str = "compact") -> dict:
+    """
+    Stream a NetCDF file into a Parquet file one chunk (row group) at a time, so peak memory
+    is bounded by max_memory_mb rather than by the size of the file.
+    The file is written next to output_file and moved into place once complete.
+    Args:
+        file_path: Path to input NetCDF file
+        output_file: Path to output Parquet file
+        max_memory_mb: Memory budget of the conversion in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+        engine: "arrow" to build tables from the numpy buffers, "pandas" to go through to_dataframe
+        compression: Codec of the output, "auto" is resolved on the first chunk
+        schema_policy: "compact" to store columns at source precision, "pandas" for the types of to_dataframe
+    Returns:
+        Number of rows and columns, Arrow bytes and codec written
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, use {' or '.join(ENGINES)}")
+    tmp_file = output_file.with_suffix(f".{os.getpid()}.tmp")
+    result = {"rows": 0, "columns": 0, "arrow_bytes": 0, "codec": None}
+    writer = None
+    try:
+        with xr.open_dataset(file_path, cache=False) as ds:
+            length = chunk_length(ds, max_memory_mb, chunk_size)
+            schema = table_schema(ds, schema_policy)
+            for chunk in iter_chunks(ds, length):
+                if engine == "arrow":
+                    table = arrow_table(chunk, schema)
+                else:
+                    table = chunk_table(chunk, schema)
+                if writer is None:
+                    codec, level = choose_codec(table, compression, schema_policy)
+                    result["codec"] = codec_label(codec, level)
+                    writer = pq.ParquetWriter(tmp_file, table.schema, **write_options(table.schema, codec, level, schema_policy))
+                writer.write_table(table)
+                result["rows"] += table.num_rows
+                result["columns"] = table.num_columns
+                result["arrow_bytes"] += table.nbytes
+                del table
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_file, output_file)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_file.exists():
+            tmp_file.unlink()
+    return result
+
+def convert_task(file_path: Path, output_file: Path, max_memory_mb: float, chunk_size: int, engine: str,
+                 compression: Compression = Compression(), schema_policy: str = "compact") -> dict:
+    """
+    Convert one file and time it, entry point of the conversion workers.
+    Args:
+        file_path: Path to input NetCDF file
+        output_file: Path to output Parquet file
+        max_memory_mb: Memory budget of the conversion in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+        engine: "arrow" or "pandas", see convert_file
+        compression: Codec of the output
+        schema_policy: "compact" or "pandas", see convert_file
+    Returns:
+        Rows, columns, codec, wall time, Arrow, input and output bytes of the conversion
+    """
+    t0 = time.perf_counter()
+    result = convert_file(file_path, output_file, max_memory_mb, chunk_size, engine, compression, schema_policy)
+    result.update({
+        "seconds": time.perf_counter() - t0,
+        "in_bytes": file_path.stat().st_size,
+        "out_bytes": output_file.stat().st_size,
+    })
+    return result
+
+def print_summary(output_file: Path, result: dict, engine: str) -> None:
+    """
+    Print the summary of one conversion.
+    """
+    elapsed = result["seconds"]
+    print(f"✓ Successfully converted to: {output_file}")
+    print(f"  Rows: {result['rows']:,}")
+    print(f"  Columns: {result['columns']}")
+    print(f"  Time: {elapsed:.2f} s ({result['rows'] / elapsed if elapsed > 0 else 0:,.0f} rows/s, {engine})")
+    print(f"  Size: {result['out_bytes'] / 1024 / 1024:.2f} MB")
+    arrow_mb = result["arrow_bytes"] / 1024 / 1024
+    ratio = result["arrow_bytes"] / max(result["out_bytes"], 1)
+    print(f"  Compression: {result['codec']}, {ratio:.2f}x of {arrow_mb:.1f} MB in memory, {arrow_mb / elapsed if elapsed > 0 else 0:.1f} MB/s")
+
+def map_tasks(fn, tasks: list, workers: int) -> Iterator:
+    """
+    Run fn on each tuple of arguments, in a process pool if workers > 1.
+    Results are yielded in task order. The first failing task (in order) stops the tasks
+    that have not started and is raised.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield fn(*task)
+        return
+    pool = cf.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(fn, *x) for x in tasks]
+        for future in futures:
+            yield future.result()
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
+def partition_values(table: pa.Table, partition_by: str, buckets: int) -> np.ndarray:
+    """
+    Partition of each row of a table.
+    Args:
+        table: Table with feature_id and time columns
+        partition_by: "date" (YYYY-MM-DD of time) or "feature_bucket" (feature_id % buckets)
+        buckets: Number of feature_id buckets
+    """
+    if partition_by == "date":
+        return table.column("time").to_numpy().astype("datetime64[D]").astype(str)
+    return (table.column("feature_id").to_numpy() % buckets).astype(str)
+
+def stage_file(file_path: Path, staging_dir: Path, partition_by: str, buckets: int,
+               max_memory_mb: float, chunk_size: int, schema: pa.Schema = None,
+               schema_policy: str = "compact") -> dict:
+    """
+    Split a NetCDF file into its dataset partitions, streamed one chunk at a time.
+    Each partition of the file is appended to staging_dir/<partition_by>=<value>/<file stem>.arrow
+    (uncompressed Arrow IPC), so files can be staged in parallel.
+    Args:
+        file_path: Path to input NetCDF file
+        staging_dir: Directory of staged partitions
+        partition_by: "date" or "feature_bucket", see partition_values
+        buckets: Number of feature_id buckets
+        max_memory_mb: Memory budget of the staging in MB
+        chunk_size: Rows per chunk, derived from max_memory_mb if None
+        schema: Schema of the staged tables (see dataset_schema), that of the file if None
+        schema_policy: "compact" or "pandas", see convert_file
+    Returns:
+        Rows, input bytes and partitions of the file
+    """
+    writers = {}
+    nrows = 0
+    try:
+        with xr.open_dataset(file_path, cache=False) as ds:
+            missing = [x for x in SORT_COLUMNS if x not in ds.variables]
+            if missing:
+                raise ValueError(f"{file_path} has no {', '.join(missing)}, a dataset is sorted by {', '.join(SORT_COLUMNS)}")
+            length = chunk_length(ds, max_memory_mb, chunk_size)
+            schema = table_schema(ds, schema_policy) if schema is None else schema
+            for chunk in iter_chunks(ds, length):
+                table = arrow_table(chunk, schema)
+                keys, inverse = np.unique(partition_values(table, partition_by, buckets), return_inverse=True)
+                for jkey, key in enumerate(keys):
+                    if key not in writers:
+                        part_dir = staging_dir / f"{partition_by}={key}"
+                        part_dir.mkdir(parents=True, exist_ok=True)
+                        writers[key] = pa.ipc.new_file(str(part_dir / f"{file_path.stem}.arrow"), table.schema)
+                    writers[key].write_table(table.take(np.flatnonzero(inverse == jkey)))
+                nrows += table.num_rows
+                del table
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {"rows": nrows, "in_bytes": file_path.stat().st_size, "partitions": sorted(writers)}
+
+def write_partition(part_dir: Path, out_path: Path, row_group_size: int, bloom_filter: bool,
+                    compression: Compression = Compression(), schema_policy: str = "compact") -> dict:
+    """
+    Merge the staged files of a partition, sort them by (feature_id, time) and write the partition.
+    Row groups carry statistics and a page index, and the file records its sort order.
+    The partition column is encoded in the directory name only (Hive convention).
+    Args:
+        part_dir: Staging directory of the partition, named <partition_by>=<value>
+        out_path: Root directory of the dataset
+        row_group_size: Rows per row group
+        bloom_filter: Write a bloom filter of feature_id in each row group
+        compression: Codec of the partition, "auto" is resolved on the partition's first rows
+        schema_policy: "compact" or "pandas", see write_options
+    Returns:
+        Output file, rows, row groups, codec, Arrow and output bytes of the partition
+    """
+    tables = [pa.ipc.open_file(pa.memory_map(str(x))).read_all() for x in sorted(part_dir.glob("*.arrow"))]
+    sort_keys = [(x, "ascending") for x in SORT_COLUMNS]
+    table = pa.concat_tables(tables).sort_by(sort_keys)
+    del tables
+
+    output_file = out_path / part_dir.name / "part-0.parquet"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = output_file.with_suffix(f".{os.getpid()}.tmp")
+    codec, level = choose_codec(table, compression, schema_policy)
+    options = write_options(table.schema, codec, level, schema_policy)
+    if bloom_filter:
+        ndv = len(table.column("feature_id").unique())
+        options["bloom_filter_options"] = {"feature_id": {"ndv": ndv, "fpp": BLOOM_FILTER_FPP}}
+    try:
+        pq.write_table(table, tmp_file, row_group_size=row_group_size, write_statistics=True, write_page_index=True,
+                       sorting_columns=pq.SortingColumn.from_ordering(table.schema, sort_keys), **options)
+        os.replace(tmp_file, output_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+    return {
+        "output_file": output_file,
+        "rows": table.num_rows,
+        "row_groups": pq.ParquetFile(output_file).num_row_groups,
+        "codec": codec_label(codec, level),
+        "arrow_bytes": table.nbytes,
+        "out_bytes": output_file.stat().st_size,
+    }
+
+def remove_stale_partitions(out_path: Path, part_names: list) -> list:
+    """
+    Remove the partition directories of out_path (of any partitioning scheme) not in part_names,
+    left over from a previous dataset. Returns the removed directories.
+    """
+    stale = [x for scheme in PARTITION_SCHEMES for x in sorted(out_path.glob(f"{scheme}=*"))
+             if x.is_dir() and x.name not in part_names]
+    for part_dir in stale:
+        shutil.rmtree(part_dir)
+    return stale
+
+def write_dataset(nc_files: list, out_path: Path, partition_by: str, buckets: int = DEFAULT_FEATURE_BUCKETS,
+                  bloom_filter: bool = False, max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+                  chunk_size: int = None, workers: int = 1, compression: Compression = Compression(),
+                  schema_policy: str = "compact") -> None:
+    """
+    Merge NetCDF files into one Hive-partitioned Parquet dataset, out_path/<partition_by>=<value>/part-0.parquet.
+    Files are first split into partitions (staged under out_path), then each partition is sorted
+    by (feature_id, time) and written. Both steps run in a process pool with several workers.
+    A partition is sorted in memory, so before any partition is written the staged partitions are
+    checked against the memory budget; runs too large for it need more partitions (e.g. more
+    feature buckets). Once all partitions are written, the partition directories of a previous
+    dataset in out_path that this run did not write are removed, so out_path holds this dataset only.
+    Args:
+        nc_files: Paths to input NetCDF files
+        out_path: Root directory of the dataset
+        partition_by: "date" (one partition per day of time) or "feature_bucket" (feature_id % buckets)
+        buckets: Number of feature_id buckets
+        bloom_filter: Write bloom filters of feature_id
+        max_memory_mb: Memory budget of the staging and of the sorts, shared by all workers, in MB
+        chunk_size: Rows per chunk when staging and per row group when writing
+        workers: Number of files (partitions) processed at once
+        compression: Codec of the partitions
+        schema_policy: "compact" or "pandas", see convert_file
+    """
+    if partition_by not in PARTITION_SCHEMES:
+        raise ValueError(f"Unknown partitioning {partition_by}, use {' or '.join(PARTITION_SCHEMES)}")
+    if buckets < 1:
+        raise ValueError(f"Number of feature buckets must be positive, got {buckets}")
+    if bloom_filter and "bloom_filter_options" not in inspect.signature(pq.write_table).parameters:
+        raise ValueError(f"pyarrow {pa.__version__} does not write bloom filters, upgrade pyarrow or leave out --bloom_filter")
+    row_group_size = chunk_size or DATASET_ROW_GROUP_ROWS
+    staging_dir = out_path / f".staging.{os.getpid()}"
+    file_workers = max(1, min(workers, len(nc_files)))
+    worker_memory_mb = max_memory_mb / file_workers
+
+    t0 = time.perf_counter()
+    in_bytes = 0
+    nrows = 0
+    try:
+        print(f"Partitioning {len(nc_files)} file(s) by {partition_by} with {file_workers} worker(s)")
+        schema = dataset_schema(nc_files, schema_policy)
+        tasks = [(x, staging_dir, partition_by, buckets, worker_memory_mb, chunk_size, schema, schema_policy) for x in nc_files]
+        for idx, (file_path, result) in enumerate(zip(nc_files, map_tasks(stage_file, tasks, file_workers)), 1):
+            print(f"[{idx}/{len(nc_files)}] {file_path.name}: {result['rows']:,} rows in {len(result['partitions'])} partition(s)")
+            in_bytes += result["in_bytes"]
+            nrows += result["rows"]
+
+        part_dirs = sorted(staging_dir.glob(f"{partition_by}=*")) if staging_dir.exists() else []
+        part_workers = max(1, min(workers, len(part_dirs)))
+        part_memory_mb = max_memory_mb / part_workers
+        for part_dir in part_dirs:
+            staged_mb = sum(x.stat().st_size for x in part_dir.glob("*.arrow")) / 1024 / 1024
+            if staged_mb * SORT_OVERHEAD > part_memory_mb:
+                hint = f"more --buckets (now {buckets})" if partition_by == "feature_bucket" else "--partition_by feature_bucket"
+                raise ValueError(f"Partition {part_dir.name} is {staged_mb:.1f} MB in memory, sorting it needs about "
+                                 f"{staged_mb * SORT_OVERHEAD:.1f} MB of the {part_memory_mb:.1f} MB budget per worker; "
+                                 f"use {hint}, fewer --workers or a larger --max_memory")
+        print(f"Writing {len(part_dirs)} partition(s) to {out_path} with {part_workers} worker(s)")
+        tasks = [(x, out_path, row_group_size, bloom_filter, compression, schema_policy) for x in part_dirs]
+        out_bytes = 0
+        arrow_bytes = 0
+        for result in map_tasks(write_partition, tasks, part_workers):
+            print(f"✓ {result['output_file']}: {result['rows']:,} rows, {result['row_groups']} row group(s), {result['out_bytes'] / 1024 / 1024:.2f} MB, {result['codec']}")
+            out_bytes += result["out_bytes"]
+            arrow_bytes += result["arrow_bytes"]
+        stale = remove_stale_partitions(out_path, [x.name for x in part_dirs])
+        if stale:
+            print(f"Removed {len(stale)} partition(s) of a previous dataset: {', '.join(x.name for x in stale)}")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n✓ Dataset written: {out_path}")
+    print(f"  Rows: {nrows:,} in {len(part_dirs)} partition(s), sorted by {', '.join(SORT_COLUMNS)}")
+    print(f"  Size: {out_bytes / 1024 / 1024:.2f} MB, {arrow_bytes / max(out_bytes, 1):.2f}x of {arrow_bytes / 1024 / 1024:.1f} MB in memory")
+    print(f"  {in_bytes / 1024 / 1024:.1f} MB of NetCDF in {elapsed:.2f} s ({in_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0:.1f} MB/s, "
+          f"{file_workers} file worker(s), {part_workers} partition worker(s))")
+
+def nc2parquet(nc_file: str, out_dir: str, max_memory_mb: float = DEFAULT_MAX_MEMORY_MB, chunk_size: int = None,
+               engine: str = "arrow", workers: int = 1, partition_by: str = None,
+               buckets: int = DEFAULT_FEATURE_BUCKETS, bloom_filter: bool = False,
+               compression: Compression = Compression(), schema_policy: str = "compact") -> None:
     """
     Convert a NetCDF file (or directory of NetCDF files) to Parquet format.
+    Files are streamed in chunks along their outermost dimension, each written as a row group.
+    With several workers, files are converted in a process pool and the memory budget is split
+    between the workers. Summaries are printed in file order, and the first file (in order) that
+    failed stops the conversion of files that have not started and is raised.
+    With partition_by, all files are merged into one partitioned dataset instead, see write_dataset.
     Args:
         nc_file: Path to input NetCDF file or directory containing NetCDF files
         out_dir: Directory to write output Parquet file(s)
+        max_memory_mb: Memory budget of all conversions together in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+        engine: "arrow" to build tables from the numpy buffers, "pandas" to go through to_dataframe
+        workers: Number of files converted at once
+        partition_by: Write a dataset partitioned by "date" or "feature_bucket" instead of one file per input
+        buckets: Number of feature_id buckets of a dataset partitioned by feature_bucket
+        bloom_filter: Write bloom filters of feature_id in a dataset
+        compression: Codec of the output, see Compression and choose_codec
+        schema_policy: "compact" to store columns at source precision, "pandas" for the types of to_dataframe
     """
     
     nc_path = Path(nc_file)
@@ -36,42 +674,40 @@ def nc2parquet(nc_file: str, out_dir: str) -> None:
     else:
         nc_files = [nc_path]
     
-    # Process each file
-    for idx, file_path in enumerate(nc_files, 1):
+    if partition_by is not None:
+        write_dataset(nc_files, out_path, partition_by, buckets, bloom_filter, max_memory_mb, chunk_size, workers,
+                      compression, schema_policy)
+        return
+    
+    # Define output file paths
+    output_files = [out_path / f"{x.stem}.parquet" for x in nc_files]
+    workers = max(1, min(workers, len(nc_files)))
+    worker_memory_mb = max_memory_mb / workers
+    
+    t0 = time.perf_counter()
+    in_bytes = 0
+    arrow_bytes = 0
+    out_bytes = 0
+    if len(nc_files) == 1:
+        print(f"Reading NetCDF file: {nc_files[0]}")
+        print(f"Writing Parquet file: {output_files[0]}")
+    elif workers > 1:
+        print(f"Converting with {workers} workers, {worker_memory_mb:.0f} MB each")
+    # Stream each file to Parquet, one row group per chunk; results are reported in file order
+    tasks = [(x, y, worker_memory_mb, chunk_size, engine, compression, schema_policy) for x, y in zip(nc_files, output_files)]
+    for idx, (file_path, output_file, result) in enumerate(zip(nc_files, output_files, map_tasks(convert_task, tasks, workers)), 1):
         if len(nc_files) > 1:
-            print(f"\n[{idx}/{len(nc_files)}] Processing: {file_path.name}")
-        else:
-            print(f"Reading NetCDF file: {file_path}")
-        
-        # Read NetCDF file
-        ds = xr.open_dataset(file_path)
-        
-        # Convert to DataFrame
-        print("Converting to DataFrame...")
-        df = ds.to_dataframe().reset_index()
-        
-        # Close the dataset
-        ds.close()
-        
-        # Define output file path
-        output_file = out_path / f"{file_path.stem}.parquet"
-        
-        # Write to Parquet with brotli compression
-        print(f"Writing Parquet file: {output_file}")
-        df.to_parquet(
-            output_file,
-            compression='brotli',
-            index=False,
-            engine='pyarrow'
-        )
-        
-        print(f"✓ Successfully converted to: {output_file}")
-        print(f"  Rows: {len(df):,}")
-        print(f"  Columns: {len(df.columns)}")
-        print(f"  Size: {output_file.stat().st_size / 1024 / 1024:.2f} MB")
+            print(f"\n[{idx}/{len(nc_files)}] {file_path.name}")
+        print_summary(output_file, result, engine)
+        in_bytes += result["in_bytes"]
+        arrow_bytes += result["arrow_bytes"]
+        out_bytes += result["out_bytes"]
+    elapsed = time.perf_counter() - t0
     
     if len(nc_files) > 1:
         print(f"\n✓ All {len(nc_files)} files converted successfully!")
+        print(f"  {in_bytes / 1024 / 1024:.1f} MB of NetCDF in {elapsed:.2f} s ({in_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0:.1f} MB/s, {workers} worker(s))")
+        print(f"  {arrow_bytes / max(out_bytes, 1):.2f}x of {arrow_bytes / 1024 / 1024:.1f} MB in memory to {out_bytes / 1024 / 1024:.1f} MB of Parquet")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -81,6 +717,7 @@ def main():
 Examples:
   nc2parquet --nc_file data.nc --out_dir ./output
   nc2parquet --nc_file /path/to/climate_data.nc --out_dir /path/to/parquet_files
+  nc2parquet --nc_file ngen-run/outputs/troute --out_dir ./troute_dataset --partition_by date --bloom_filter
         """
     )
     
@@ -96,10 +733,107 @@ Examples:
         help='Directory to write output Parquet file'
     )
     
+    parser.add_argument(
+        '--max_memory', '--max-memory',
+        dest='max_memory',
+        type=float,
+        default=DEFAULT_MAX_MEMORY_MB,
+        help=f'Memory budget of the conversion in MB, shared by all workers, sets the chunk size (default: {DEFAULT_MAX_MEMORY_MB})'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        default=1,
+        help='Number of files to convert at once in a process pool (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--chunk_size', '--chunk-size',
+        dest='chunk_size',
+        type=int,
+        default=None,
+        help='Rows per chunk (Parquet row group), overrides --max_memory'
+    )
+    
+    parser.add_argument(
+        '--engine',
+        dest='engine',
+        choices=ENGINES,
+        default='arrow',
+        help='Build tables from the NetCDF buffers (arrow) or through Dataset.to_dataframe (pandas), for comparison'
+    )
+    
+    parser.add_argument(
+        '--codec',
+        dest='codec',
+        choices=CODECS,
+        default=DEFAULT_CODEC,
+        help=f'Parquet codec, auto encodes a sample with each of lz4, zstd and brotli and picks one meeting --target_ratio or --target_mbps (default: {DEFAULT_CODEC})'
+    )
+    
+    parser.add_argument(
+        '--compression_level', '--compression-level',
+        dest='compression_level',
+        type=int,
+        default=None,
+        help='Compression level of the codec, e.g. 1-22 for zstd or 0-11 for brotli (default: 3 for zstd, the codec default otherwise)'
+    )
+    
+    parser.add_argument(
+        '--target_ratio', '--target-ratio',
+        dest='target_ratio',
+        type=float,
+        default=None,
+        help='With --codec auto, pick the fastest codec compressing the in-memory data at least this many times'
+    )
+    
+    parser.add_argument(
+        '--target_mbps', '--target-mbps',
+        dest='target_mbps',
+        type=float,
+        default=None,
+        help=f'With --codec auto, pick the smallest output among codecs encoding at least this many MB/s (default: {DEFAULT_TARGET_MBPS})'
+    )
+    
+    parser.add_argument(
+        '--schema',
+        dest='schema',
+        choices=SCHEMA_POLICIES,
+        default='compact',
+        help='Store columns at source precision with per-column encodings (compact) or with the types of Dataset.to_dataframe (pandas)'
+    )
+    
+    parser.add_argument(
+        '--partition_by', '--partition-by',
+        dest='partition_by',
+        choices=PARTITION_SCHEMES,
+        default=None,
+        help='Merge all files into one Hive-partitioned dataset in out_dir, partitioned by day of time or by feature_id bucket'
+    )
+    
+    parser.add_argument(
+        '--buckets',
+        dest='buckets',
+        type=int,
+        default=DEFAULT_FEATURE_BUCKETS,
+        help=f'Number of feature_id buckets (feature_id %% buckets) with --partition_by feature_bucket (default: {DEFAULT_FEATURE_BUCKETS})'
+    )
+    
+    parser.add_argument(
+        '--bloom_filter', '--bloom-filter',
+        dest='bloom_filter',
+        action='store_true',
+        help='Write bloom filters of feature_id in the partitioned dataset'
+    )
+    
     args = parser.parse_args()
     
     try:
-        nc2parquet(args.nc_file, args.out_dir)
+        nc2parquet(args.nc_file, args.out_dir, args.max_memory, args.chunk_size, args.engine, args.workers,
+                   args.partition_by, args.buckets, args.bloom_filter,
+                   Compression(args.codec, args.compression_level, args.target_ratio, args.target_mbps), args.schema)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
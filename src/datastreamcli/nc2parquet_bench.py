@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+nc2parquet_bench: Compare the rows/s and peak RSS of the nc2parquet engines.
+"""
+
+import argparse
+import tempfile
+import time
+import multiprocessing as mp
+import concurrent.futures as cf
+from pathlib import Path
+from datastreamcli.nc2parquet import convert_file, ENGINES, DEFAULT_MAX_MEMORY_MB
+from datastreamcli.usage import peak_rss
+
+def bench_task(nc_file: str, out_dir: str, engine: str, max_memory_mb: float, chunk_size: int) -> dict:
+    """
+    Convert a file once, entry point of the benchmark process.
+    Args:
+        nc_file: Path to input NetCDF file
+        out_dir: Directory of the Parquet output
+        engine: "arrow" or "pandas", see convert_file
+        max_memory_mb: Memory budget of the conversion in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+    Returns:
+        Rows, wall time, peak RSS of the process after imports and at the end
+    """
+    baseline_rss = peak_rss()
+    t0 = time.perf_counter()
+    result = convert_file(Path(nc_file), Path(out_dir) / f"{engine}.parquet", max_memory_mb, chunk_size, engine)
+    return {"rows": result["rows"], "seconds": time.perf_counter() - t0,
+            "baseline_rss": baseline_rss, "peak_rss": peak_rss()}
+
+def bench_engine(nc_file: str, out_dir: str, engine: str, max_memory_mb: float, chunk_size: int) -> dict:
+    """
+    Run bench_task in a fresh (spawned) process, so its peak RSS is that of this conversion alone.
+    """
+    with cf.ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(bench_task, nc_file, out_dir, engine, max_memory_mb, chunk_size).result()
+
+def nc2parquet_bench(nc_file: str, engines: list = ENGINES, repeat: int = 3,
+                     max_memory_mb: float = DEFAULT_MAX_MEMORY_MB, chunk_size: int = None) -> dict:
+    """
+    Convert a NetCDF file with each engine, repeat times each, and print the best rows/s and peak RSS.
+    Args:
+        nc_file: Path to input NetCDF file
+        engines: Engines to compare
+        repeat: Runs per engine, each in a fresh process
+        max_memory_mb: Memory budget of the conversion in MB
+        chunk_size: Rows per chunk (row group), derived from max_memory_mb if None
+    Returns:
+        Results of each engine: rows/s and peak RSS of its fastest run and the peak RSS after imports
+    """
+    summary = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for engine in engines:
+            runs = [bench_engine(nc_file, out_dir, engine, max_memory_mb, chunk_size) for x in range(repeat)]
+            best = min(runs, key=lambda x: x["seconds"])
+            summary[engine] = {"rows_per_s": best["rows"] / best["seconds"],
+                               "peak_rss": max([x["peak_rss"] for x in runs]),
+                               "baseline_rss": min([x["baseline_rss"] for x in runs])}
+
+    print(f"{nc_file}: best of {repeat} run(s), each in a fresh process")
+    print(f"  {'engine':<8} {'rows/s':>12} {'peak RSS':>10} {'after imports':>14}")
+    for engine, result in summary.items():
+        print(f"  {engine:<8} {result['rows_per_s']:>12,.0f} {result['peak_rss'] / 1024 / 1024:>7.0f} MB "
+              f"{result['baseline_rss'] / 1024 / 1024:>11.0f} MB")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the rows/s and peak RSS of the nc2parquet engines on a NetCDF file.'
+    )
+    parser.add_argument(
+        '--nc_file',
+        required=True,
+        help='Path to input NetCDF file'
+    )
+    parser.add_argument(
+        '--engines',
+        nargs='+',
+        choices=ENGINES,
+        default=ENGINES,
+        help='Engines to compare'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Runs per engine, each in a fresh process'
+    )
+    parser.add_argument(
+        '--max_memory', '--max-memory',
+        dest='max_memory',
+        type=float,
+        default=DEFAULT_MAX_MEMORY_MB,
+        help=f'Memory budget of the conversion in MB (default: {DEFAULT_MAX_MEMORY_MB})'
+    )
+    parser.add_argument(
+        '--chunk_size', '--chunk-size',
+        dest='chunk_size',
+        type=int,
+        default=None,
+        help='Rows per chunk (Parquet row group), overrides --max_memory'
+    )
+    args = parser.parse_args()
+    nc2parquet_bench(args.nc_file, args.engines, args.repeat, args.max_memory, args.chunk_size)
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,20 @@ import geopandas as gpd
 import pandas as pd
 import argparse
 import re, os
-import pickle, copy
+import copy, shutil, tempfile
 import numpy as np
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
 import datetime
+import concurrent.futures as cf
+import importlib.metadata
 from pyproj import Transformer
 import sqlite3
 from typing import Tuple, List, Dict
+from itertools import repeat
+from contextlib import nullcontext
+from fnmatch import fnmatch
 gpd.options.io_engine = "pyogrio"
 gpd.options.io_engine = "pyogrio"
 
@@ -16,6 +23,15 @@ import ruamel, io
 from ruamel.yaml import YAML
 from ruamel.yaml.scalarstring import DoubleQuotedScalarString
 
+from datastreamcli.hydrofabric import read_layer, read_attributes, attributes_layer, CACHE_DIR_NAME
+from datastreamcli.usage import report_usage
+from datastreamcli.config_archive import ConfigArchive, pack_files, pack_fragment
+from datastreamcli.noahowp_params import read_params, render_params, check_template, template_hash
+from datastreamcli.shared_table import SharedTable, read_shared_table, read_shared_arrow
+from datastreamcli.config_manifest import (load_manifest, write_manifest, update_manifest, plan_model,
+                                           existing_configs, remove_configs, row_hashes, context_hash,
+                                           CONFIG_FILENAMES)
+
 from ngen.config_gen.file_writer import DefaultFileWriter
 from ngen.config_gen.hook_providers import DefaultHookProvider
 from ngen.config_gen.generate import generate_configs
@@ -24,8 +40,12 @@ from ngen.config_gen.models.cfe import Cfe
 from ngen.config_gen.models.pet import Pet
 
 from ngen.config.realization import NgenRealization
+from datastreamcli.realization_cache import parse_realization
 from ngen.config.configurations import Routing
 
+# Left out of the config archive, as by the `tar --exclude` the datastream script used to build it
+CONFIG_ARCHIVE_EXCLUDES = ["*realization*", "*.gpkg", "*.parquet", "*.tmp", "*.part", CACHE_DIR_NAME]
+
 LSTM_TEMPLATE = data = {
     "time_step": "",
     "area_sqkm": 0,
@@ -46,64 +66,164 @@ LSTM_TEMPLATE = data = {
     ],
     "verbose": 0
 }
+LSTM_HF_COLUMNS = ["divide_id", "areasqkm"]
+LSTM_ATTR_COLUMNS = ["divide_id", "centroid_x", "centroid_y", "mean.slope", "mean.elevation"]
 
-def get_hf(hf_file : str) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, pd.DataFrame]:
+def get_hf(hf_file : str,
+           hf_columns : List[str]=None,
+           attr_columns : List[str]=None
+           ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     Parameters:
         hf_file : path to hydrofabric file (*.gpkg)
+        hf_columns : columns of the divides layer to read, all if None
+        attr_columns : columns of the attributes layer to read, all if None
 
     Returns:
-        hf : divide layer of hydrofabric
+        hf : divide layer of hydrofabric (without geometry)
         layers :  all layers within the hydrofabric file
         attrs : divide attributes (found under different layers)
             v2.1 -> model-attributes
             v2.2 -> divide-attributes
     """
 
-    hf: gpd.GeoDataFrame = gpd.read_file(hf_file, layer="divides")
+    hf: pd.DataFrame = read_attributes(hf_file, "divides", hf_columns)
     layers = gpd.list_layers(hf_file)
-    if "model-attributes" in list(layers.name):
-        attrs: pd.DataFrame = gpd.read_file(hf_file,layer="model-attributes")
-    elif "divide-attributes" in list(layers.name):
-        attrs: pd.DataFrame = gpd.read_file(hf_file,layer="divide-attributes")
-    else:
-        raise Exception(f"Can't find attributes!")
+    attrs: pd.DataFrame = read_attributes(hf_file, attributes_layer(hf_file), attr_columns)
 
     return hf, layers, attrs
 
+def gen_noah_owp_confs_shard(params : pa.Table,
+                             out_dir : str,
+                             start : datetime,
+                             end : datetime,
+                             arc_dir : str = None,
+                             materialize : bool = True,
+                             fragment_file : str = None
+                             ) -> int:
+    """
+    Render and write the NoahOWP configs of a slice of the parameter store
+
+    params (pa.Table) : slice of the parameter store
+    out_dir (str) : path to write files out to
+    start (datetime) : start date of simulation
+    end (datetime) : end date of simulation
+    arc_dir (str) : if given, pack the configs into an archive fragment under this directory
+    materialize (bool) : write the configs to out_dir
+    fragment_file (str) : path to write the archive fragment to, required with arc_dir
+
+    Returns:
+        number of configs
+    """
+    def members():
+        for confs in render_params(params, start, end):
+            for jcatch, jconf in confs:
+                filename = f"noah-owp-modular-init-{jcatch}.namelist.input"
+                if materialize:
+                    with open(Path(out_dir,filename),"w") as fp:
+                        fp.write(jconf)
+                yield filename, jconf
+
+    if arc_dir is None:
+        for _ in members():
+            pass
+    else:
+        pack_fragment(((arc_dir + filename, jconf.encode()) for filename, jconf in members()),
+                      fragment_file=fragment_file)
+    return params.num_rows
+
+def gen_noah_owp_confs_worker(params_table : str,
+                              start_row : int,
+                              stop_row : int,
+                              out_dir : str,
+                              start : datetime,
+                              end : datetime,
+                              arc_dir : str = None,
+                              materialize : bool = True,
+                              fragment_file : str = None
+                              ) -> int:
+    """
+    Process pool entry point for gen_noah_owp_confs_shard, reads its rows from a shared table
+
+    params_table (str) : path to shared table of the parameter store
+    start_row (int) : first catchment of the shard
+    stop_row (int) : catchment to stop at (exclusive)
+    out_dir (str) : path to write files out to
+    start (datetime) : start date of simulation
+    end (datetime) : end date of simulation
+    arc_dir (str) : if given, pack the configs into an archive fragment under this directory
+    materialize (bool) : write the configs to out_dir
+    fragment_file (str) : path to write the archive fragment to, required with arc_dir
+
+    Returns:
+        number of configs
+    """
+    params = read_shared_arrow(params_table, start_row, stop_row)
+    return gen_noah_owp_confs_shard(params, out_dir, start, end, arc_dir, materialize, fragment_file)
+
 def gen_noah_owp_confs_from_pkl(pkl_file : str,
                                 out_dir :str,
                                 start : datetime,
-                                end : datetime
+                                end : datetime,
+                                catchments : List[str] = None,
+                                archive : ConfigArchive = None,
+                                materialize : bool = True,
+                                nprocs : int = 1
                                 ) -> None:
     """
     Create NoahOWP BMI config files (*.namelist.input)
 
-    pkl_file (str) : path to pickle file generated by noahowp_pkl.multiprocess_gen_pkl(),
+    pkl_file (str) : path to parameter store generated by noahowp_pkl.multiprocess_gen_pkl(),
     out_dir (str) : path to write file out to,
     start (datetime) : start date of simulation
     end (datetime) : end date of simulation
+    catchments (list) : only write configs for these catchments, all if None
+    archive (ConfigArchive) : archive to stream the configs into
+    materialize (bool) : write the configs to out_dir
+    nprocs (int) : number of worker processes, os.cpu_count() if None
 
     """
 
-    if not os.path.exists(out_dir):
+    if materialize and not os.path.exists(out_dir):
         os.system(f"mkdir -p {out_dir}")
-
-    with open(pkl_file, 'rb') as fp:
-        nom_dict = pickle.load(fp)
-
-    for jcatch in nom_dict:
-        jcatch_str = copy.deepcopy(nom_dict[jcatch])
-        for j,jline in enumerate(jcatch_str):
-            if "startdate" in jline:
-                pattern = r'(startdate\s*=\s*")[0-9]{12}'
-                jcatch_str[j] = re.sub(pattern, f"startdate        = \"{start.strftime('%Y%m%d%H%M')}", jline)
-            if "enddate" in jline:
-                pattern = r'(enddate\s*=\s*")[0-9]{12}'
-                jcatch_str[j] =  re.sub(pattern, f"enddate          = \"{end.strftime('%Y%m%d%H%M')}", jline)
-
-        with open(Path(out_dir,f"noah-owp-modular-init-{jcatch}.namelist.input"),"w") as fp:
-            fp.writelines(jcatch_str)
+    arc_dir = None
+    if archive is not None:
+        arc_dir = "./cat_config/NOAH-OWP-M/"
+        archive.add_dir(arc_dir)
+
+    params = read_params(pkl_file, catchments)
+    check_template(params)
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+    ncatch = params.num_rows
+    nprocs = max(min(nprocs, ncatch // 1000), 1)
+    fragment_files = [None for x in range(nprocs)]
+    if archive is not None:
+        fragment_files = [archive.fragment_path(f"NOAH-OWP-M_{x}") for x in range(nprocs)]
+
+    if nprocs == 1:
+        gen_noah_owp_confs_shard(params, out_dir, start, end, arc_dir, materialize, fragment_files[0])
+        if archive is not None:
+            archive.add_fragment_file(fragment_files[0])
+        return
+
+    bounds = np.linspace(0, ncatch, nprocs + 1).astype(int)
+    with SharedTable(params) as params_table:
+        with cf.ProcessPoolExecutor(max_workers=nprocs) as pool:
+            for _, fragment_file in zip(pool.map(
+                gen_noah_owp_confs_worker,
+                [params_table.path for x in range(nprocs)],
+                bounds[:-1].tolist(),
+                bounds[1:].tolist(),
+                [out_dir for x in range(nprocs)],
+                [start for x in range(nprocs)],
+                [end for x in range(nprocs)],
+                [arc_dir for x in range(nprocs)],
+                [materialize for x in range(nprocs)],
+                fragment_files
+                ), fragment_files):
+                if archive is not None:
+                    archive.add_fragment_file(fragment_file)
 
 def generate_troute_conf(out_dir : str,
                          start : datetime,
@@ -112,7 +232,9 @@ def generate_troute_conf(out_dir : str,
                          restart_file: str="",
                          crosswalk_file: str="",
                          routing_only : bool=False,
-                         restart : bool=False) -> None:
+                         restart : bool=False,
+                         archive : ConfigArchive=None,
+                         materialize : bool=True) -> None:
     """
     Generate troute config file from template by matching the
     start_datetime, max_loop_size, nts, and geopackage path
@@ -123,6 +245,8 @@ def generate_troute_conf(out_dir : str,
     nts (int) :  max_loop_size * qts_subdivisions
     geo_file_path (str) : path to geopackage
     routing_only (bool) : routing only run or not
+    archive (ConfigArchive) : archive to stream the config into
+    materialize (bool) : write the config to out_dir
     """
 
     template = Path(__file__).parent.parent.parent/"configs/ngen/troute.yaml"
@@ -181,87 +305,214 @@ def generate_troute_conf(out_dir : str,
             if re.search(pattern, jline):
                 troute_conf_str[j] = re.sub(pattern,  f'\\1 {crosswalk_file}', jline)
 
-    with open(Path(out_dir,"troute.yaml"),'w') as fp:
-        fp.writelines(troute_conf_str)
+    if materialize:
+        with open(Path(out_dir,"troute.yaml"),'w') as fp:
+            fp.writelines(troute_conf_str)
+    if archive is not None:
+        archive.add_files([("./troute.yaml", "".join(troute_conf_str).encode())])
+
+def yaml_float(value : float) -> str:
+    """
+    Render a float exactly as ruamel.yaml's round-trip representer would
+
+    value (float) : value to render
+    """
+    value = float(value)
+    if value != value:
+        return ".nan"
+    if value == float("inf"):
+        return ".inf"
+    if value == -float("inf"):
+        return "-.inf"
+    return repr(value).lower()
+
+def lstm_base_config(real : NgenRealization, lstm_ensembles : List[int]) -> dict:
+    """
+    LSTM BMI config with the fields shared by all divides filled in
+
+    real (NgenRealization): NextGen realization,
+    lstm_ensembles (list): list of indices to pick lstm training files (ensembles)
+    """
+    lstm_config = copy.copy(LSTM_TEMPLATE)
+    ens_picked = []
+    for j in lstm_ensembles:
+        jens = LSTM_TEMPLATE['train_cfg_file'][int(j)]
+        ens_picked.append(jens)
+    lstm_config['train_cfg_file'] = ens_picked
+    interval = real.time.output_interval // 3600
+    lstm_config['time_step'] = DoubleQuotedScalarString(f"{interval} hour")
+    return lstm_config
+
+def lstm_template(lstm_config : dict) -> str:
+    """
+    Render the LSTM BMI config once through ruamel.yaml with sentinels in place of the
+    per-divide fields, returning a str.format template producing the same bytes as dumping
+    each divide's config individually.
+
+    lstm_config (dict) : LSTM config with the shared (non per-divide) fields filled in
+    """
+    sentinels = {
+        "area_sqkm"  : "LSTMSENTINELAREASQKM",
+        "basin_id"   : "LSTMSENTINELBASINID",
+        "basin_name" : "LSTMSENTINELBASINNAME",
+        "elev_mean"  : "LSTMSENTINELELEVMEAN",
+        "lat"        : "LSTMSENTINELLAT",
+        "lon"        : "LSTMSENTINELLON",
+        "slope_mean" : "LSTMSENTINELSLOPEMEAN",
+    }
+    lstm_config_tmpl = copy.copy(lstm_config)
+    for key, sentinel in sentinels.items():
+        lstm_config_tmpl[key] = sentinel
+    # elev_mean has always been written out as a single element sequence
+    lstm_config_tmpl['elev_mean'] = (sentinels['elev_mean'],)
+    yaml = ruamel.yaml.YAML()
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    stream = io.StringIO()
+    yaml.dump(lstm_config_tmpl, stream)
+    template = stream.getvalue().replace("{","{{").replace("}","}}")
+    for key, sentinel in sentinels.items():
+        template = template.replace(sentinel, "{" + key + "}")
+    return template
+
+def write_files(files : List[Tuple[Path, str]],
+                archive : ConfigArchive = None,
+                arc_dir : str = None,
+                materialize : bool = True
+                ) -> int:
+    """
+    Write a batch of (path, contents) pairs to disk and/or a config archive
+
+    files (list) : list of (path, contents) tuples
+    archive (ConfigArchive) : archive to stream the files into
+    arc_dir (str) : directory of the files within the archive, e.g. ./cat_config/LSTM/
+    materialize (bool) : write the files to disk
+    """
+    if materialize:
+        for filename, contents in files:
+            with open(filename,'w') as fp:
+                fp.write(contents)
+    if archive is not None:
+        archive.add_files([(arc_dir + Path(filename).name, contents.encode()) for filename, contents in files])
+    return len(files)
 
 def gen_lstm(
         hf : gpd.GeoDataFrame,
         attrs : gpd.GeoDataFrame,
         out : str,
         real : NgenRealization,
-        lstm_ensembles : List[int]
+        lstm_ensembles : List[int],
+        nprocs : int = 1,
+        archive : ConfigArchive = None,
+        materialize : bool = True
         ):
     """
     Generate LSTM BMI configs from hydrofabric and NextGen realizaiton files
 
+    The per-divide fields are computed for all divides in one vectorized pass, rendered
+    from a single precompiled template and written out by a pool of threads.
+
     hf (gpd.GeoDataFrame) : divides layer of hydrofabric,
     attrs (gpd.GeoDataFrame) : attributes of the divides,
     out (str): path to write configs out to,
     real (NgenRealization): NextGen realization,
     lstm_ensembles (list): list of indices to pick lstm training files (ensembles)
+    nprocs (int): number of writer threads, os.cpu_count() if None
+    archive (ConfigArchive): archive to stream the configs into
+    materialize (bool): write the configs to out/cat_config/LSTM
 
     """
     lstm_config_dir = Path(out,'cat_config/LSTM')
-    if not Path.exists(lstm_config_dir):
+    if materialize and not Path.exists(lstm_config_dir):
         os.system(f"mkdir -p {lstm_config_dir}")
+    arc_dir = "./cat_config/LSTM/"
+    if archive is not None:
+        archive.add_dir(arc_dir)
 
-    lstm_config = copy.copy(LSTM_TEMPLATE)
-    ens_picked = []
-    for j in lstm_ensembles:
-        jens = LSTM_TEMPLATE['train_cfg_file'][int(j)]
-        ens_picked.append(jens)
-    lstm_config['train_cfg_file'] = ens_picked
-    interval = real.time.output_interval // 3600
-    lstm_config['time_step'] = DoubleQuotedScalarString(f"{interval} hour")
-    cats = attrs['divide_id']
+    lstm_config = lstm_base_config(real, lstm_ensembles)
+    template = lstm_template(lstm_config)
+
+    hf_sorted    = hf.sort_values(by="divide_id")
+    attrs_sorted = attrs.sort_values(by="divide_id")
+    cats = attrs_sorted['divide_id'].tolist()
     ncats = len(cats)
-    from pyproj import Transformer
-    import yaml
-    count = 0
     source_crs = 'EPSG:5070'
     target_crs = 'EPSG:4326'
     transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-    for x, y in zip(hf.sort_values(by="divide_id").iterrows(),attrs.sort_values(by="divide_id").iterrows()) :
-        count += 1
-        j, hf_row = x
-        k, attrs_row =y
-        lstm_config_jcat = copy.copy(lstm_config)
-        jcat = attrs_row['divide_id']
-        x_coord = attrs_row['centroid_x']
-        y_coord = attrs_row['centroid_y']
-        lon, lat = transformer.transform(x_coord,y_coord)
-        # variable transformations taken from
-        # https://github.com/CIROH-UA/NGIAB_data_preprocess/blob/36b8f0a8dd77462aae3d33c9e93385103637cf98/modules/data_processing/create_realization.py#L149C5-L172C14
-        # convert the mean.slope from degrees 0-90 where 90 is flat and 0 is vertical to m/km
-        # flip 0 and 90 degree values
-        attrs_row["flipped_mean_slope"] = abs(attrs_row["mean.slope"] - 90)
-        # Convert degrees to meters per kmmeter
-        attrs_row["mean_slope_mpkm"] = (
-            np.tan(np.radians(attrs_row["flipped_mean_slope"])) * 1000
-        )
-        lstm_config_jcat['area_sqkm'] = hf_row['areasqkm']
-        lstm_config_jcat['basin_id'] = jcat
-        lstm_config_jcat['basin_name'] = jcat
-        lstm_config_jcat['elev_mean'] = attrs_row['mean.elevation'] / 100,  # convert cm in hf to m
-        lstm_config_jcat['lat'] = lat
-        lstm_config_jcat['lon'] = lon
-        lstm_config_jcat['slope_mean'] = attrs_row['mean_slope_mpkm']
-        filename = Path(lstm_config_dir, jcat + ".yml")
-        yaml = ruamel.yaml.YAML()
-        yaml.indent(mapping=2, sequence=4, offset=2)
-        stream = io.StringIO()
-        yaml.dump(lstm_config_jcat, stream)
-        yaml_string = stream.getvalue()
-        with open(filename,'w') as fp:
-            fp.write(yaml_string)
-        perc_comp = 100 * (count/ncats)
-        print(f"{perc_comp:.1f}% complete",end='\r')
+    lon, lat = transformer.transform(attrs_sorted['centroid_x'].values, attrs_sorted['centroid_y'].values)
+    # variable transformations taken from
+    # https://github.com/CIROH-UA/NGIAB_data_preprocess/blob/36b8f0a8dd77462aae3d33c9e93385103637cf98/modules/data_processing/create_realization.py#L149C5-L172C14
+    # convert the mean.slope from degrees 0-90 where 90 is flat and 0 is vertical to m/km
+    # flip 0 and 90 degree values
+    flipped_mean_slope = np.abs(attrs_sorted["mean.slope"].values - 90)
+    # Convert degrees to meters per kmmeter
+    mean_slope_mpkm = np.tan(np.radians(flipped_mean_slope)) * 1000
+    elev_mean = attrs_sorted['mean.elevation'].values / 100 # convert cm in hf to m
+    area_sqkm = hf_sorted['areasqkm'].values
+
+    plain_id = re.compile(r'^[A-Za-z]+-\d+$')
+    files = []
+    for jcat, jarea, jelev, jlat, jlon, jslope in zip(cats, area_sqkm.tolist(), elev_mean.tolist(), np.asarray(lat).tolist(), np.asarray(lon).tolist(), mean_slope_mpkm.tolist()):
+        if plain_id.match(jcat):
+            lstm_config_jcat = template.format(
+                area_sqkm  = yaml_float(jarea),
+                basin_id   = jcat,
+                basin_name = jcat,
+                elev_mean  = yaml_float(jelev),
+                lat        = yaml_float(jlat),
+                lon        = yaml_float(jlon),
+                slope_mean = yaml_float(jslope)
+            )
+        else:
+            # let ruamel decide on quoting for unusual divide ids
+            lstm_config_dict = copy.copy(lstm_config)
+            lstm_config_dict.update({"area_sqkm":jarea,"basin_id":jcat,"basin_name":jcat,"elev_mean":(jelev,),"lat":jlat,"lon":jlon,"slope_mean":jslope})
+            yaml = ruamel.yaml.YAML()
+            yaml.indent(mapping=2, sequence=4, offset=2)
+            stream = io.StringIO()
+            yaml.dump(lstm_config_dict, stream)
+            lstm_config_jcat = stream.getvalue()
+        files.append((Path(lstm_config_dir, jcat + ".yml"), lstm_config_jcat))
+
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+    nper = max(ncats // (4 * nprocs), 1)
+    count = 0
+    with cf.ThreadPoolExecutor(max_workers=nprocs) as pool:
+        for nwritten in pool.map(
+            write_files,
+            [files[i:i + nper] for i in range(0, ncats, nper)],
+            repeat(archive),
+            repeat(arc_dir),
+            repeat(materialize)
+            ):
+            count += nwritten
+            perc_comp = 100 * (count/ncats)
+            print(f"{perc_comp:.1f}% complete",end='\r')
 
     return
 
+def get_petAORcfe_inputs(hf_file : str) -> Tuple[gpd.GeoDataFrame, pd.DataFrame]:
+    """
+    Read the divides and (unit corrected) attributes handed to ngen-cal's hook provider
+
+    hf_file (str) : path to geopackage file
+    """
+    # ngen-cal's hydrofabric hook receives whole divide rows, so geometry is kept here
+    hf: gpd.GeoDataFrame = read_layer(hf_file, "divides")
+    attrs_layer = attributes_layer(hf_file)
+    hf_lnk_data: pd.DataFrame = read_attributes(hf_file, attrs_layer)
+    if attrs_layer == "divide-attributes":
+        hf_lnk_data = fix_v2_2_units(hf_lnk_data, hf_file)
+    return hf, hf_lnk_data
+
 def gen_petAORcfe(hf_file : str,
                   out : str,
-                  include : List[str]
+                  include : List[str],
+                  nprocs : int = 1,
+                  divide_ids : List[str] = None,
+                  archive : ConfigArchive = None,
+                  materialize : bool = True,
+                  inputs : Tuple[gpd.GeoDataFrame, pd.DataFrame] = None
                   ) -> None:
     """
     Union function to generate either/both CFE and PET BMI configs via ngen-cal tooling.
@@ -269,32 +520,195 @@ def gen_petAORcfe(hf_file : str,
     hf_file (str) : path to geopackage file
     out (str) : path to write files out to
     include (List(str)) : list of strings on which models to include BMI config file generation for.
+    nprocs (int) : number of worker processes to shard divides across, os.cpu_count() if None
+    divide_ids (List(str)) : only generate configs for these divides, all if None
+    archive (ConfigArchive) : archive to stream the configs into
+    materialize (bool) : write the configs to out/cat_config
+    inputs (Tuple) : divides and attributes from get_petAORcfe_inputs, read from hf_file if None
 
     """
+    if inputs is None:
+        inputs = get_petAORcfe_inputs(hf_file)
     models = []
     if 'PET' in include:
         models.append(Pet)
     if 'CFE' in include:
         models.append(Cfe)
     for j, jmodel in enumerate(include):
-        hf: gpd.GeoDataFrame = gpd.read_file(hf_file, layer="divides")
-        layers = gpd.list_layers(hf_file)
-        if "model-attributes" in list(layers.name):
-            hf_lnk_data: pd.DataFrame = gpd.read_file(hf_file,layer="model-attributes")
-        elif "divide-attributes" in list(layers.name):
-            hf_lnk_data: pd.DataFrame = gpd.read_file(hf_file,layer="divide-attributes")
-            hf_lnk_data = fix_v2_2_units(hf_lnk_data, hf_file)
-        else:
-            raise Exception(f"Can't find attributes!")
-        hook_provider = DefaultHookProvider(hf=hf, hf_lnk_data=hf_lnk_data)
+        hf, hf_lnk_data = inputs
+        if divide_ids is not None:
+            hf = hf.loc[hf["divide_id"].isin(divide_ids)]
+            hf_lnk_data = hf_lnk_data.loc[hf_lnk_data["divide_id"].isin(divide_ids)]
+            if len(hf) == 0:
+                continue
         jmodel_out = Path(out,'cat_config',jmodel)
-        os.system(f"mkdir -p {jmodel_out}")
-        file_writer = DefaultFileWriter(jmodel_out)
-        generate_configs(
-            hook_providers=hook_provider,
-            hook_objects=[models[j]],
-            file_writer=file_writer,
-        )
+        if materialize:
+            os.system(f"mkdir -p {jmodel_out}")
+        generate_configs_multiprocessing(hf, hf_lnk_data, [models[j]], jmodel_out, nprocs,
+                                         archive, f"./cat_config/{jmodel}/", materialize)
+
+def petAORcfe_hashes(hf : gpd.GeoDataFrame, hf_lnk_data : pd.DataFrame) -> pd.Series:
+    """
+    Hash of the divide row (geometry included) and attribute row ngen-cal sees for each divide
+
+    hf (gpd.GeoDataFrame) : divides layer of hydrofabric
+    hf_lnk_data (pd.DataFrame) : attributes of the divides
+    """
+    hf_df = pd.DataFrame(hf.drop(columns=hf.geometry.name))
+    hf_df["geometry_wkb"] = hf.geometry.to_wkb()
+    return row_hashes(hf_df.merge(hf_lnk_data, on="divide_id", how="left", suffixes=("", "_attr")))
+
+def ngen_config_gen_version() -> str:
+    """
+    Installed version of ngen-cal's config generation package, part of the CFE/PET template version
+    """
+    try:
+        return importlib.metadata.version("ngen_config_gen")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+def generate_configs_shard(hf : gpd.GeoDataFrame,
+                           hf_lnk_data : pd.DataFrame,
+                           hook_objects : list,
+                           out_dir : str,
+                           arc_dir : str = None,
+                           materialize : bool = True,
+                           fragment_file : str = None
+                           ) -> int:
+    """
+    Generate BMI configs for a slice of the divides with its own hook provider and file writer
+
+    hf (gpd.GeoDataFrame) : slice of the divides layer
+    hf_lnk_data (pd.DataFrame) : attributes of the divides in the slice
+    hook_objects (list) : ngen-cal models to build (Cfe, Pet)
+    out_dir (str) : path to write files out to
+    arc_dir (str) : if given, pack the shard's configs into an archive fragment under this directory
+    materialize (bool) : write the configs to out_dir
+    fragment_file (str) : path to write the archive fragment to, required with arc_dir
+
+    Returns:
+        number of divides
+    """
+    write_dir = out_dir
+    if arc_dir is not None:
+        # ngen-cal's writer only writes files, so the shard is written to its own directory,
+        # packed while still in the page cache and then moved into place (or dropped)
+        write_dir = tempfile.mkdtemp(prefix=".shard_", dir=out_dir if materialize else None)
+    hook_provider = DefaultHookProvider(hf=hf, hf_lnk_data=hf_lnk_data)
+    file_writer = DefaultFileWriter(write_dir)
+    generate_configs(
+        hook_providers=hook_provider,
+        hook_objects=hook_objects,
+        file_writer=file_writer,
+    )
+    if arc_dir is None:
+        return len(hf)
+
+    files = sorted(os.listdir(write_dir))
+    pack_files([(arc_dir + x, os.path.join(write_dir, x)) for x in files], fragment_file=fragment_file)
+    if materialize:
+        for jfile in files:
+            os.replace(os.path.join(write_dir, jfile), os.path.join(out_dir, jfile))
+    shutil.rmtree(write_dir)
+    return len(hf)
+
+def generate_configs_worker(hf_table : str,
+                            hf_lnk_table : str,
+                            start : int,
+                            stop : int,
+                            hook_objects : list,
+                            out_dir : str,
+                            arc_dir : str = None,
+                            materialize : bool = True,
+                            fragment_file : str = None
+                            ) -> int:
+    """
+    Process pool entry point for generate_configs_shard, the shard is read from shared tables
+    and its configs (and archive fragment) are written to disk, so nothing that scales with
+    the number of divides is pickled in either direction
+
+    hf_table (str) : path to shared table of the divides layer
+    hf_lnk_table (str) : path to shared table of the divide attributes
+    start (int) : first divide of the shard
+    stop (int) : divide to stop at (exclusive)
+    hook_objects (list) : ngen-cal models to build (Cfe, Pet)
+    out_dir (str) : path to write files out to
+    arc_dir (str) : if given, pack the shard's configs into an archive fragment under this directory
+    materialize (bool) : write the configs to out_dir
+    fragment_file (str) : path to write the archive fragment to, required with arc_dir
+
+    Returns:
+        number of divides
+    """
+    hf = read_shared_table(hf_table, start, stop)
+    hf_lnk_data = read_shared_arrow(hf_lnk_table)
+    in_shard = pc.is_in(hf_lnk_data["divide_id"], value_set=pa.array(hf["divide_id"].tolist(), type=pa.string()))
+    hf_lnk_data = hf_lnk_data.filter(in_shard).to_pandas()
+    return generate_configs_shard(hf, hf_lnk_data, hook_objects, out_dir, arc_dir, materialize, fragment_file)
+
+def generate_configs_multiprocessing(hf : gpd.GeoDataFrame,
+                                     hf_lnk_data : pd.DataFrame,
+                                     hook_objects : list,
+                                     out_dir : str,
+                                     nprocs : int = None,
+                                     archive : ConfigArchive = None,
+                                     arc_dir : str = None,
+                                     materialize : bool = True
+                                     ) -> None:
+    """
+    Divide-sharded version of ngen-cal's generate_configs. The divides are split into
+    nprocs contiguous shards, each worker builds a DefaultHookProvider over its slice of
+    the divides and attribute table and writes through its own DefaultFileWriter.
+    Workers read their slice from shared tables (see shared_table.SharedTable).
+
+    hf (gpd.GeoDataFrame) : divides layer of hydrofabric
+    hf_lnk_data (pd.DataFrame) : attributes of the divides
+    hook_objects (list) : ngen-cal models to build (Cfe, Pet)
+    out_dir (str) : path to write files out to
+    nprocs (int) : number of worker processes, defaults to os.cpu_count()
+    archive (ConfigArchive) : archive to stream the configs into, each worker compresses its own shard
+    arc_dir (str) : directory of the configs within the archive, e.g. ./cat_config/CFE/
+    materialize (bool) : write the configs to out_dir
+    """
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+    ndivides = len(hf)
+    nprocs = max(min(nprocs, ndivides), 1)
+    fragment_files = [None for x in range(nprocs)]
+    if archive is None:
+        arc_dir = None
+    else:
+        archive.add_dir(arc_dir)
+        fragment_files = [archive.fragment_path(f"{Path(arc_dir).name}_{x}") for x in range(nprocs)]
+
+    if nprocs == 1:
+        generate_configs_shard(hf, hf_lnk_data, hook_objects, out_dir, arc_dir, materialize, fragment_files[0])
+        if archive is not None:
+            archive.add_fragment_file(fragment_files[0])
+        return
+
+    bounds = np.linspace(0, ndivides, nprocs + 1).astype(int)
+    count = 0
+    with SharedTable(hf) as hf_table, SharedTable(hf_lnk_data) as hf_lnk_table:
+        with cf.ProcessPoolExecutor(max_workers=nprocs) as pool:
+            for ndone, fragment_file in zip(pool.map(
+                generate_configs_worker,
+                [hf_table.path for x in range(nprocs)],
+                [hf_lnk_table.path for x in range(nprocs)],
+                bounds[:-1].tolist(),
+                bounds[1:].tolist(),
+                [hook_objects for x in range(nprocs)],
+                [out_dir for x in range(nprocs)],
+                [arc_dir for x in range(nprocs)],
+                [materialize for x in range(nprocs)],
+                fragment_files
+                ), fragment_files):
+                if archive is not None:
+                    archive.add_fragment_file(fragment_file)
+                count += ndone
+                perc_comp = 100 * (count/ndivides)
+                print(f"{perc_comp:.1f}% complete",end='\r')
+
 
 def get_table_crs_short(gpkg : str, table: str) -> str:
     """
@@ -352,31 +766,6 @@ def fix_v2_2_units(df:pd.DataFrame,
     return df
 
 
-# Austin's multiprocess example from chat 3/25
-# import concurrent.futures as cf
-# from functools import partial
-# def generate_configs_multiprocessing(
-#     hook_providers: Iterable["HookProvider"],
-#     hook_objects: Collection[BuilderVisitableFn],
-#     file_writer: FileWriter,
-#     pool: cf.ProcessPoolExecutor,
-# ):
-#     def capture(divide)_id: str, bv: BuilderVisitableFn):
-#         bld_vbl = bv()
-#         bld_vbl.visit(hook_prov)
-#         model = bld_vbl.build()
-#         file_writer(divide_id, model)
-
-#     div_hook_obj = DivideIdHookObject()
-#     for hook_prov in hook_providers:
-#         # retrieve current divide id
-#         div_hook_obj.visit(hook_prov)
-#         divide_id = div_hook_obj.divide_id()
-#         assert divide_id is not None
-
-#         fn = partial(capture, divide_id=divide_id)
-#         pool.map(fn, hook_objects)
-
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -412,7 +801,7 @@ if __name__ == "__main__":
         "--pkl_file",
         dest="pkl_file",
         type=str,
-        help="Path to the noahowp pkl",
+        help="Path to the noahowp parameter store",
         required=False
     )
     parser.add_argument(
@@ -422,6 +811,39 @@ if __name__ == "__main__":
         help="Path to the ngen realization",
         required=False
     )
+    parser.add_argument(
+        "--realization_cache",
+        dest="realization_cache",
+        type=str,
+        help="Directory of parsed realizations shared with other stages, e.g. datastream-metadata/realization_cache",
+        default=None,
+        required=False
+    )
+
+    parser.add_argument(
+        "--nprocs",
+        dest="nprocs",
+        type=int,
+        help="Number of processes to use for NoahOWP, CFE, PET and LSTM config generation",
+        required=False,
+        default=1
+    )
+
+    parser.add_argument(
+        "--config_archive",
+        dest="config_archive",
+        type=str,
+        help="Path to a .tar.gz to stream the generated configs into",
+        required=False
+    )
+
+    parser.add_argument(
+        "--archive_only",
+        dest="archive_only",
+        action="store_true",
+        help="Only write configs to --config_archive, do not write them to --outdir",
+        required=False
+    )
 
     parser.add_argument(
         "--lstm_ensembles",
@@ -435,7 +857,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     global start,end
-    serialized_realization = NgenRealization.parse_file(args.realization)
+    serialized_realization = parse_realization(args.realization, cache_dir=args.realization_cache)
     start = serialized_realization.time.start_time
     end   = serialized_realization.time.end_time
     max_loop_size = (end - start + datetime.timedelta(hours=1)).total_seconds() / (serialized_realization.time.output_interval)
@@ -454,76 +876,169 @@ if __name__ == "__main__":
                 "SLOTH":"",
                 "bmi_rust":"LSTM"}
 
-    ignore = []
-    for jmodel in model_names:
-        config_path = Path(args.outdir,"cat_config",dir_dict[jmodel])
-        if config_path.exists(): ignore.append(jmodel)
-    routing_path = Path(args.outdir,"troute.yaml")
-    if routing_path.exists(): ignore.append("routing")
-
-    hf, layers, attrs = get_hf(args.hf_file)
-
-    if "NoahOWP" in model_names:
-        if "NoahOWP" in ignore:
-            print(f'ignoring NoahOWP')
-        else:
-            if "pkl_file" in args:
-                print(f'Generating NoahOWP configs from pickle',flush = True)
-                global noah_dir,pkl_file
-                pkl_file = args.pkl_file
-                noah_dir = Path(args.outdir,'cat_config','NOAH-OWP-M')
-                os.system(f'mkdir -p {noah_dir}')
-                gen_noah_owp_confs_from_pkl(args.pkl_file, noah_dir, start, end)
+    if args.archive_only and args.config_archive is None:
+        raise Exception(f"--archive_only requires --config_archive")
+    materialize = not args.archive_only
+    # the archive is moved into place once every config is in it, and removed if generation fails
+    with ConfigArchive(args.config_archive) if args.config_archive is not None else nullcontext() as archive:
+        # (directory, file name pattern) of the configs generated here, every other file of outdir
+        # (e.g. user provided configs) is archived as it is on disk
+        generated = []
+
+        # Configs that exist without manifest entries were provided by the user and are left alone,
+        # everything else is regenerated only for divides whose inputs changed
+        cat_config_dir = Path(args.outdir,"cat_config")
+        manifest = load_manifest(cat_config_dir)
+        ignore = []
+        for jmodel in model_names:
+            config_path = Path(args.outdir,"cat_config",dir_dict[jmodel])
+            if config_path.exists() and not (manifest["model"] == jmodel).any(): ignore.append(jmodel)
+        routing_path = Path(args.outdir,"troute.yaml")
+        if routing_path.exists() and not (manifest["model"] == "routing").any(): ignore.append("routing")
+
+        def plan(model, model_dir, hashes, context):
+            generated.append((Path(model_dir), CONFIG_FILENAMES[model].format("*")))
+            if not materialize:
+                return hashes.index.tolist()
+            stale, removed = plan_model(manifest, model, hashes, context, existing_configs(model_dir, model))
+            remove_configs(model_dir, model, removed)
+            print(f'{model}: {len(stale)} of {len(hashes)} divides need configs, {len(removed)} removed',flush = True)
+            if archive is not None:
+                # configs that are still current belong in the archive too
+                unchanged = [CONFIG_FILENAMES[model].format(x) for x in hashes.index.difference(stale)]
+                archive_from_disk(model_dir, unchanged)
+            return stale
+
+        def record(model, hashes, context):
+            global manifest
+            if not materialize:
+                return
+            manifest = update_manifest(manifest, model, hashes, context)
+            write_manifest(cat_config_dir, manifest)
+
+        def archive_from_disk(model_dir, filenames):
+            if archive is None or len(filenames) == 0:
+                return
+            arc_dir = "./" + Path(model_dir).relative_to(args.outdir).as_posix() + "/"
+            archive.add_dir(arc_dir)
+            archive.add_paths([(arc_dir + x, os.path.join(model_dir, x)) for x in filenames])
+
+        if "NoahOWP" in model_names:
+            if "NoahOWP" in ignore:
+                print(f'ignoring NoahOWP')
             else:
-                raise Exception(f"Generating NoahOWP configs manually not implemented, create pkl.")
-
-    if "CFE" in model_names:
-        if "CFE" in ignore:
-            print(f'ignoring CFE')
-        else:
-            print(f'Generating CFE configs from pydantic models',flush = True)
-            gen_petAORcfe(args.hf_file,args.outdir,["CFE"])
-
-    if "PET" in model_names:
-        if "PET" in ignore:
-            print(f'ignoring PET')
-        else:
-            print(f'Generating PET configs from pydantic models',flush = True)
-            gen_petAORcfe(args.hf_file,args.outdir,["PET"])
-
-    if "bmi_rust" in model_names:
-        if "bmi_rust" in ignore:
-            print(f'ignoring LSTM')
-        else:
-            lstm_ensembles = [0]
-            print(f'Generating LSTM configs from pydantic models',flush = True)
-            gen_lstm(hf,attrs,args.outdir,serialized_realization,args.lstm_ensembles)
-
-    globals = [x[0] for x in serialized_realization]
-    if serialized_realization.routing is not None:
-        if "routing" in ignore:
-            print(f'ignoring routing')
-        else:
-            print(f'Generating t-route config from template',flush = True)
-            ROUTING_ONLY = False
-            RESTART = False
-
-            if not any(model in model_names for model in ["NoahOWP", "CFE", "PET", "bmi_rust"]):
-                ROUTING_ONLY = True
-
-            troute_restart_file = args.troute_restart_file
-            troute_crosswalk_file = args.troute_crosswalk_file
-            if troute_restart_file is not None and troute_crosswalk_file is not None:
-                RESTART = True
-
-            generate_troute_conf(
-                args.outdir,
-                start,
-                max_loop_size,
-                geo_file_path,
-                troute_restart_file,
-                troute_crosswalk_file,
-                ROUTING_ONLY,
-                RESTART)
+                if "pkl_file" in args:
+                    print(f'Generating NoahOWP configs from parameter store',flush = True)
+                    global noah_dir,pkl_file
+                    pkl_file = args.pkl_file
+                    noah_dir = Path(args.outdir,'cat_config','NOAH-OWP-M')
+                    if materialize:
+                        os.system(f'mkdir -p {noah_dir}')
+                    with report_usage("NoahOWP", children=True):
+                        hashes = row_hashes(read_params(args.pkl_file).to_pandas())
+                        context = context_hash("NoahOWP", start, end, template_hash())
+                        stale = plan("NoahOWP", noah_dir, hashes, context)
+                        if len(stale) > 0:
+                            gen_noah_owp_confs_from_pkl(args.pkl_file, noah_dir, start, end, stale, archive, materialize, args.nprocs)
+                        record("NoahOWP", hashes, context)
+                else:
+                    raise Exception(f"Generating NoahOWP configs manually not implemented, create the parameter store with noahowp_pkl.py.")
+
+        if "CFE" in model_names:
+            if "CFE" in ignore:
+                print(f'ignoring CFE')
+            else:
+                print(f'Generating CFE configs from pydantic models',flush = True)
+                with report_usage("CFE", children=True):
+                    hf, hf_lnk_data = get_petAORcfe_inputs(args.hf_file)
+                    hashes = petAORcfe_hashes(hf, hf_lnk_data)
+                    context = context_hash("CFE", ngen_config_gen_version())
+                    stale = plan("CFE", Path(cat_config_dir,"CFE"), hashes, context)
+                    if len(stale) > 0:
+                        gen_petAORcfe(args.hf_file,args.outdir,["CFE"],args.nprocs,stale,archive,materialize,
+                                      (hf, hf_lnk_data))
+                    record("CFE", hashes, context)
+
+        if "PET" in model_names:
+            if "PET" in ignore:
+                print(f'ignoring PET')
+            else:
+                print(f'Generating PET configs from pydantic models',flush = True)
+                with report_usage("PET", children=True):
+                    hf, hf_lnk_data = get_petAORcfe_inputs(args.hf_file)
+                    hashes = petAORcfe_hashes(hf, hf_lnk_data)
+                    context = context_hash("PET", ngen_config_gen_version())
+                    stale = plan("PET", Path(cat_config_dir,"PET"), hashes, context)
+                    if len(stale) > 0:
+                        gen_petAORcfe(args.hf_file,args.outdir,["PET"],args.nprocs,stale,archive,materialize,
+                                      (hf, hf_lnk_data))
+                    record("PET", hashes, context)
+
+        if "bmi_rust" in model_names:
+            if "bmi_rust" in ignore:
+                print(f'ignoring LSTM')
+            else:
+                lstm_ensembles = [0]
+                print(f'Generating LSTM configs from pydantic models',flush = True)
+                with report_usage("LSTM"):
+                    hf, layers, attrs = get_hf(args.hf_file, LSTM_HF_COLUMNS, LSTM_ATTR_COLUMNS)
+                    hashes = row_hashes(hf.merge(attrs, on="divide_id", how="left"))
+                    context = context_hash("bmi_rust", lstm_template(lstm_base_config(serialized_realization, args.lstm_ensembles)))
+                    stale = plan("bmi_rust", Path(cat_config_dir,"LSTM"), hashes, context)
+                    if len(stale) > 0:
+                        gen_lstm(hf.loc[hf["divide_id"].isin(stale)],
+                                 attrs.loc[attrs["divide_id"].isin(stale)],
+                                 args.outdir,serialized_realization,args.lstm_ensembles,args.nprocs,
+                                 archive,materialize)
+                    record("bmi_rust", hashes, context)
+
+        globals = [x[0] for x in serialized_realization]
+        if serialized_realization.routing is not None:
+            if "routing" in ignore:
+                print(f'ignoring routing')
+            else:
+                print(f'Generating t-route config from template',flush = True)
+                ROUTING_ONLY = False
+                RESTART = False
+
+                if not any(model in model_names for model in ["NoahOWP", "CFE", "PET", "bmi_rust"]):
+                    ROUTING_ONLY = True
+
+                troute_restart_file = args.troute_restart_file
+                troute_crosswalk_file = args.troute_crosswalk_file
+                if troute_restart_file is not None and troute_crosswalk_file is not None:
+                    RESTART = True
+
+                template = Path(__file__).parent.parent.parent/"configs/ngen/troute.yaml"
+                hashes = pd.Series([0], index=["troute.yaml"], dtype="uint64")
+                context = context_hash("routing", template.read_text(), start, max_loop_size, geo_file_path,
+                                       troute_restart_file, troute_crosswalk_file, ROUTING_ONLY, RESTART, os.cpu_count())
+                generated.append((Path(args.outdir), "troute.yaml"))
+                existing = ["troute.yaml"] if routing_path.exists() and materialize else []
+                stale, _ = plan_model(manifest, "routing", hashes, context, existing)
+                if len(stale) > 0:
+                    generate_troute_conf(
+                        args.outdir,
+                        start,
+                        max_loop_size,
+                        geo_file_path,
+                        troute_restart_file,
+                        troute_crosswalk_file,
+                        ROUTING_ONLY,
+                        RESTART,
+                        archive,
+                        materialize)
+                else:
+                    print(f't-route config is up to date',flush = True)
+                    archive_from_disk(args.outdir, ["troute.yaml"])
+                record("routing", hashes, context)
+
+        if archive is not None:
+            # everything else in outdir (e.g. the NoahOWP parameter store, user provided configs),
+            # excluded as in the datastream tarball
+            archive.add_tree(args.outdir, CONFIG_ARCHIVE_EXCLUDES,
+                             lambda jdir, jfile: any(Path(jdir) == x and fnmatch(jfile, y) for x, y in generated))
+    if args.config_archive is not None:
+        print(f'Configs archived to {args.config_archive}',flush = True)
 
     print(f'Done!',flush = True)
@@ -0,0 +1,93 @@
+import os, hashlib, datetime
+from pathlib import Path
+from typing import List, Tuple, Iterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datastreamcli.noahowp_template import NOAHOWP_TEMPLATE, CATCHMENT_SLOTS, compile_template, render_configs
+
+# Name of the NoahOWP parameter store, an uncompressed Arrow IPC file so it can be memory mapped
+PARAMS_NAME = "noah-owp-modular-init.params.arrow"
+
+def template_hash(template : str=NOAHOWP_TEMPLATE) -> str:
+    """
+    sha256 of the NoahOWP namelist template
+
+    template (str) : path to namelist template
+    """
+    with open(template,'rb') as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+def write_params(params : pd.DataFrame, params_file : str, template : str=NOAHOWP_TEMPLATE) -> None:
+    """
+    Atomically write the per catchment NoahOWP parameters, sorted by divide id
+
+    params (pd.DataFrame) : divide_id, lat, lon, terrain_slope and azimuth of each catchment
+    params_file (str) : path to write the parameter store to
+    template (str) : path to the namelist template the parameters are rendered into
+    """
+    params = params[["divide_id"] + CATCHMENT_SLOTS].sort_values(by="divide_id")
+    table = pa.Table.from_pandas(params, preserve_index=False)
+    table = table.replace_schema_metadata({"template_hash": template_hash(template)})
+    params_file = Path(params_file)
+    tmp_file = params_file.with_suffix(f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_file), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file, params_file)
+
+def read_params(params_file : str, divide_ids : List[str]=None) -> pa.Table:
+    """
+    Memory map the parameter store, optionally keeping only some catchments
+
+    params_file (str) : path to parameter store written by write_params
+    divide_ids (list) : only read these catchments, all if None
+    """
+    if Path(params_file).suffix == ".pkl":
+        raise Exception(f"{params_file} is a NoahOWP pickle from an older version, regenerate it with noahowp_pkl.py")
+    source = pa.memory_map(str(params_file), 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if divide_ids is not None:
+        table = table.filter(pc.is_in(table["divide_id"], value_set=pa.array(divide_ids, type=pa.string())))
+    return table
+
+def check_template(table : pa.Table, template : str=NOAHOWP_TEMPLATE) -> bool:
+    """
+    Whether the parameter store was written for this template, configs are always
+    rendered with the current template so a mismatch is only reported
+
+    table (pa.Table) : parameter store from read_params
+    template (str) : path to namelist template
+    """
+    recorded = (table.schema.metadata or {}).get(b"template_hash", b"").decode()
+    if recorded != template_hash(template):
+        print(f"NoahOWP parameters were stored for a different template, rendering with {template}", flush=True)
+        return False
+    return True
+
+def render_params(table : pa.Table,
+                  start : datetime,
+                  end : datetime,
+                  template : str=NOAHOWP_TEMPLATE,
+                  batch_size : int=1000
+                  ) -> Iterator[List[Tuple[str, str]]]:
+    """
+    Render NoahOWP configs on demand, a batch at a time
+
+    table (pa.Table) : parameter store from read_params
+    start (datetime) : start date of simulation
+    end (datetime) : end date of simulation
+    template (str) : path to namelist template
+    batch_size (int) : number of configs per batch
+
+    Returns:
+        iterator of lists of (divide id, config) pairs
+    """
+    conf_template, _ = compile_template(template)
+    startdate = start.strftime('%Y%m%d%H%M')
+    enddate = end.strftime('%Y%m%d%H%M')
+    for jbatch in table.to_batches(max_chunksize=batch_size):
+        columns = {x : jbatch.column(x).to_pylist() for x in CATCHMENT_SLOTS}
+        columns["startdate"] = [startdate] * jbatch.num_rows
+        columns["enddate"] = [enddate] * jbatch.num_rows
+        yield list(zip(jbatch.column("divide_id").to_pylist(), render_configs(conf_template, columns)))
@@ -1,129 +1,76 @@
 from pathlib import Path
-import re, copy, pickle, argparse, os
+import argparse, os
+import pandas as pd
 import geopandas as gpd
 gpd.options.io_engine = "pyogrio"
-import concurrent.futures as cf
-from datastreamcli.ngen_configs_gen import fix_v2_2_units
+from datastreamcli.hydrofabric import read_attributes
+from datastreamcli.usage import report_usage
+from datastreamcli.noahowp_params import write_params, PARAMS_NAME
 from pyogrio.errors import DataLayerError
 
+# Attribute holding each NoahOWP parameter, by hydrofabric version
+NOAHOWP_ATTRIBUTES = {
+    "v2.1" : {"lat"           : "Y",
+              "lon"           : "X",
+              "terrain_slope" : "slope_mean",
+              "azimuth"       : "aspect_c_mean"},
+    "v2.2" : {"lat"           : "centroid_y",
+              "lon"           : "centroid_x",
+              "terrain_slope" : "mean.slope",
+              "azimuth"       : "circ_mean.aspect"},
+}
+
 def gen_noah_owp_confs(gdf,hf_version):    
     """
-    Create a json of noah owp config dicts
+    Extract the per catchment NoahOWP parameters
 
     Parameters:
         gdf : geopandas data frame of divides
         hf_version : hydrofabric version
 
     Returns:
-        all_confs : a dict of noah owp configs (json objects)
+        params : data frame of divide_id, lat, lon, terrain_slope and azimuth sorted by divide_id
     """
-    template = Path(__file__).parent.parent.parent/"configs/ngen/noah-owp-modular-init.namelist.input"
-    with open(template,'r') as fp:
-        conf_template = fp.readlines()
-
-    all_confs = {}
-    if hf_version == "v2.2":
-        for row in gdf.itertuples():
-            jcatch = row.divide_id
-            lon = row.centroid_x
-            lat = row.centroid_y
-            slope = row._37
-            azimuth = row._38
-            jcatch_conf = copy.deepcopy(conf_template)
-            for j,jline in enumerate(jcatch_conf):
-                pattern = r'^\s{2}lat\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):
-                    jcatch_conf[j] = re.sub(pattern,  f"  lat             = {lat}      ", jline)
-                pattern =  r'^\s{2}lon\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] =  re.sub(pattern, f"  lon             = {lon}      ", jline)
-                pattern =  r'^\s{2}terrain_slope\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] = re.sub(pattern,  f"  terrain_slope   = {slope}      ", jline)  
-                pattern =  r'^\s{2}azimuth\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] = re.sub(pattern,  f"  azimuth         = {azimuth}      ", jline) 
-
-            all_confs[jcatch] = jcatch_conf
-    else:
-        catchment_list = sorted(list(gdf['divide_id']))        
-        for jcatch in catchment_list:
-            jcatch_conf = copy.deepcopy(conf_template)
-            jcatch_attrs = gdf.loc[gdf["divide_id"] == jcatch]
-            lat = jcatch_attrs["Y"].iloc[0]
-            lon = jcatch_attrs["X"].iloc[0]
-            slope = jcatch_attrs["slope_mean"].iloc[0]
-            azimuth = jcatch_attrs["aspect_c_mean"].iloc[0]
-            for j,jline in enumerate(jcatch_conf):
-                pattern = r'^\s{2}lat\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):
-                    jcatch_conf[j] = re.sub(pattern,  f"  lat             = {lat}      ", jline)
-                pattern =  r'^\s{2}lon\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] =  re.sub(pattern, f"  lon             = {lon}      ", jline)
-                pattern =  r'^\s{2}terrain_slope\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] = re.sub(pattern,  f"  terrain_slope   = {slope}      ", jline)  
-                pattern =  r'^\s{2}azimuth\s*=\s*([\d.]+)\s*'
-                if re.search(pattern,jline):                
-                    jcatch_conf[j] = re.sub(pattern,  f"  azimuth         = {azimuth}      ", jline)         
+    if hf_version not in NOAHOWP_ATTRIBUTES:
+        raise Exception("This function supports v2.1 and v2.2 hydrofabrics")
+    attributes = NOAHOWP_ATTRIBUTES[hf_version]
+    missing = [x for x in attributes.values() if x not in gdf.columns]
+    if len(missing) > 0:
+        raise Exception(f"{hf_version} attributes are missing {missing}")
 
-            all_confs[jcatch] = jcatch_conf
-    return all_confs
+    params = gdf.set_index("divide_id")[list(attributes.values())].sort_index()
+    params.columns = list(attributes.keys())
+    return params.reset_index()
 
 def multiprocess_gen_pkl(gpkg_path : str,
                          outdir : str,
                          hf_version : str
                          ):
     """
-    Multiprocessing layer for gen_noah_owp_confs()
+    Write the NoahOWP parameter store of a geopackage, see gen_noah_owp_confs()
 
     Parameters
         gpkg_path : Path to geopackage,
-        outdir : Path to directory to store pickle file,
+        outdir : Path to directory to store the parameter store in,
         hf_version : hydrofabric version
 
     Returns
         None
     
     """
-    print(f'Generating NoahOWP pkl',flush=True)
+    print(f'Generating NoahOWP parameter store',flush=True)
 
     if hf_version == "v2.2":
-        gdf = gpd.read_file(gpkg_path,layer = 'divide-attributes').sort_values(by='divide_id')
+        layer = 'divide-attributes'
     elif hf_version == "v2.1":
-        gdf = gpd.read_file(gpkg_path,layer = 'model-attributes').sort_values(by='divide_id')
+        layer = 'model-attributes'
     else:
         raise Exception("This function supports v2.1 and v2.2 hydrofabrics")
-
-    catchment_list = sorted(list(gdf['divide_id']))
-
-    nprocs = max(os.cpu_count() - 1,1)
-    ncatch = len(catchment_list)
-    gdf_list = []
-    nper = ncatch // nprocs
-    nleft = ncatch - (nper * nprocs)   
-    i = 0
-    k = nper
-    for j in range(nprocs):
-        if j < nleft: k += 1
-        gdf_list.append(gdf[i:k])
-        i=k
-        k = nper + i
-        
-    all_proc_confs = {}
-    with cf.ProcessPoolExecutor(max_workers=nprocs) as pool:
-        for results in pool.map(
-        gen_noah_owp_confs,
-        gdf_list,
-        [hf_version for x in range(nprocs)]
-        ):
-            all_proc_confs.update(results)
+    gdf = read_attributes(gpkg_path, layer, ['divide_id'] + list(NOAHOWP_ATTRIBUTES[hf_version].values()))
 
     if not os.path.exists(outdir): 
         os.system(f"mkdir -p {outdir}")
-    with open(Path(outdir,"noah-owp-modular-init.namelist.input.pkl"),'wb') as fp:
-        pickle.dump(all_proc_confs, fp, protocol=pickle.HIGHEST_PROTOCOL)        
+    write_params(gen_noah_owp_confs(gdf, hf_version), Path(outdir,PARAMS_NAME))
 
 if __name__ == "__main__":
 
@@ -155,7 +102,8 @@ if __name__ == "__main__":
     outdir = args.outdir
     hf_version = "v2.1"
     if "divide-attributes" in list(gpd.list_layers(hf_file).name): hf_version = "v2.2"
-    multiprocess_gen_pkl(hf_file,outdir,hf_version)   
+    with report_usage("NoahOWP parameter store"):
+        multiprocess_gen_pkl(hf_file,outdir,hf_version)
     # gdf     = gpd.read_file(hf_file,layer = 'divide-attributes')
     # catchment_list = sorted(list(gdf['divide_id']))         
     # gen_noah_owp_confs(catchment_list,gdf)
\ No newline at end of file
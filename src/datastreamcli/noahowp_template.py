@@ -0,0 +1,66 @@
+import re
+from pathlib import Path
+from typing import Tuple, List, Dict
+
+NOAHOWP_TEMPLATE = Path(__file__).parent.parent.parent/"configs/ngen/noah-owp-modular-init.namelist.input"
+
+# Template lines that vary per catchment (or per run) and what replaces each of them.
+# The part of the line matched is swapped out, anything after it (e.g. the trailing
+# comment) is kept as is.
+SLOT_PATTERNS = {
+    "startdate"     : r'^(\s*startdate\s*=\s*")(?P<value>[0-9]{12})',
+    "enddate"       : r'^(\s*enddate\s*=\s*")(?P<value>[0-9]{12})',
+    "lat"           : r'^\s{2}lat\s*=\s*(?P<value>-?[\d.]+)\s*',
+    "lon"           : r'^\s{2}lon\s*=\s*(?P<value>-?[\d.]+)\s*',
+    "terrain_slope" : r'^\s{2}terrain_slope\s*=\s*(?P<value>-?[\d.]+)\s*',
+    "azimuth"       : r'^\s{2}azimuth\s*=\s*(?P<value>-?[\d.]+)\s*',
+}
+SLOT_LINES = {
+    "startdate"     : "{prefix}{{startdate}}",
+    "enddate"       : "{prefix}{{enddate}}",
+    "lat"           : "  lat             = {{lat}}      ",
+    "lon"           : "  lon             = {{lon}}      ",
+    "terrain_slope" : "  terrain_slope   = {{terrain_slope}}      ",
+    "azimuth"       : "  azimuth         = {{azimuth}}      ",
+}
+CATCHMENT_SLOTS = ["lat", "lon", "terrain_slope", "azimuth"]
+
+def compile_template(template : str=NOAHOWP_TEMPLATE) -> Tuple[str, Dict[str, str]]:
+    """
+    Compile the NoahOWP namelist template into a str.format template, done once
+    instead of regex scanning every line of every catchment's config
+
+    template (str) : path to namelist template
+
+    Returns:
+        format string with a {slot} per entry in SLOT_PATTERNS
+        value of each slot within the template
+    """
+    with open(template,'r') as fp:
+        conf_template = fp.read()
+    conf_template = conf_template.replace("{", "{{").replace("}", "}}")
+    lines = conf_template.splitlines(keepends=True)
+    defaults = {}
+    for jslot, pattern in SLOT_PATTERNS.items():
+        matched = [j for j, jline in enumerate(lines) if re.search(pattern, jline)]
+        if len(matched) != 1:
+            raise Exception(f"Expected one {jslot} line in {template}, found {len(matched)}")
+        j = matched[0]
+        match = re.search(pattern, lines[j])
+        defaults[jslot] = match.group("value")
+        prefix = match.group(1) if jslot.endswith("date") else ""
+        lines[j] = SLOT_LINES[jslot].format(prefix=prefix) + lines[j][match.end():]
+    return "".join(lines), defaults
+
+def render_configs(template : str, columns : Dict[str, list]) -> List[str]:
+    """
+    Fill the compiled template column-wise, one config per row
+
+    template (str) : format string from compile_template
+    columns (dict) : slot name to a sequence of values, all of the same length
+
+    Returns:
+        list of rendered configs
+    """
+    names = list(columns.keys())
+    return [template.format(**dict(zip(names, jvals))) for jvals in zip(*columns.values())]
@@ -0,0 +1,187 @@
+import os, json, hashlib, pickle, importlib
+from enum import Enum
+from pathlib import Path, PurePath
+from datetime import datetime
+from typing import NamedTuple
+from importlib.metadata import version, PackageNotFoundError
+from ngen.config.realization import NgenRealization
+
+# Pickled validated realizations of this process, keyed by realization_key.
+# Only realizations parsed by this process are pickled, persisted ones are JSON.
+REALIZATIONS = {}
+
+# Version of the persisted realization files, realization_<key>.json
+CACHE_FORMAT = 2
+
+# Packages a persisted realization may name model and enum classes of, nothing else is imported to load one
+MODEL_PACKAGES = ("ngen.",)
+
+# pydantic base of the realization models (pydantic.BaseModel, or pydantic.v1's)
+MODEL_BASE = next(x for x in NgenRealization.__mro__ if x.__name__ == "BaseModel")
+
+class RealizationTime(NamedTuple):
+    start_time : datetime
+    end_time : datetime
+    output_interval : int
+
+class CompactRealization(NamedTuple):
+    """
+    The parts of a realization per-catchment checks need, small enough to hand to every worker
+    """
+    time : RealizationTime
+
+def library_versions() -> str:
+    """
+    Versions of the libraries that define the parsed realization, a persisted realization is only loaded by the same versions
+    """
+    versions = []
+    for jpkg in ["ngen-config", "pydantic"]:
+        try:
+            versions.append(version(jpkg))
+        except PackageNotFoundError:
+            versions.append("unknown")
+    return "-".join(versions)
+
+def realization_key(raw : bytes) -> str:
+    """
+    Hash of a realization's contents and the library versions that parse it
+
+    raw (bytes) : contents of the realization file
+    """
+    return hashlib.sha256(raw + library_versions().encode()).hexdigest()
+
+def class_path(cls : type) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+def resolve_class(path : str, base : type) -> type:
+    """
+    Class named by class_path, only subclasses of base defined in MODEL_PACKAGES are resolved
+
+    path (str) : module:qualname of the class
+    base (type) : class the named class has to derive from, e.g. MODEL_BASE or Enum
+    """
+    module, qualname = path.split(":")
+    if not module.startswith(MODEL_PACKAGES):
+        raise ValueError(f"{module} is not a package of realization models")
+    cls = importlib.import_module(module)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    if not (isinstance(cls, type) and issubclass(cls, base)):
+        raise ValueError(f"{path} is not a {base.__name__}")
+    return cls
+
+def encode_model(value):
+    """
+    JSON form of a validated model that decode_model rebuilds without validating it again.
+    Models and enums are tagged with their class, datetimes, paths, tuples and dicts with their type.
+    """
+    if isinstance(value, MODEL_BASE):
+        return {"__model__": class_path(type(value)),
+                "fields": {x: encode_model(y) for x, y in value.__dict__.items()},
+                "fields_set": sorted(value.__fields_set__)}
+    if isinstance(value, Enum):
+        return {"__enum__": class_path(type(value)), "value": encode_model(value.value)}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, PurePath):
+        return {"__path__": str(value)}
+    if isinstance(value, dict):
+        if not all(isinstance(x, str) for x in value):
+            raise TypeError("Cannot persist dicts with keys other than strings")
+        return {"__dict__": {x: encode_model(y) for x, y in value.items()}}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode_model(x) for x in value]}
+    if isinstance(value, list):
+        return [encode_model(x) for x in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(f"Cannot persist {type(value).__name__} values")
+
+def decode_model(value):
+    """
+    Rebuild a model encoded by encode_model. Models are built with construct(), so validators do not run again.
+    """
+    if isinstance(value, list):
+        return [decode_model(x) for x in value]
+    if not isinstance(value, dict):
+        return value
+    if "__model__" in value:
+        cls = resolve_class(value["__model__"], MODEL_BASE)
+        fields = {x: decode_model(y) for x, y in value["fields"].items()}
+        return cls.construct(_fields_set=set(value["fields_set"]), **fields)
+    if "__enum__" in value:
+        return resolve_class(value["__enum__"], Enum)(decode_model(value["value"]))
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    if "__path__" in value:
+        return Path(value["__path__"])
+    if "__tuple__" in value:
+        return tuple(decode_model(x) for x in value["__tuple__"])
+    if "__dict__" in value:
+        return {x: decode_model(y) for x, y in value["__dict__"].items()}
+    raise ValueError(f"Unknown value {sorted(value)}")
+
+def load_cached(json_file : Path, key : str) -> NgenRealization:
+    """
+    Load a persisted realization, None if it is missing or not of this format and key.
+    The file is plain JSON. Only model and enum classes of MODEL_PACKAGES are instantiated from it,
+    without validation, which already ran when the realization was parsed and persisted.
+
+    json_file (Path) : persisted realization, realization_<key>.json
+    key (str) : realization_key of the realization file
+    """
+    if not json_file.exists():
+        return None
+    try:
+        entry = json.loads(json_file.read_text())
+        if entry.get("format") != CACHE_FORMAT or entry.get("key") != key:
+            return None
+        realization = decode_model(entry["realization"])
+        return realization if isinstance(realization, NgenRealization) else None
+    except Exception as e:
+        print(f'Could not load {json_file} ({e}), parsing the realization',flush = True)
+        return None
+
+def parse_realization(realization_file : str=None, raw : bytes=None, cache_dir : str=None) -> NgenRealization:
+    """
+    Parse and validate a realization once per file contents. The validated model is kept in this
+    process and, with cache_dir, written as JSON (see encode_model) that later stages rebuild without
+    validating it again. Every call returns a new copy, so callers are free to resolve paths or edit times.
+
+    realization_file (str) : path to NextGen realization file, not read if raw is given
+    raw (bytes) : contents of the realization file, e.g. read from a run tarball
+    cache_dir (str) : directory of persisted realizations, e.g. datastream-metadata/realization_cache
+    """
+    if raw is None:
+        with open(realization_file, 'rb') as fp:
+            raw = fp.read()
+    elif isinstance(raw, str):
+        raw = raw.encode()
+    key = realization_key(raw)
+    if key in REALIZATIONS:
+        return pickle.loads(REALIZATIONS[key])
+
+    json_file = None if cache_dir is None else Path(cache_dir, f"realization_{key[:16]}.json")
+    realization = None if json_file is None else load_cached(json_file, key)
+    if realization is None:
+        realization = NgenRealization.parse_raw(raw)
+        if json_file is not None:
+            try:
+                entry = {"format": CACHE_FORMAT, "key": key, "realization": encode_model(realization)}
+            except TypeError as e:
+                print(f'Realization is not persisted ({e})',flush = True)
+            else:
+                json_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = json_file.with_suffix(f".{os.getpid()}.tmp")
+                tmp_file.write_text(json.dumps(entry))
+                os.replace(tmp_file, json_file)
+    REALIZATIONS[key] = pickle.dumps(realization)
+    return pickle.loads(REALIZATIONS[key])
+
+def compact_realization(realization : NgenRealization) -> CompactRealization:
+    """
+    Compact form of a realization for worker processes
+    """
+    return CompactRealization(time=RealizationTime(start_time=realization.time.start_time,
+                                                   end_time=realization.time.end_time,
+                                                   output_interval=realization.time.output_interval))
@@ -0,0 +1,156 @@
+import os, gzip, tarfile, tempfile, shutil
+from typing import Dict, List, IO, Tuple
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+try:
+    from pyzstd import SeekableZstdFile
+except ImportError:
+    SeekableZstdFile = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Members read from a stream without random access are spooled, in memory up to this size and on disk beyond it
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+def open_archive_stream(tarball : str) -> Tuple[IO, bool]:
+    """
+    Open the uncompressed stream of a run tarball. Plain tar, seekable zstd (pyzstd) and
+    indexed gzip (indexed_gzip) allow jumping straight to a member, a plain gzip stream has
+    to be decompressed from the start again whenever a read seeks backwards.
+
+    tarball (str) : path to .tar, .tar.gz or .tar.zst
+
+    Returns:
+        file object, whether it supports cheap random access
+    """
+    if tarball.endswith(".zst"):
+        if SeekableZstdFile is None:
+            raise Exception(f"pyzstd is required to read {tarball}")
+        return SeekableZstdFile(tarball, 'r'), True
+    with open(tarball, 'rb') as fp:
+        magic = fp.read(2)
+    if magic == GZIP_MAGIC:
+        if indexed_gzip is not None:
+            return indexed_gzip.IndexedGzipFile(tarball), True
+        return gzip.open(tarball, 'rb'), False
+    return open(tarball, 'rb'), True
+
+class RunArchive:
+    """
+    Read-only view of a run tarball (e.g. ngen-run.tar.gz). The member headers are read in a
+    single pass on open and members are read in place, nothing is extracted to disk.
+    Paths are relative to the run directory inside the archive, the directory holding config/.
+    """
+    def __init__(self, tarball : str):
+        self.tarball = os.path.normpath(str(tarball))
+        self.stream, self.random_access = open_archive_stream(self.tarball)
+        self.tar = tarfile.open(fileobj=self.stream, mode='r:')
+        self.members = {}
+        self.dirs = set()
+        for member in self.tar:
+            if member.isfile():
+                self.members[os.path.normpath(member.name)] = member
+            elif member.isdir():
+                self.dirs.add(os.path.normpath(member.name))
+        self.root = self.find_root()
+        if not self.random_access:
+            print(f"{self.tarball} is not seekable, install indexed_gzip for faster reads", flush=True)
+
+    def find_root(self) -> str:
+        """
+        Member prefix of the run directory, "" when config/ is at the top of the archive
+        """
+        roots = set()
+        for name in self.members:
+            parts = name.split(os.sep)
+            if "config" in parts:
+                roots.add(os.sep.join(parts[:parts.index("config")]))
+        if len(roots) == 0:
+            return ""
+        return min(roots, key=len)
+
+    def relpath(self, path : str) -> str:
+        """
+        Path relative to the run directory, paths may be given relative to the tarball path
+        """
+        path = os.path.normpath(str(path))
+        if path == self.tarball or path.startswith(self.tarball + os.sep):
+            path = os.path.relpath(path, self.tarball)
+        return "" if path == "." else path
+
+    def index(self, pruned_dirs : set=set()) -> Dict[str, List[str]]:
+        """
+        Sorted file names keyed by directory relative to the run directory, the same layout
+        as run_validator.index_run_dir
+
+        pruned_dirs (set) : names of directories whose contents are left out
+        """
+        index = {}
+        entries = [(x, True) for x in self.dirs] + [(x, False) for x in self.members]
+        for name, is_dir in entries:
+            if self.root != "":
+                if not name.startswith(self.root + os.sep):
+                    continue
+                name = name[len(self.root) + 1:]
+            rel_dir, jfile = (name, None) if is_dir else os.path.split(name)
+            parts = rel_dir.split(os.sep) if rel_dir not in ["", "."] else []
+            if any(x in pruned_dirs for x in parts):
+                continue
+            for j in range(len(parts) + 1):
+                index.setdefault(os.sep.join(parts[:j]), [])
+            if jfile is not None:
+                index[os.sep.join(parts)].append(jfile)
+        for rel_dir in index:
+            index[rel_dir].sort()
+        return index
+
+    def open(self, path : str) -> IO:
+        """
+        File object of a member, read from the archive on demand. Without random access (plain
+        gzip), every backward seek would decompress the archive from its start again, so the
+        member is read once, front to back, into a spooled temporary file that readers such as
+        h5py and pyogrio can seek in freely.
+
+        path (str) : path relative to the run directory (or joined to the tarball path)
+        """
+        name = os.path.normpath(os.path.join(self.root, self.relpath(path)))
+        if name not in self.members:
+            raise FileNotFoundError(f"{path} not found in {self.tarball}")
+        fp = self.tar.extractfile(self.members[name])
+        if self.random_access:
+            return fp
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        with fp:
+            shutil.copyfileobj(fp, spool, 1024 * 1024)
+        spool.seek(0)
+        return spool
+
+    def offset(self, path : str) -> int:
+        """
+        Position of a member's data in the uncompressed archive
+
+        path (str) : path relative to the run directory (or joined to the tarball path)
+        """
+        name = os.path.normpath(os.path.join(self.root, self.relpath(path)))
+        return self.members[name].offset_data
+
+    def read(self, path : str) -> bytes:
+        """
+        Contents of a member
+
+        path (str) : path relative to the run directory (or joined to the tarball path)
+        """
+        with self.open(path) as fp:
+            return fp.read()
+
+    def close(self) -> None:
+        self.tar.close()
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,14 +1,118 @@
-import os, argparse
+import os, copy, argparse
 from ngen.config.realization import NgenRealization
 from ngen.config.validate import validate_paths
 import re
-import xarray as xr
+import h5py
+import numpy as np
 import geopandas as gpd
 gpd.options.io_engine = "pyogrio"
+from datastreamcli.hydrofabric import read_attributes, CACHE_DIR_NAME
+from datastreamcli.usage import report_usage, bytes_read
+from datastreamcli.shared_table import SharedTable, read_shared_arrow
+from datastreamcli.run_archive import RunArchive
+from datastreamcli.forcing_scan import scan_forcings, load_bounds, print_scan_summary
+from datastreamcli.validation_cache import ValidationCache, file_hash
+from datastreamcli.config_manifest import context_hash
+from datastreamcli.validation_report import ValidationReport
+from datastreamcli.realization_cache import parse_realization, compact_realization
+import pyogrio
+import pyarrow as pa
 import pandas as pd
 from datetime import datetime, timezone
 import concurrent.futures as cf
-from typing import Tuple, Dict, List, Union
+from typing import Tuple, Dict, List, Union, IO
+
+# Validation chunks, small enough for idle workers to steal work from slow ones
+MIN_CHUNK_SIZE = 64
+CHUNKS_PER_WORKER = 16
+
+# Directories that never hold validator inputs, these are not descended into when indexing
+PRUNED_DIRS = {"outputs", CACHE_DIR_NAME}
+
+# Shape of a catchment id (cat-123), captured wherever {{id}} appears in a realization pattern.
+# The lookbehind keeps a wildcard ahead of {{id}} from splitting the id's prefix.
+ID_REGEX = r"(?<![A-Za-z])[A-Za-z]+-\d+"
+
+# A .* right before {{id}} spans whole directories, then as little of the file name as possible,
+# so the first id-shaped token of the name is the id (cat-7 in cat-7_forcing-2024.csv)
+ID_PREFIX_REGEX = r"(?:.*/)?[^/]*?"
+
+# Column of the shared validation table holding the csv forcing files whose time axes the workers check
+CSV_CHECK_COLUMN = "csv_forcing_check"
+
+def index_run_dir(data_dir : str) -> Dict[str, List[str]]:
+    """
+    Index the files of a run directory in a single os.scandir pass,
+    output directories are pruned so their contents are never listed.
+
+    data_dir (str) : Path to datastreamcli standard folder ngen-run/
+
+    Returns:
+        sorted file names keyed by directory relative to data_dir ("" for data_dir itself)
+    """
+    index = {}
+    visited = set()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        real_dir = os.path.realpath(os.path.join(data_dir, rel_dir))
+        if real_dir in visited:
+            continue
+        visited.add(real_dir)
+        files = []
+        with os.scandir(real_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.name not in PRUNED_DIRS:
+                        stack.append(os.path.join(rel_dir, entry.name))
+                else:
+                    files.append(entry.name)
+        index[rel_dir] = sorted(files)
+    return index
+
+def find_in_index(index : Dict[str, List[str]], data_dir : str, substring : str) -> List[str]:
+    """
+    Paths of all indexed files whose path relative to data_dir contains substring
+
+    index (dict) : run directory index from index_run_dir
+    data_dir (str) : Path to datastreamcli standard folder ngen-run/
+    substring (str) : text to search for
+    """
+    found = []
+    for rel_dir in sorted(index):
+        for jfile in index[rel_dir]:
+            if substring in os.path.join(rel_dir, jfile):
+                found.append(os.path.join(data_dir, rel_dir, jfile))
+    return found
+
+def list_dir(index : Dict[str, List[str]], data_dir : str, path : str) -> Union[List[str], None]:
+    """
+    Sorted file names directly within path, served from the index when path is inside
+    data_dir and listed once otherwise. None if the directory does not exist.
+
+    index (dict) : run directory index from index_run_dir
+    data_dir (str) : Path to datastreamcli standard folder ngen-run/
+    path (str) : directory to list
+    """
+    rel_dir = os.path.normpath(os.path.relpath(path, data_dir))
+    rel_dir = "" if rel_dir == "." else rel_dir
+    if not rel_dir.startswith(".."):
+        return index.get(rel_dir)
+    if not os.path.isdir(path):
+        return None
+    with os.scandir(path) as entries:
+        return sorted([x.name for x in entries if not x.is_dir()])
+
+def in_index(index : Dict[str, List[str]], data_dir : str, path : str) -> bool:
+    """
+    Whether path is a file in the run directory
+
+    index (dict) : run directory index from index_run_dir
+    data_dir (str) : Path to datastreamcli standard folder ngen-run/
+    path (str) : file to look up
+    """
+    files = list_dir(index, data_dir, os.path.dirname(os.path.normpath(path)))
+    return files is not None and os.path.basename(os.path.normpath(path)) in files
 
 def check_forcings(serialized_realization : NgenRealization,
                     forcings_start : datetime,
@@ -38,19 +142,38 @@ def check_forcings(serialized_realization : NgenRealization,
     assert dt_s == dt_forcings_s, f"Realization output_interval {dt_s} does not match forcing time axis {dt_forcings_s}"
 
 
-def validate_realization(realization_file : str) -> Tuple[NgenRealization, str]:
+def load_realization(realization_file : str, archive : RunArchive=None, cache_dir : str=None) -> NgenRealization:
+    """
+    Parse a realization file from disk or from a run tarball, validated once per file contents
+
+    realization_file (str) :  Path to NextGen realization file
+    archive (RunArchive) : run tarball the realization is read from, None to read from disk
+    cache_dir (str) : directory of persisted realizations, see realization_cache.parse_realization
+    """
+    raw = archive.read(realization_file) if archive is not None else None
+    return parse_realization(realization_file, raw, cache_dir)
+
+def validate_realization(realization_file : str, archive : RunArchive=None, cache_dir : str=None,
+                         serialized_realization : NgenRealization=None) -> Tuple[NgenRealization, str]:
     """
     Validates
     1) Realization files meets pydantic model as defined in ngen-cal
     2) Paths given in file exist
 
     realization_file (str) :  Path to local NextGen realization file
+    archive (RunArchive) : run tarball the realization is read from, None to read from disk
+    cache_dir (str) : directory of persisted realizations, see realization_cache.parse_realization
+    serialized_realization (NgenRealization) : the realization already parsed, its paths are resolved in place. Loaded if None
     """
     relative_dir     = os.path.dirname(os.path.dirname(realization_file))
 
     print(f'Done\nValidating {realization_file}',flush = True)
-    serialized_realization = NgenRealization.parse_file(realization_file)
+    if serialized_realization is None:
+        serialized_realization = load_realization(realization_file, archive, cache_dir)
     serialized_realization.resolve_paths(relative_to=relative_dir)
+    if archive is not None:
+        # paths within a tarball are checked against its index by validate_data_dir
+        return serialized_realization, relative_dir
     val = validate_paths(serialized_realization)
     if len(val) > 1:
         for jval in val:
@@ -60,196 +183,689 @@ def validate_realization(realization_file : str) -> Tuple[NgenRealization, str]:
 
     return serialized_realization, relative_dir
 
+def compile_pattern(pattern : str) -> re.Pattern:
+    """
+    Compile a realization file pattern once, {{id}} becomes a named group capturing the catchment id
+
+    pattern (str) : file pattern from the realization, e.g. config/cat_config/CFE/CFE_{{id}}.ini
+    """
+    # files are listed relative to the run directory
+    if pattern.startswith('./'):
+        pattern = pattern[2:]
+    pattern = pattern.replace('.*{{id}}', ID_PREFIX_REGEX + '{{id}}')
+    return re.compile(pattern.replace('{{id}}',f'(?P<id>{ID_REGEX})'))
+
+def extract_ids(compiled : re.Pattern, files : List[str]) -> List[str]:
+    """
+    Catchment ids of all files matching a compiled pattern, files that do not match are skipped
+
+    compiled (re.Pattern) : pattern from compile_pattern
+    files (list) : file paths
+    """
+    ids = []
+    for jfile in files:
+        match = compiled.match(jfile)
+        if match is not None:
+            ids.append(match.group('id'))
+    return ids
+
+def summarize_ids(ids : List[str], max_listed : int=10) -> str:
+    """
+    Comma separated ids, truncated to max_listed
+    """
+    listed = ", ".join(ids[:max_listed])
+    if len(ids) > max_listed:
+        listed += f", ... ({len(ids) - max_listed} more)"
+    return listed
+
+def check_coverage(jval : str, ids : List[str], catchments : List[str], source : str, what : str="files") -> None:
+    """
+    Checks that each catchment in the geopackage appears exactly once in ids, using vectorized set operations
+
+    jval (str) : name of the validation (forcing or a model name)
+    ids (list) : catchment ids found in the files (or inside a forcing file)
+    catchments (list) : catchment (divide) id's in the geopackage
+    source (str) : where the ids came from, e.g. "with pattern config/cat_config/CFE/CFE_{{id}}.ini"
+    what (str) : what each id stands for in the error messages
+    """
+    ids = np.asarray(ids, dtype=str)
+    expected = np.asarray(catchments, dtype=str)
+    found, counts = np.unique(ids, return_counts=True)
+    missing = np.setdiff1d(expected, found, assume_unique=False).tolist()
+    extra = np.setdiff1d(found, expected, assume_unique=False).tolist()
+    duplicated = found[counts > 1].tolist()
+    errors = []
+    if len(missing) > 0:
+        errors.append(f"{jval} is missing {what} for {len(missing)} catchment(s) {source}: {summarize_ids(missing)}")
+    if len(extra) > 0:
+        errors.append(f"{jval} has {what} for {len(extra)} catchment(s) not in the geopackage {source}: {summarize_ids(extra)}")
+    if len(duplicated) > 0:
+        errors.append(f"{jval} has duplicate {what} for {len(duplicated)} catchment(s) {source}: {summarize_ids(duplicated)}")
+    if len(errors) > 0:
+        raise Exception("\n".join(errors))
+
+def epoch_seconds(time : np.ndarray, units : str=None) -> np.ndarray:
+    """
+    Convert a forcing time axis to seconds since 1970-01-01 UTC
+
+    time (np.ndarray) : raw values of the Time variable
+    units (str) : CF units attribute of Time, values are taken as epoch seconds if None
+    """
+    time = np.asarray(time, dtype=np.float64)
+    if units is None:
+        return time
+    match = re.match(r"\s*(seconds|minutes|hours|days)\s+since\s+(.+)", units)
+    if match is None:
+        raise Exception(f"Unsupported forcing time units {units}")
+    scale = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400}[match.group(1)]
+    origin = pd.Timestamp(match.group(2).strip())
+    origin = origin.tz_localize("UTC") if origin.tzinfo is None else origin.tz_convert("UTC")
+    return time * scale + origin.timestamp()
+
+def read_forcing_header(nc_file : Union[str, IO]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the catchment ids and time axis of a NetCDF forcing file with h5py hyperslabs.
+    No forcing data variable is read.
+
+    nc_file (str) : path to (or file object of) forcing file
+
+    Returns:
+        catchment ids, time axis of the first catchment and the first and last time of every catchment, in epoch seconds
+    """
+    with h5py.File(nc_file, 'r') as fp:
+        ids = fp['ids'][:]
+        ids = np.array([x.decode() if isinstance(x, bytes) else str(x) for x in ids], dtype=str)
+        time_var = fp['Time']
+        units = time_var.attrs.get('units')
+        if isinstance(units, bytes):
+            units = units.decode()
+        time = epoch_seconds(time_var[0, :], units)
+        starts = epoch_seconds(time_var[:, 0], units)
+        ends = epoch_seconds(time_var[:, -1], units)
+    return ids, time, starts, ends
+
+def check_forcing_netcdf(nc_file : Union[str, IO],
+                         catchments : List[str],
+                         serialized_realization : NgenRealization,
+                         name : str=None
+                         ) -> None:
+    """
+    Header-only validation of a NetCDF forcing file
+    1) every catchment in the geopackage has exactly one row in the file
+    2) the time axis is regular and every catchment shares its first and last time
+    3) start/end times and interval match realization file
+
+    nc_file (str) : path to (or file object of) forcing file
+    catchments (list) : catchment (divide) id's in the geopackage
+    serialized_realization (NgenRealization) :  serialized NextGen realization via ngen-cal
+    name (str) : name of the forcing file for error messages
+    """
+    name = name if name is not None else os.path.basename(str(nc_file))
+    ids, time, starts, ends = read_forcing_header(nc_file)
+    check_coverage("forcing", ids, catchments, f"in {name}", what="rows")
+
+    if len(time) > 1:
+        dt = np.diff(time)
+        if not np.all(dt == dt[0]):
+            raise Exception(f"Forcing time axis in {name} is not regular, found intervals of {sorted(set(dt.tolist()))} seconds")
+    if not (np.all(starts == time[0]) and np.all(ends == time[-1])):
+        raise Exception(f"Catchments in {name} do not share the same time axis")
+
+    forcings_start = datetime.fromtimestamp(time[0],timezone.utc)
+    forcings_end   = datetime.fromtimestamp(time[-1],timezone.utc)
+    check_forcings(serialized_realization,forcings_start,forcings_end,len(time))
+
+def read_csv_time_axis(csv_file : Union[str, IO], block_size : int=4096) -> Tuple[datetime, datetime, int]:
+    """
+    First and last time of a csv forcing file and its number of rows, read from the header,
+    the first two data lines and the last line (found by seeking back from the end of the file)
+
+    csv_file (str) : path to (or binary file object of) csv forcing file
+    block_size (int) : bytes read at a time when seeking back for the last line
+
+    Returns:
+        first time, last time, number of times implied by the first interval
+    """
+    fp = open(csv_file, 'rb') if isinstance(csv_file, (str, os.PathLike)) else csv_file
+    try:
+        header = fp.readline().decode().strip().split(',')
+        if 'time' not in header:
+            raise Exception(f"No time column in forcing file {csv_file}")
+        jtime = header.index('time')
+        first = fp.readline().decode().strip()
+        second = fp.readline().decode().strip()
+        if first == "":
+            raise Exception(f"No data in forcing file {csv_file}")
+
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        tail = b""
+        position = size
+        while position > 0 and tail.strip().count(b"\n") < 1:
+            position = max(0, position - block_size)
+            fp.seek(position)
+            tail = fp.read(size - position)
+        last = tail.strip().split(b"\n")[-1].decode().strip()
+    finally:
+        if fp is not csv_file:
+            fp.close()
+
+    parse = lambda line: datetime.strptime(line.split(',')[jtime].strip('"'),'%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    forcings_start = parse(first)
+    forcings_end   = parse(last)
+    if second == "" or forcings_end == forcings_start:
+        return forcings_start, forcings_end, 1
+    dt = (parse(second) - forcings_start).total_seconds()
+    n = int(round((forcings_end - forcings_start).total_seconds() / dt)) + 1
+    return forcings_start, forcings_end, n
+
+def check_csv_forcing(csv_file : Union[str, IO], serialized_realization : NgenRealization, name : str=None) -> None:
+    """
+    Checks the time axis of a csv forcing file against the realization
+
+    csv_file (str) : path to (or binary file object of) csv forcing file
+    serialized_realization (NgenRealization) :  serialized NextGen realization via ngen-cal
+    name (str) : name of the forcing file for error messages
+    """
+    name = name if name is not None else os.path.basename(str(csv_file))
+    forcings_start, forcings_end, n = read_csv_time_axis(csv_file)
+    try:
+        check_forcings(serialized_realization,forcings_start,forcings_end,n)
+    except AssertionError as e:
+        raise AssertionError(f"{name} -> {e}")
+
+def scan_forcing_file(nc_file : str, bounds_file : str=None, archive : RunArchive=None) -> None:
+    """
+    Data-quality scan of a NetCDF forcing file, fails on NaNs or values outside the bounds
+
+    nc_file (str) : path to forcing file
+    bounds_file (str) : json file of {variable : [min, max]} overriding forcing_scan.DEFAULT_BOUNDS
+    archive (RunArchive) : run tarball the forcing file is read from, None to read from disk
+    """
+    print(f'Scanning forcing data in {os.path.basename(nc_file)}',flush = True)
+    bounds = load_bounds(bounds_file)
+    if archive is not None:
+        # members of one tarball share a stream, so the member is read once and scanned from a single thread
+        with archive.open(nc_file) as fp:
+            ids, time, _, _ = read_forcing_header(fp)
+            summary = scan_forcings(lambda: fp, ids, time, bounds, nthreads=1)
+    else:
+        ids, time, _, _ = read_forcing_header(nc_file)
+        summary = scan_forcings(nc_file, ids, time, bounds)
+    print_scan_summary(summary)
+    if len(summary["issues"]) > 0:
+        raise Exception("Forcing scan found bad values\n" + "\n".join(summary["issues"]))
+
 def validate_catchment_files(validations : Dict[str, List[str]],
                              catchments : list,
                              forcing_dir : str,
-                             serialized_realization : NgenRealization
+                             serialized_realization : NgenRealization,
+                             matched_ids : Dict[str, List[str]]=None,
+                             archive : RunArchive=None,
+                             forcings_checked : bool=False,
+                             report : ValidationReport=None
                              ) -> None:
     """
     General function to validate any files that need to be associated with a catchment
 
-    validations (dict) : a dictionary of patterns and files to validate.
-        validate_files[jmod.params.model_name] = {"pattern":pattern,"files":sorted([x for x in config_files if bool(compiled.match(x))])}
+    validations (dict) : a dictionary of patterns and files to validate, forcing files are given as full paths.
+        validate_files[jmod.params.model_name] = {"pattern":pattern,"files":sorted(config_files)}
     catchments (list) :  a list of catchment (divide) id's in the geopackage
     forcing_dir (str) : path to folder containing forcing file
     serialized_realization (NgenRealization) :  serialized NextGen realization via ngen-cal
+    matched_ids (dict) : catchment ids already extracted from the files of each validation, extracted here if None
+    archive (RunArchive) : run tarball forcing files are read from, None to read from disk
+    forcings_checked (bool) : the forcing file contents were already checked, by validate_catchment_files_worker or the validation cache
+    report (ValidationReport) : report each validation is recorded in as its own check, fails on the first error if None
 
     Inputs:
-    validations: dictionary of list of patterns and files to match. Each list should be a 1:1 correspondence between a catchment and it's file.
+    validations: dictionary of list of patterns and files to match. Each pattern is compiled once and the
+    catchment ids found in the file names are compared against the catchments as sets, so file order does not matter.
     Multiple lists are allowed to allow for multiple file types (forcings, ngen configs like CFE)
     Validates
     1) file names match realization file description
-    2) files exist for each catchment in geojson
+    2) files exist for each catchment in geojson, and only for those catchments
     3) start/end times and interval match realization file
     """
 
+    report = ValidationReport() if report is None else report
     for jval in validations:
         pattern     = validations[jval]['pattern']
         files       = validations[jval]['files']
         if len(files) == 0:
             continue
-        if jval == "forcing":
-            if files[0].endswith(".nc"):
+        with report.check(jval) as entry:
+            entry["files"] = len(files)
+            if jval == "forcing" and files[0].endswith(".nc"):
+                entry["catchments"] = len(catchments)
+                if forcings_checked:
+                    continue
                 nc_file = files[0]
+                if archive is not None:
+                    with archive.open(nc_file) as fp:
+                        check_forcing_netcdf(fp,catchments,serialized_realization,os.path.basename(nc_file))
+                    continue
                 if not os.path.exists(nc_file):
                     raise Exception(f"Forcings file not found!")
-                with xr.open_dataset(os.path.join(forcing_dir,nc_file)) as ngen_forcings:
-                    df = ngen_forcings['precip_rate']
-                    forcings_start = datetime.fromtimestamp(ngen_forcings.Time.values[0,0],timezone.utc)
-                    forcings_end   = datetime.fromtimestamp(ngen_forcings.Time.values[0,-1],timezone.utc)
-                    check_forcings(serialized_realization,forcings_start,forcings_end,len(ngen_forcings.time.values))
-                    continue
+                check_forcing_netcdf(nc_file,catchments,serialized_realization)
+                continue
 
-        for j, jcatch in enumerate(catchments):
-            jcatch_pattern = pattern.replace('{{id}}',jcatch)
-            compiled       = re.compile(jcatch_pattern)
-
-            jfile = files[j]
-            if not bool(compiled.match(jfile)):
-                raise Exception(f"{jcatch} -> File {jfile} does not match pattern specified {pattern}")
+            if '{{id}}' in pattern:
+                if matched_ids is not None and jval in matched_ids:
+                    ids = matched_ids[jval]
+                else:
+                    ids = extract_ids(compile_pattern(pattern),files)
+                entry["catchments"] = len(set(ids))
+                try:
+                    check_coverage(jval,ids,catchments,f"with pattern {pattern}")
+                except Exception as e:
+                    report.fail(entry, e)
+
+            if jval == "forcing" and not forcings_checked:
+                if archive is not None:
+                    # read in archive order so the tarball is streamed through once
+                    members = sorted(files, key=lambda x: archive.offset(x))
+                    for jfile in members:
+                        with archive.open(jfile) as fp:
+                            try:
+                                check_csv_forcing(fp,serialized_realization,os.path.basename(jfile))
+                            except AssertionError as e:
+                                report.fail(entry, e)
+                else:
+                    for jfile in files:
+                        try:
+                            check_csv_forcing(jfile,serialized_realization)
+                        except AssertionError as e:
+                            report.fail(entry, e)
+
+def validate_catchment_files_worker(validation_table : str,
+                                    start : int,
+                                    stop : int,
+                                    patterns : Dict[str, str],
+                                    serialized_realization : NgenRealization=None,
+                                    collect_all : bool=False
+                                    ) -> dict:
+    """
+    Process pool entry point, extracts the catchment ids from a slice of the files of each validation
+    and checks the time axis of the csv forcing files in the slice of CSV_CHECK_COLUMN.
+    The file lists are read from a shared table rather than pickled to every worker
+
+    validation_table (str) : path to shared table with a column of files per validation
+    start (int) : first row to read
+    stop (int) : row to stop at (exclusive)
+    patterns (dict) : realization pattern of each validation
+    serialized_realization (NgenRealization) :  serialized NextGen realization, or its compact_realization, csv forcings are not checked if None
+    collect_all (bool) : return the csv forcing failures instead of raising the first
+
+    Returns:
+        {"ids": catchment ids found in the slice keyed by validation, "failures": csv forcing failures, "bytes_read": bytes read by the worker}
+    """
+    b0 = bytes_read()
+    table = read_shared_arrow(validation_table, start, stop)
+    ids = {}
+    for jval, pattern in patterns.items():
+        files = [x for x in table[jval].to_pylist() if x is not None]
+        ids[jval] = extract_ids(compile_pattern(pattern),files)
+    failures = []
+    if serialized_realization is not None and CSV_CHECK_COLUMN in table.column_names:
+        for jfile in table[CSV_CHECK_COLUMN].to_pylist():
+            if jfile is not None and jfile.endswith(".csv"):
+                try:
+                    check_csv_forcing(jfile,serialized_realization)
+                except AssertionError as e:
+                    if not collect_all:
+                        raise
+                    failures.append(str(e))
+    return {"ids": ids, "failures": failures, "bytes_read": bytes_read() - b0}
+
+# Set once per validation worker by init_validation_worker, so the realization and
+# patterns are sent to each worker once instead of with every chunk
+WORKER_STATE = {}
+
+def init_validation_worker(validation_table : str,
+                           patterns : Dict[str, str],
+                           serialized_realization : NgenRealization=None,
+                           collect_all : bool=False
+                           ) -> None:
+    """
+    Pool initializer of the validation workers
 
-            if jval == "forcing":
-                if j == 0:
-                    full_path = os.path.join(forcing_dir,files[0])
-                    df = pd.read_csv(full_path)
-                    forcings_start = datetime.strptime(df['time'].iloc[0],'%Y-%m-%d %H:%M:%S')
-                    forcings_end   = datetime.strptime(df['time'].iloc[-1],'%Y-%m-%d %H:%M:%S')
-                    check_forcings(forcings_start,forcings_end,len(df['time']))
+    validation_table (str) : path to shared table with a column of files per validation
+    patterns (dict) : realization pattern of each validation
+    serialized_realization (NgenRealization) :  serialized NextGen realization, or its compact_realization, csv forcings are not checked if None
+    collect_all (bool) : return the csv forcing failures instead of raising the first
+    """
+    WORKER_STATE["validation_table"] = validation_table
+    WORKER_STATE["patterns"] = patterns
+    WORKER_STATE["serialized_realization"] = serialized_realization
+    WORKER_STATE["collect_all"] = collect_all
 
-def validate_data_dir(data_dir : str, troute_restart : str="", troute_crosswalk : str="") -> None:
+def validate_chunk(start : int, stop : int) -> dict:
+    """
+    Validate rows start:stop of the shared table given to init_validation_worker
+    """
+    return validate_catchment_files_worker(WORKER_STATE["validation_table"],
+                                           start,
+                                           stop,
+                                           WORKER_STATE["patterns"],
+                                           WORKER_STATE["serialized_realization"],
+                                           WORKER_STATE["collect_all"])
+
+def schedule_validation(validation_table : str,
+                        nrows : int,
+                        patterns : Dict[str, str],
+                        serialized_realization : NgenRealization=None,
+                        nprocs : int=None,
+                        backend : str="process",
+                        chunk_size : int=None,
+                        entry : dict=None,
+                        collect_all : bool=False
+                        ) -> Dict[str, List[str]]:
+    """
+    Validate the rows of a shared file table in small chunks. Idle workers take the next chunk
+    as soon as they finish one, so a slow chunk does not hold up the rest. The first error
+    cancels every chunk that has not started and is raised, unless csv forcing failures are collected.
+
+    validation_table (str) : path to shared table with a column of files per validation
+    nrows (int) : number of rows in the table
+    patterns (dict) : realization pattern of each validation
+    serialized_realization (NgenRealization) :  serialized NextGen realization, or its compact_realization, csv forcings are not checked if None
+    nprocs (int) : number of workers, defaults to os.cpu_count()
+    backend (str) : "process", or "thread" for checks that mostly wait on I/O
+    chunk_size (int) : rows per chunk, sized for ~16 chunks per worker if None
+    entry (dict) : ValidationReport check entry, gets the csv forcing failures and the bytes read by worker processes
+    collect_all (bool) : add every csv forcing failure to entry instead of raising the first
+
+    Returns:
+        catchment ids found in the files, keyed by validation
+    """
+    if backend not in ["process", "thread"]:
+        raise Exception(f"Unknown validation backend {backend}, use process or thread")
+    nprocs = (os.cpu_count() or 1) if nprocs is None else max(1, nprocs)
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, -(-nrows // (nprocs * CHUNKS_PER_WORKER)))
+    chunks = [(x, min(x + chunk_size, nrows)) for x in range(0, nrows, chunk_size)]
+
+    entry = {"failures": [], "bytes_read": 0} if entry is None else entry
+    matched_ids = {jval: [] for jval in patterns}
+
+    def collect(result, worker_process):
+        for jval, ids in result["ids"].items():
+            matched_ids[jval].extend(ids)
+        entry["failures"].extend(result["failures"])
+        if worker_process:
+            # reads of threads and of this process are already counted by the caller
+            entry["bytes_read"] += result["bytes_read"]
+
+    initargs = (validation_table, patterns, serialized_realization, collect_all)
+    if nprocs == 1 or len(chunks) <= 1:
+        init_validation_worker(*initargs)
+        for start, stop in chunks:
+            collect(validate_chunk(start, stop), False)
+        return matched_ids
+
+    executor = cf.ProcessPoolExecutor if backend == "process" else cf.ThreadPoolExecutor
+    pool = executor(max_workers=min(nprocs, len(chunks)), initializer=init_validation_worker, initargs=initargs)
+    try:
+        futures = [pool.submit(validate_chunk, start, stop) for start, stop in chunks]
+        for future in cf.as_completed(futures):
+            collect(future.result(), backend == "process")
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+    return matched_ids
+
+def validate_data_dir(data_dir : str,
+                      troute_restart : str="",
+                      troute_crosswalk : str="",
+                      archive : RunArchive=None,
+                      scan_forcings : bool=False,
+                      scan_bounds : str=None,
+                      nprocs : int=None,
+                      backend : str="process",
+                      cache_file : str=None,
+                      report : ValidationReport=None,
+                      realization_cache : str=None
+                      ) -> None:
     """
     Top level validation function for a datastreamcli (NextGen) execution
 
-    data_dir (str) : Path to datastreamcli standard folder ngen-run/
+    data_dir (str) : Path to datastreamcli standard folder ngen-run/, or to the tarball when archive is given
+    troute_restart (str) : name of the t-route restart file expected in the run directory
+    troute_crosswalk (str) : name of the t-route crosswalk file expected in the run directory
+    archive (RunArchive) : run tarball to validate in place, None to validate data_dir on disk
+    scan_forcings (bool) : also scan NetCDF forcing values for NaNs and out of bounds values
+    scan_bounds (str) : json file of {variable : [min, max]} overriding the default scan bounds
+    nprocs (int) : number of validation workers, defaults to os.cpu_count()
+    backend (str) : "process", or "thread" for checks that mostly wait on I/O
+    cache_file (str) : validation cache kept between validations, e.g. in a directory that outlives the run. Forcing checks
+        that passed for unchanged files and an unchanged realization time axis, and config checks that passed for the same
+        realization, config file names and catchments, are not repeated. Not used for tarballs.
+    report (ValidationReport) : records status, counts, wall time and bytes read of each check, fails on the first error if None
+    realization_cache (str) : directory of persisted realizations (e.g. datastream-metadata/realization_cache), skips pydantic validation of a known realization
     """
-
-    realization_file = None
-    geopackage_file  = None
-    troute_restart_file = None
-    troute_crosswalk_file = None
-    for path, _, files in os.walk(data_dir):
-        for jfile in files:
-            jfile_path = os.path.join(path,jfile)
-            if jfile_path.find('realization') >= 0:
-                if realization_file is None:
-                    realization_file = jfile_path
-                else:
-                    raise Exception('This run directory contains more than a single realization file, remove all but one.')
-            if jfile_path.find('.gpkg') >= 0:
-                if geopackage_file is None:
-                    geopackage_file = jfile_path
-                else:
-                    raise Exception('This run directory contains more than a single geopackage file, remove all but one.')
-            if troute_restart != "":
-                if jfile_path.find(troute_restart) >= 0:
-                    if troute_restart_file is None:
-                        troute_restart_file = jfile_path
-            if troute_crosswalk_file != "":
-                if jfile_path.find(troute_crosswalk) >= 0:
-                    if troute_crosswalk_file is None:
-                        troute_crosswalk_file = jfile_path
-    if realization_file is None:
-        raise Exception(f"Did not find realization file in ngen-run/config!!!")
-
-    if troute_restart != "" and troute_restart_file is None:
-        raise Exception(
-            f"Did not find t-route restart file {troute_restart} in ngen-run/restart!!!"
-        )
-    if troute_crosswalk != "" and troute_crosswalk_file is None:
-        raise Exception(
-            f"Did not find t-route crosswalk file {troute_crosswalk} in ngen-run/restart!!!"
-        )
+    troute_restart = troute_restart or ""
+    troute_crosswalk = troute_crosswalk or ""
+    report = ValidationReport() if report is None else report
+
+    # every file lookup below is served from this one listing of the run directory
+    with report.check("index", required=True) as entry:
+        if archive is not None:
+            index = archive.index(PRUNED_DIRS)
+        else:
+            index = index_run_dir(data_dir)
+        entry["files"] = sum([len(x) for x in index.values()])
+
+    with report.check("run_files", required=True) as entry:
+        realization_files = find_in_index(index, data_dir, 'realization')
+        if len(realization_files) > 1:
+            raise Exception('This run directory contains more than a single realization file, remove all but one.')
+        geopackage_files = find_in_index(index, data_dir, '.gpkg')
+        if len(geopackage_files) > 1:
+            raise Exception('This run directory contains more than a single geopackage file, remove all but one.')
+        if len(realization_files) == 0:
+            raise Exception(f"Did not find realization file in ngen-run/config!!!")
+        realization_file = realization_files[0]
+        entry["files"] = len(realization_files) + len(geopackage_files)
+
+    with report.check("troute_files") as entry:
+        if troute_restart != "" and len(find_in_index(index, data_dir, troute_restart)) == 0:
+            report.fail(entry, Exception(
+                f"Did not find t-route restart file {troute_restart} in ngen-run/restart!!!"
+            ))
+        if troute_crosswalk != "" and len(find_in_index(index, data_dir, troute_crosswalk)) == 0:
+            report.fail(entry, Exception(
+                f"Did not find t-route crosswalk file {troute_crosswalk} in ngen-run/restart!!!"
+            ))
+        entry["files"] = len([x for x in [troute_restart, troute_crosswalk] if x != ""])
     print(f'Realization found! Retrieving catchment data...',flush = True)
 
-    if geopackage_file is None:
-        raise Exception(f"Did not find geopackage file in ngen-run/config!!!")
-
-    catchments     = gpd.read_file(geopackage_file, layer='divides')
-    catchment_list = sorted(list(catchments['divide_id']))
+    with report.check("geopackage", required=True) as entry:
+        if len(geopackage_files) == 0:
+            raise Exception(f"Did not find geopackage file in ngen-run/config!!!")
+        geopackage_file = geopackage_files[0]
 
-    serialized_realization, relative_dir = validate_realization(realization_file)
-
-    print(f'Done\nValidating required individual catchment paths',flush = True)
-    if "config/troute.yaml" not in str(serialized_realization.global_config.forcing.path):
-        # Forcing path is only troute.yaml for the routing-only run
-        forcing_dir    = os.path.join(relative_dir,serialized_realization.global_config.forcing.path)
-        config_dir     = os.path.join(data_dir,"config","cat_config")
-
-        if os.path.isdir(forcing_dir):
-            forcing_files  = [x for _,_,x in os.walk(forcing_dir)]
-            if len(forcing_files) == 0:
-                raise Exception(f"No forcing files in {forcing_dir}")
-            elif len(forcing_files) == 1:
-                forcing_files = [os.path.join(forcing_dir,forcing_files[0][0])]
-            else:
-                forcing_files  = sorted(forcing_files[0])
+        if archive is not None:
+            with archive.open(geopackage_file) as fp:
+                catchments = pyogrio.read_dataframe(fp, layer='divides', columns=['divide_id'], read_geometry=False, use_arrow=True)
         else:
-            forcing_files = [forcing_dir]
-            nc_file = forcing_files[0]
-            if not os.path.exists(nc_file):
-                raise Exception(f"Forcings file not found!")
-
-        jdir_dict = {"CFE":"CFE",
-                    "PET":"PET",
-                    "NoahOWP":"NOAH-OWP-M",
-                    "bmi_rust":"LSTM"}
-
-        validate_files = {"forcing":{"pattern":serialized_realization.global_config.forcing.file_pattern,"files": forcing_files}}
-        serialized_realization = NgenRealization.parse_file(realization_file)
-        serialized_realization.time.start_time = serialized_realization.time.start_time.replace(tzinfo=timezone.utc)
-        serialized_realization.time.end_time = serialized_realization.time.end_time.replace(tzinfo=timezone.utc)
-        for jform in serialized_realization.global_config.formulations:
-            for jmod in jform.params.modules:
-                if jmod.params.model_name == "SLOTH": continue
-                jdir = jdir_dict[jmod.params.model_name]
-                jconfig_dir = os.path.join(config_dir,jdir)
-                config_files   = [os.path.join(f"config/cat_config/{jdir}",x) for x in [x for _,_,x in os.walk(jconfig_dir)][0]]
-                pattern = str(jmod.params.config)
-                jcatch_pattern = pattern.replace('{{id}}',r'[^/]+')
-                compiled       = re.compile(jcatch_pattern)
-                validate_files[jmod.params.model_name] = {"pattern":pattern,"files":sorted([x for x in config_files if bool(compiled.match(x))])}
+            catchments = read_attributes(geopackage_file, 'divides', ['divide_id'])
+        catchment_list = sorted(list(catchments['divide_id']))
+        entry["files"] = 1
+        entry["catchments"] = len(catchment_list)
+
+    cache = None
+    if cache_file is not None:
+        if archive is not None:
+            print(f'Validation cache is not used for tarballs',flush = True)
+        else:
+            cache = ValidationCache(cache_file, data_dir)
+
+    with report.check("realization", required=True) as entry:
+        serialized_realization = load_realization(realization_file, archive, realization_cache)
+        # paths are resolved on a copy, the module config patterns below are matched unresolved
+        resolved_realization, relative_dir = validate_realization(realization_file, archive,
+                                                                  serialized_realization=copy.deepcopy(serialized_realization))
+        entry["files"] = 1
+
+        print(f'Done\nValidating required individual catchment paths',flush = True)
+        if "config/troute.yaml" not in str(resolved_realization.global_config.forcing.path):
+            # Forcing path is only troute.yaml for the routing-only run
+            forcing_dir    = os.path.join(relative_dir,resolved_realization.global_config.forcing.path)
+            config_dir     = os.path.join(data_dir,"config","cat_config")
+
+            forcing_names = list_dir(index, data_dir, forcing_dir)
+            if forcing_names is not None:
+                if len(forcing_names) == 0:
+                    raise Exception(f"No forcing files in {forcing_dir}")
+                forcing_files = [os.path.join(forcing_dir,x) for x in forcing_names]
+            else:
+                forcing_files = [forcing_dir]
+                if not in_index(index, data_dir, forcing_dir):
+                    raise Exception(f"Forcings file not found!")
+
+            jdir_dict = {"CFE":"CFE",
+                        "PET":"PET",
+                        "NoahOWP":"NOAH-OWP-M",
+                        "bmi_rust":"LSTM"}
+
+            validate_files = {"forcing":{"pattern":resolved_realization.global_config.forcing.file_pattern,"files": forcing_files}}
+            serialized_realization.time.start_time = serialized_realization.time.start_time.replace(tzinfo=timezone.utc)
+            serialized_realization.time.end_time = serialized_realization.time.end_time.replace(tzinfo=timezone.utc)
+            for jform in serialized_realization.global_config.formulations:
+                for jmod in jform.params.modules:
+                    if jmod.params.model_name == "SLOTH": continue
+                    jdir = jdir_dict[jmod.params.model_name]
+                    jconfig_dir = os.path.join(config_dir,jdir)
+                    jconfig_names = list_dir(index, data_dir, jconfig_dir)
+                    if jconfig_names is None:
+                        raise Exception(f"Did not find {jdir} configs in ngen-run/config/cat_config!!!")
+                    config_files   = [os.path.join(f"config/cat_config/{jdir}",x) for x in jconfig_names]
+                    pattern = str(jmod.params.config)
+                    validate_files[jmod.params.model_name] = {"pattern":pattern,"files":sorted(config_files)}
 
     if serialized_realization.routing:
-        troute_path = os.path.join(data_dir,serialized_realization.routing.config)
-        assert os.path.exists(troute_path), "t-route specified in config, but not found"
+        with report.check("routing_config") as entry:
+            troute_path = os.path.join(data_dir,serialized_realization.routing.config)
+            entry["files"] = 1
+            assert in_index(index, data_dir, troute_path), "t-route specified in config, but not found"
 
     if "config/troute.yaml" not in str(serialized_realization.global_config.forcing.path):
         # Forcing path is only troute.yaml for the routing-only run
         # in which case validate_catchment_files won't work, since there are no
         # catchment files
-        nprocs = os.cpu_count()
-        val_dict_list = []
-        catchment_list_list = []
-        ncatchments = len(catchment_list)
-        nper = ncatchments // nprocs
-        nleft = ncatchments - (nper * nprocs)
-        i = 0
-        k = 0
-        for _ in range(nprocs):
-            k = nper + i + nleft
-            tmp_dict = {}
-            for jval in validate_files:
-                tmp_dict[jval] = {}
-                tmp_dict[jval]['pattern'] = validate_files[jval]['pattern']
-                tmp_dict[jval]['files'] = validate_files[jval]['files'][i:k]
-            val_dict_list.append(tmp_dict)
-            jcatchments = catchment_list[i:k]
-            catchment_list_list.append(jcatchments)
-            i = k
-
-        validate_catchment_files(val_dict_list[0],catchment_list_list[0],forcing_dir,serialized_realization)
-        with cf.ProcessPoolExecutor() as pool:
-            for results in pool.map(
-                validate_catchment_files,
-                val_dict_list,
-                catchment_list_list,
-                [forcing_dir for x in range(nprocs)],
-                [serialized_realization for x in range(nprocs)]
-                ):
-                pass
-
+        config_contexts = {}
+        if cache is not None:
+            # a model's configs are checked by name only, so the check is reused while the realization,
+            # the config file names and the catchments are unchanged, even if the configs were regenerated
+            realization_hash = file_hash(realization_file)
+            for jval in [x for x in validate_files if x != "forcing"]:
+                jcontext = context_hash(realization_hash, validate_files[jval]['pattern'],
+                                        validate_files[jval]['files'], catchment_list)
+                if cache.lookup_check(f"{jval}_configs", jcontext):
+                    with report.check(jval) as entry:
+                        entry["files"] = len(validate_files[jval]['files'])
+                        entry["catchments"] = len(catchment_list)
+                        entry["cached"] = True
+                    del validate_files[jval]
+                else:
+                    config_contexts[jval] = jcontext
+        # one shared table of files, padded at the end to a common length
+        nrows = max([len(x['files']) for x in validate_files.values()])
+        columns = {}
+        for jval in validate_files:
+            jfiles = [str(x) for x in validate_files[jval]['files']]
+            columns[jval] = jfiles + [None] * (nrows - len(jfiles))
+        patterns = {jval: validate_files[jval]['pattern'] for jval in validate_files if '{{id}}' in validate_files[jval]['pattern']}
+
+        # csv forcing time axes are checked by the workers, unless they have to be read from a tarball
+        check_csv = archive is None and forcing_files[0].endswith(".csv")
+        forcings_checked = check_csv
+        if cache is not None:
+            # forcing checks depend on the realization's time axis only, not on the rest of the realization
+            time_context = context_hash(serialized_realization.time.start_time, serialized_realization.time.end_time,
+                                        serialized_realization.time.output_interval)
+        if check_csv:
+            csv_files = forcing_files if cache is None else cache.filter("forcing_csv", forcing_files, time_context)
+            columns[CSV_CHECK_COLUMN] = csv_files + [None] * (nrows - len(csv_files))
+        elif cache is not None and forcing_files[0].endswith(".nc"):
+            nc_context = context_hash(time_context, catchment_list)
+            forcings_checked = cache.lookup("forcing_netcdf", forcing_files[0], nc_context)
+        matched_ids = None
+        with report.check("catchment_files") as entry:
+            entry["files"] = sum([len(x['files']) for x in validate_files.values()])
+            with SharedTable(pa.table({x: pa.array(columns[x], type=pa.string()) for x in columns})) as validation_table:
+                matched_ids = schedule_validation(validation_table.path,
+                                                  nrows,
+                                                  patterns,
+                                                  compact_realization(serialized_realization) if check_csv else None,
+                                                  nprocs=nprocs,
+                                                  backend=backend,
+                                                  entry=entry,
+                                                  collect_all=report.collect_all)
+
+        validate_catchment_files(validate_files,catchment_list,forcing_dir,serialized_realization,matched_ids,archive,forcings_checked,report)
+
+        if scan_forcings:
+            if forcing_files[0].endswith(".nc"):
+                with report.check("forcing_scan") as entry:
+                    entry["files"] = 1
+                    scan_context = context_hash(load_bounds(scan_bounds))
+                    if cache is not None and cache.lookup("forcing_scan", forcing_files[0], scan_context):
+                        print(f'Forcing data in {os.path.basename(forcing_files[0])} unchanged since its last scan',flush = True)
+                    else:
+                        scan_forcing_file(forcing_files[0],scan_bounds,archive)
+                        if cache is not None:
+                            # the scan reads the whole file anyway, so a copied but unchanged file is recognized by its contents
+                            cache.record("forcing_scan", forcing_files[0:1], scan_context, content_hash=True)
+            else:
+                print(f'Forcing scan only supports NetCDF forcings, skipping',flush = True)
+
+        if cache is not None and len(report.failures()) == 0:
+            if check_csv:
+                cache.record("forcing_csv", forcing_files, time_context)
+            elif forcing_files[0].endswith(".nc"):
+                cache.record("forcing_netcdf", forcing_files[0:1], nc_context)
+            for jval, jcontext in config_contexts.items():
+                cache.record_check(f"{jval}_configs", jcontext)
+
+    if cache is not None:
+        cache.save()
+        report.cache = cache.hit_rates()
+        print(cache.summary(),flush = True)
+
+    report.raise_failures()
     print(f'\nNGen run folder is valid\n',flush = True)
 
+def validate_tarball(tarball : str,
+                     troute_restart : str="",
+                     troute_crosswalk : str="",
+                     scan_forcings : bool=False,
+                     scan_bounds : str=None,
+                     nprocs : int=None,
+                     backend : str="process",
+                     report : ValidationReport=None,
+                     realization_cache : str=None
+                     ) -> None:
+    """
+    Validate a run tarball (e.g. ngen-run.tar.gz) without extracting it
+
+    tarball (str) : Path to tarball of a datastreamcli standard folder ngen-run/
+    troute_restart (str) : name of the t-route restart file expected in the run directory
+    troute_crosswalk (str) : name of the t-route crosswalk file expected in the run directory
+    scan_forcings (bool) : also scan NetCDF forcing values for NaNs and out of bounds values
+    scan_bounds (str) : json file of {variable : [min, max]} overriding the default scan bounds
+    nprocs (int) : number of validation workers, defaults to os.cpu_count()
+    backend (str) : "process", or "thread" for checks that mostly wait on I/O
+    report (ValidationReport) : records status, counts, wall time and bytes read of each check, fails on the first error if None
+    realization_cache (str) : directory of persisted realizations (e.g. datastream-metadata/realization_cache), skips pydantic validation of a known realization
+    """
+    with RunArchive(tarball) as archive:
+        validate_data_dir(archive.tarball, troute_restart=troute_restart, troute_crosswalk=troute_crosswalk,
+                          archive=archive, scan_forcings=scan_forcings, scan_bounds=scan_bounds,
+                          nprocs=nprocs, backend=backend, report=report, realization_cache=realization_cache)
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -272,6 +888,7 @@ if __name__ == "__main__":
         dest="troute_restart",
         type=str,
         help="Path to the t-route restart file",
+        default="",
         required=False
     )
     parser.add_argument(
@@ -279,29 +896,97 @@ if __name__ == "__main__":
         dest="troute_crosswalk",
         type=str,
         help="Path to the t-route crosswalk file",
+        default="",
+        required=False
+    )
+    parser.add_argument(
+        "--scan_forcings", "--scan-forcings",
+        dest="scan_forcings",
+        action="store_true",
+        help="Scan NetCDF forcing values for NaNs, out of bounds values and constant series",
+        required=False
+    )
+    parser.add_argument(
+        "--scan_bounds",
+        dest="scan_bounds",
+        type=str,
+        help="Path to a json file of {variable : [min, max]} overriding the default scan bounds",
+        default=None,
+        required=False
+    )
+    parser.add_argument(
+        "--nprocs",
+        dest="nprocs",
+        type=int,
+        help="Number of validation workers (default: cpu count)",
+        default=None,
+        required=False
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        type=str,
+        choices=["process", "thread"],
+        help="Run validation workers as processes, or as threads for checks that mostly wait on I/O",
+        default="process",
+        required=False
+    )
+    parser.add_argument(
+        "--cache_file",
+        dest="cache_file",
+        type=str,
+        help="Path to a validation cache kept between validations, e.g. between daily runs. Checks of unchanged forcings and configs are reused",
+        default=None,
+        required=False
+    )
+    parser.add_argument(
+        "--report",
+        dest="report",
+        type=str,
+        help="Path to write a json report of the status, counts, wall time and bytes read of each check",
+        default=None,
+        required=False
+    )
+    parser.add_argument(
+        "--collect_all", "--collect-all",
+        dest="collect_all",
+        action="store_true",
+        help="Run every check and report all failures instead of stopping at the first",
+        required=False
+    )
+    parser.add_argument(
+        "--realization_cache",
+        dest="realization_cache",
+        type=str,
+        help="Directory of parsed realizations shared with other stages, e.g. datastream-metadata/realization_cache",
+        default=None,
         required=False
     )
     args = parser.parse_args()
 
-    if args.data_dir:
-        data_dir = args.data_dir
-        ii_delete_folder = False
-    elif args.tarball:
-        data_dir = '/tmp/ngen_data_dir'
-        if os.path.exists(data_dir):
-            os.system(f'rm -rf {data_dir}')
-        os.mkdir(data_dir)
-        os.system(f'tar -xzf {args.tarball} -C {data_dir}')
-        ii_delete_folder = True
-    elif args.data_dir and args.tarball:
+    if args.data_dir and args.tarball:
         raise Exception('Must specify either data folder path or tarball path, not both.')
-    else:
+    elif not args.data_dir and not args.tarball:
         raise Exception('No options set!')
 
-    assert os.path.exists(data_dir), f"{data_dir} is an invalid directory"
-
     troute_restart = args.troute_restart
     troute_crosswalk = args.troute_crosswalk
-    validate_data_dir(data_dir, troute_restart=troute_restart, troute_crosswalk=troute_crosswalk)
-
-    if ii_delete_folder: os.system('rm -rf /tmp/ngen_data_dir')
\ No newline at end of file
+    report = ValidationReport(collect_all=args.collect_all)
+    try:
+        with report_usage("Validation", children=True):
+            if args.tarball:
+                assert os.path.isfile(args.tarball), f"{args.tarball} is an invalid tarball"
+                validate_tarball(args.tarball, troute_restart=troute_restart, troute_crosswalk=troute_crosswalk,
+                                 scan_forcings=args.scan_forcings, scan_bounds=args.scan_bounds,
+                                 nprocs=args.nprocs, backend=args.backend, report=report,
+                                 realization_cache=args.realization_cache)
+            else:
+                assert os.path.exists(args.data_dir), f"{args.data_dir} is an invalid directory"
+                validate_data_dir(args.data_dir, troute_restart=troute_restart, troute_crosswalk=troute_crosswalk,
+                                  scan_forcings=args.scan_forcings, scan_bounds=args.scan_bounds,
+                                  nprocs=args.nprocs, backend=args.backend, cache_file=args.cache_file,
+                                  report=report, realization_cache=args.realization_cache)
+    finally:
+        # written for failed runs too, those are the ones worth reading
+        if args.report is not None:
+            report.write(args.report)
@@ -0,0 +1,103 @@
+import os, json, tempfile
+from typing import Union, List
+import pandas as pd
+import pyarrow as pa
+import geopandas as gpd
+
+# tmpfs backed, so a shared table never touches the disk
+SHM_DIR = "/dev/shm"
+
+def get_shm_dir(nbytes : int=0) -> str:
+    """
+    Directory shared tables are written to. /dev/shm if it is writable and has room
+    (docker defaults it to 64MB), otherwise the system temp directory.
+
+    nbytes (int) : size of the table to be written
+    """
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        stat = os.statvfs(SHM_DIR)
+        if stat.f_bavail * stat.f_frsize > 2 * nbytes:
+            return SHM_DIR
+    return tempfile.gettempdir()
+
+def to_arrow(df : Union[pd.DataFrame, gpd.GeoDataFrame, pa.Table]) -> pa.Table:
+    """
+    Convert a (Geo)DataFrame to an Arrow table, geometry is encoded as WKB and its
+    column name and crs are kept in the schema metadata
+
+    df (DataFrame) : table to convert
+    """
+    if isinstance(df, pa.Table):
+        return df
+    metadata = {}
+    if isinstance(df, gpd.GeoDataFrame):
+        geo = {"geometry": df.geometry.name, "crs": df.crs.to_wkt() if df.crs is not None else None}
+        metadata["shared_table_geo"] = json.dumps(geo)
+        df = df.to_wkb()
+    table = pa.Table.from_pandas(pd.DataFrame(df), preserve_index=False)
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+class SharedTable:
+    """
+    Read-only table handed to worker processes through an Arrow IPC file in /dev/shm.
+    Workers memory map the file and slice the rows they need, so only the path and a
+    row range are pickled per task no matter how many catchments there are.
+    The file is removed when the table is closed.
+    """
+    def __init__(self, df : Union[pd.DataFrame, gpd.GeoDataFrame, pa.Table], prefix : str="datastream_"):
+        table = to_arrow(df)
+        self.num_rows = table.num_rows
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix=".arrow", dir=get_shm_dir(table.nbytes))
+        os.close(fd)
+        with pa.OSFile(self.path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def close(self) -> None:
+        """
+        Remove the shared file
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def read_shared_arrow(path : str, start : int=None, stop : int=None, columns : List[str]=None) -> pa.Table:
+    """
+    Memory map a shared table and slice it without copying
+
+    path (str) : path of the shared table
+    start (int) : first row to read
+    stop (int) : row to stop reading at (exclusive)
+    columns (list) : columns to read, all if None
+    """
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    start = 0 if start is None else start
+    stop = table.num_rows if stop is None else stop
+    return table.slice(start, stop - start)
+
+def read_shared_table(path : str, start : int=None, stop : int=None, columns : List[str]=None) -> Union[pd.DataFrame, gpd.GeoDataFrame]:
+    """
+    Read rows of a shared table as a (Geo)DataFrame, only the requested rows are converted
+
+    path (str) : path of the shared table
+    start (int) : first row to read
+    stop (int) : row to stop reading at (exclusive)
+    columns (list) : columns to read, all if None
+    """
+    table = read_shared_arrow(path, start, stop, columns)
+    geo = (table.schema.metadata or {}).get(b"shared_table_geo")
+    df = table.to_pandas()
+    if geo is not None:
+        geo = json.loads(geo)
+        if geo["geometry"] in df.columns:
+            df[geo["geometry"]] = gpd.GeoSeries.from_wkb(df[geo["geometry"]], crs=geo["crs"])
+            df = gpd.GeoDataFrame(df, geometry=geo["geometry"], crs=geo["crs"])
+    return df
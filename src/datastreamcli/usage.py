@@ -0,0 +1,53 @@
+import time, resource, sys
+from contextlib import contextmanager
+
+def peak_rss(children : bool=False) -> int:
+    """
+    Peak resident set size in bytes, of this process or of the largest of its child processes
+    that exited so far (e.g. the workers of a pool that shut down)
+
+    children (bool) : peak of the child processes instead of this process
+    """
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+@contextmanager
+def report_usage(stage : str, children : bool=False):
+    """
+    Print the wall time and peak memory of a pipeline stage. The peak RSS of a process only
+    grows, so the peak at the start of the stage is recorded and the growth during the stage
+    is reported: a stage that stays below the peak of an earlier one grows it by 0.
+
+    stage (str) : name of stage to report
+    children (bool) : the stage runs worker processes, also report the largest of their peaks
+    """
+    rss0 = peak_rss()
+    children0 = peak_rss(children=True)
+    t0 = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - t0
+    rss = peak_rss()
+    usage = f"{stage}: {elapsed:.2f} s, peak RSS +{(rss - rss0) / 1024 / 1024:.1f} MB (process {rss / 1024 / 1024:.1f} MB)"
+    if children:
+        workers = peak_rss(children=True)
+        if workers > children0:
+            usage += f", largest worker {workers / 1024 / 1024:.1f} MB"
+        elif workers > 0:
+            usage += f", workers at most {workers / 1024 / 1024:.1f} MB"
+    print(usage, flush=True)
+
+def bytes_read() -> int:
+    """
+    Bytes read by this process so far (rchar of /proc/self/io), 0 where that is not available
+    """
+    try:
+        with open("/proc/self/io", 'r') as fp:
+            for line in fp:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
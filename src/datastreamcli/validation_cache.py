@@ -0,0 +1,157 @@
+import os, hashlib
+from pathlib import Path
+from typing import List, Dict
+import concurrent.futures as cf
+import pandas as pd
+
+CACHE_NAME = "validation_cache.parquet"
+CACHE_COLUMNS = ["check", "path", "size", "mtime_ns", "sha256", "context"]
+
+def file_hash(path : str, chunk_size : int=8 * 1024 * 1024) -> str:
+    """
+    sha256 of a file's contents
+
+    path (str) : path to file
+    chunk_size (int) : number of bytes read at a time
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class ValidationCache:
+    """
+    Record of validation checks that passed, keyed by check name and input file.
+    A check is reused when its context (the hash of everything else it depends on, e.g. the
+    realization time axis) is unchanged and the file is unchanged by (size, mtime). Entries
+    recorded with a content hash are also reused when only the mtime changed and the contents
+    hash the same. Checks of no single file (e.g. catchment coverage of a model's configs) are
+    keyed by their context alone, see lookup_check.
+    """
+    def __init__(self, cache_file : str, root : str):
+        """
+        cache_file (str) : path to the cache, e.g. datastream-metadata/validation_cache.parquet
+        root (str) : directory file paths are recorded relative to, usually ngen-run/
+        """
+        self.cache_file = Path(cache_file)
+        self.root = str(root)
+        self.entries = {}
+        self.hits = {}
+        self.lookups = {}
+        if self.cache_file.exists():
+            cache = pd.read_parquet(self.cache_file)
+            for row in cache.itertuples(index=False):
+                self.entries[(row.check, row.path)] = row._asdict()
+
+    def relpath(self, path : str) -> str:
+        return os.path.relpath(str(path), self.root)
+
+    def lookup(self, check : str, path : str, context : str) -> bool:
+        """
+        Whether check already passed for this file and context
+
+        check (str) : name of the check
+        path (str) : path to the input file
+        context (str) : hash of everything else the check depends on
+        """
+        self.lookups[check] = self.lookups.get(check, 0) + 1
+        entry = self.entries.get((check, self.relpath(path)))
+        if entry is None or entry["context"] != context:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        hit = entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+        if not hit and entry["size"] == stat.st_size and entry["sha256"]:
+            # touched but possibly unchanged, e.g. copied or re-downloaded
+            hit = file_hash(path) == entry["sha256"]
+            if hit:
+                entry["mtime_ns"] = stat.st_mtime_ns
+        if hit:
+            self.hits[check] = self.hits.get(check, 0) + 1
+        return hit
+
+    def filter(self, check : str, paths : List[str], context : str) -> List[str]:
+        """
+        Paths whose check has to be run, i.e. those that miss the cache
+        """
+        return [x for x in paths if not self.lookup(check, x, context)]
+
+    def lookup_check(self, check : str, context : str) -> bool:
+        """
+        Whether a check that depends on no single file's contents already passed for this context
+
+        check (str) : name of the check
+        context (str) : hash of everything the check depends on, e.g. file names and catchments
+        """
+        self.lookups[check] = self.lookups.get(check, 0) + 1
+        entry = self.entries.get((check, ""))
+        hit = entry is not None and entry["context"] == context
+        if hit:
+            self.hits[check] = self.hits.get(check, 0) + 1
+        return hit
+
+    def record_check(self, check : str, context : str) -> None:
+        """
+        Record that a check of no single file passed for this context, see lookup_check
+        """
+        self.entries[(check, "")] = {"check": check, "path": "", "size": -1,
+                                     "mtime_ns": -1, "sha256": "", "context": context}
+
+    def record(self, check : str, paths : List[str], context : str, content_hash : bool=False, nthreads : int=None) -> None:
+        """
+        Record that check passed for these files. Entries are stat-only unless content_hash,
+        which is meant for checks that read whole files anyway; files are then hashed in a thread pool.
+
+        check (str) : name of the check
+        paths (list) : paths of the input files
+        context (str) : hash of everything else the check depends on
+        content_hash (bool) : also record the sha256 of each file
+        nthreads (int) : number of hashing threads
+        """
+        def entry(path):
+            stat = os.stat(path)
+            previous = self.entries.get((check, self.relpath(path)))
+            if not content_hash:
+                sha = ""
+            elif previous is not None and previous["sha256"] and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                sha = previous["sha256"]
+            else:
+                sha = file_hash(path)
+            return {"check": check, "path": self.relpath(path), "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns, "sha256": sha, "context": context}
+
+        with cf.ThreadPoolExecutor(max_workers=nthreads) as pool:
+            for jentry in pool.map(entry, paths):
+                self.entries[(check, jentry["path"])] = jentry
+
+    def save(self) -> None:
+        """
+        Atomically write the cache
+        """
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache = pd.DataFrame(list(self.entries.values()), columns=CACHE_COLUMNS)
+        tmp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+        cache.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def hit_rates(self) -> Dict[str, Dict[str, int]]:
+        """
+        Number of lookups and hits of each check
+        """
+        return {x : {"lookups": self.lookups[x], "hits": self.hits.get(x, 0)} for x in self.lookups}
+
+    def summary(self) -> str:
+        """
+        One line hit rate summary
+        """
+        lookups = sum(self.lookups.values())
+        hits = sum(self.hits.values())
+        rate = 100 * hits / lookups if lookups > 0 else 0
+        checks = ", ".join([f"{x} {y['hits']}/{y['lookups']}" for x, y in self.hit_rates().items()])
+        return f"Validation cache: reused {hits} of {lookups} checks ({rate:.0f}%) {checks}"
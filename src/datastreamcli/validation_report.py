@@ -0,0 +1,87 @@
+import json, time
+from contextlib import contextmanager
+from typing import List
+from datastreamcli.usage import bytes_read
+
+class ValidationReport:
+    """
+    Status, counts of files and catchments examined, wall time and bytes read of each check of a validation run.
+    In collect-all mode failing checks are recorded and validation carries on, except for required
+    checks that later checks depend on (e.g. finding the realization).
+    """
+    def __init__(self, collect_all : bool=False):
+        """
+        collect_all (bool) : record every failure instead of raising the first
+        """
+        self.collect_all = collect_all
+        self.checks = []
+        self.cache = {}
+        self.t0 = time.perf_counter()
+        self.b0 = bytes_read()
+
+    @contextmanager
+    def check(self, name : str, required : bool=False):
+        """
+        Time a check and record its outcome. Yields the check's entry, whose "files" and
+        "catchments" counts the caller fills in.
+
+        name (str) : name of the check
+        required (bool) : later checks depend on this one, so its failure is always raised
+        """
+        entry = {"check": name, "status": "passed", "files": 0, "catchments": 0,
+                 "seconds": 0.0, "bytes_read": 0, "failures": []}
+        self.checks.append(entry)
+        t0 = time.perf_counter()
+        b0 = bytes_read()
+        try:
+            yield entry
+        except Exception as e:
+            entry["failures"].append(str(e))
+            if required or not self.collect_all:
+                raise
+        finally:
+            entry["seconds"] = time.perf_counter() - t0
+            entry["bytes_read"] += bytes_read() - b0
+            if len(entry["failures"]) > 0:
+                entry["status"] = "failed"
+
+    def fail(self, entry : dict, error : Exception) -> None:
+        """
+        Record a failure of a check that carries on in collect-all mode, the error is raised otherwise
+
+        entry (dict) : entry of the check, as yielded by check()
+        error (Exception) : the failure
+        """
+        if not self.collect_all:
+            raise error
+        entry["failures"].append(str(error))
+
+    def failures(self) -> List[str]:
+        return [x for jcheck in self.checks for x in jcheck["failures"]]
+
+    def raise_failures(self) -> None:
+        """
+        Raise every failure recorded in collect-all mode at once
+        """
+        failures = self.failures()
+        if len(failures) > 0:
+            raise Exception(f"Validation found {len(failures)} failure(s)\n" + "\n".join(failures))
+
+    def summary(self) -> dict:
+        return {
+            "valid"       : len(self.failures()) == 0,
+            "collect_all" : self.collect_all,
+            "seconds"     : time.perf_counter() - self.t0,
+            "bytes_read"  : bytes_read() - self.b0,
+            "checks"      : self.checks,
+            "cache"       : self.cache,
+        }
+
+    def write(self, report_file : str) -> None:
+        """
+        Write the report as json
+
+        report_file (str) : path to report, e.g. datastream-metadata/validation_report.json
+        """
+        with open(report_file, 'w') as fp:
+            json.dump(self.summary(), fp, indent=2)
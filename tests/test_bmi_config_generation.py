@@ -1,12 +1,14 @@
 import os
 import pytest
 from ruamel.yaml import YAML
-from datastreamcli.ngen_configs_gen import gen_noah_owp_confs_from_pkl, gen_petAORcfe, generate_troute_conf, gen_lstm, get_hf
+from datastreamcli.ngen_configs_gen import gen_noah_owp_confs_from_pkl, gen_petAORcfe, generate_troute_conf, gen_lstm, get_hf, lstm_template, yaml_float, LSTM_TEMPLATE
 from datastreamcli.noahowp_pkl import multiprocess_gen_pkl
 import datetime as dt
 from pathlib import Path
 import shutil
 import subprocess
+import copy, io
+from ruamel.yaml.scalarstring import DoubleQuotedScalarString
 from ngen.config.realization import NgenRealization
 
 TEST_DIR = Path(__file__).resolve().parent
@@ -16,7 +18,7 @@ NGEN_CONFIG_DIR = CONFIG_DIR / "ngen"
 DATA_DIR = TEST_DIR / "data"
 
 LSTM_REALIZATION =  NGEN_CONFIG_DIR / "realization_rust_lstm.json"
-PKL_FILE = DATA_DIR / "noah-owp-modular-init.namelist.input.pkl"
+PKL_FILE = DATA_DIR / "noah-owp-modular-init.params.arrow"
 
 # Ensure DATA_DIR exists and is empty
 if DATA_DIR.exists():
@@ -110,6 +112,17 @@ def test_cfe_v22():
     assert cfe_example.exists()
 
 
+def test_cfe_v22_multiprocessing():
+    serial_dir = CONF_DIR / "serial"
+    gen_petAORcfe(GEOPACKAGE_PATH_v22, serial_dir, ["CFE"], 1)
+    gen_petAORcfe(GEOPACKAGE_PATH_v22, DATA_DIR, ["CFE"], 2)
+    serial_files = sorted(x.name for x in (serial_dir / "cat_config" / "CFE").iterdir())
+    parallel_files = sorted(x.name for x in CFE_DIR.iterdir())
+    assert serial_files == parallel_files
+    for jfile in serial_files:
+        assert (serial_dir / "cat_config" / "CFE" / jfile).read_text() == (CFE_DIR / jfile).read_text()
+
+
 def test_pet_v22():
     PET_DIR.mkdir(parents=True, exist_ok=True)
     gen_petAORcfe(GEOPACKAGE_PATH_v22, DATA_DIR, ["PET"])
@@ -125,6 +138,20 @@ def test_lstm_v22():
     assert lstm_example.exists()
 
 
+def test_lstm_template_matches_ruamel():
+    lstm_config = copy.copy(LSTM_TEMPLATE)
+    lstm_config['time_step'] = DoubleQuotedScalarString("1 hour")
+    template = lstm_template(lstm_config)
+    values = {"area_sqkm":12.5,"basin_id":"cat-1","basin_name":"cat-1","elev_mean":(1e-05,),"lat":40.01,"lon":-88.37,"slope_mean":float("nan")}
+    lstm_config.update(values)
+    yaml = YAML()
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    stream = io.StringIO()
+    yaml.dump(lstm_config, stream)
+    rendered = template.format(**{k: yaml_float(v[0] if isinstance(v, tuple) else v) if k not in ("basin_id","basin_name") else v for k, v in values.items()})
+    assert rendered == stream.getvalue()
+
+
 def test_routing_v22():
     max_loop_size = (END - START + dt.timedelta(hours=1)).total_seconds() / 3600
     generate_troute_conf(DATA_DIR, START, max_loop_size, GEOPACKAGE_PATH_v22)
@@ -0,0 +1,93 @@
+import datetime, types
+import h5py
+import numpy as np
+import pyarrow as pa
+import pytest
+from datastreamcli.shared_table import SharedTable
+from datastreamcli.run_validator import compile_pattern, extract_ids, check_coverage, check_forcing_netcdf, read_csv_time_axis, check_csv_forcing, schedule_validation, CSV_CHECK_COLUMN
+
+def test_extract_ids():
+    compiled = compile_pattern("config/cat_config/CFE/CFE_{{id}}.ini")
+    files = ["config/cat_config/CFE/CFE_cat-2.ini", "config/cat_config/CFE/CFE_cat-10.ini", "config/cat_config/CFE/README"]
+    assert extract_ids(compiled, files) == ["cat-2", "cat-10"]
+    assert extract_ids(compile_pattern("./config/cat_config/CFE/CFE_{{id}}.ini"), files) == ["cat-2", "cat-10"]
+
+    compiled = compile_pattern(".*{{id}}.*.csv")
+    assert extract_ids(compiled, ["/data/ngen-run/forcings/cat-1496145.csv", "/data/forcings/cat-7_forcing.csv"]) == ["cat-1496145", "cat-7"]
+    # the first id-shaped token of the file name is the id, not the last one or one in a directory
+    assert extract_ids(compiled, ["forcings/cat-7_forcing-2024.csv", "/data/run-2024/forcings/cat-8.csv"]) == ["cat-7", "cat-8"]
+
+def test_check_coverage():
+    catchments = [f"cat-{j}" for j in range(5)]
+    check_coverage("CFE", ["cat-4", "cat-3", "cat-2", "cat-1", "cat-0"], catchments, "with pattern CFE_{{id}}.ini")
+
+    with pytest.raises(Exception) as inst:
+        check_coverage("CFE", ["cat-0", "cat-2", "cat-3", "cat-4", "cat-9"], catchments, "with pattern CFE_{{id}}.ini")
+    assert str(inst.value) == ("CFE is missing files for 1 catchment(s) with pattern CFE_{{id}}.ini: cat-1\n"
+                               "CFE has files for 1 catchment(s) not in the geopackage with pattern CFE_{{id}}.ini: cat-9")
+
+    with pytest.raises(Exception, match="duplicate files for 1 catchment"):
+        check_coverage("forcing", catchments + ["cat-3"], catchments, "with pattern .*{{id}}.*.csv")
+
+def test_check_forcing_netcdf(tmp_path):
+    catchments = [f"cat-{j}" for j in range(4)]
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    times = [start.timestamp() + 3600 * j for j in range(3)]
+    nc_file = tmp_path / "1_forcings.nc"
+    with h5py.File(nc_file, "w") as fp:
+        fp.create_dataset("ids", data=catchments[:3], dtype=h5py.string_dtype())
+        fp.create_dataset("Time", data=np.tile(times, (3, 1)))
+        fp.create_dataset("precip_rate", data=np.zeros((3, 3), dtype="f4"))
+
+    realization = types.SimpleNamespace(time=types.SimpleNamespace(
+        start_time=start, end_time=start + datetime.timedelta(hours=2), output_interval=3600))
+    check_forcing_netcdf(nc_file, catchments[:3], realization)
+    with pytest.raises(Exception, match="forcing is missing rows for 1 catchment\\(s\\) in 1_forcings.nc: cat-3"):
+        check_forcing_netcdf(nc_file, catchments, realization)
+
+def test_read_csv_time_axis(tmp_path):
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    csv_file = tmp_path / "cat-1.csv"
+    lines = ["time,precip_rate"] + [f"{(start + datetime.timedelta(hours=j)).strftime('%Y-%m-%d %H:%M:%S')},0.0" for j in range(1000)]
+    csv_file.write_text("\n".join(lines) + "\n")
+
+    forcings_start, forcings_end, n = read_csv_time_axis(str(csv_file), block_size=16)
+    assert forcings_start == start
+    assert forcings_end == start + datetime.timedelta(hours=999)
+    assert n == 1000
+
+    realization = types.SimpleNamespace(time=types.SimpleNamespace(
+        start_time=start, end_time=start + datetime.timedelta(hours=1000), output_interval=3600))
+    with pytest.raises(AssertionError, match="cat-1.csv -> Realization end time"):
+        check_csv_forcing(str(csv_file), realization)
+
+def test_schedule_validation():
+    files = [f"config/cat_config/CFE/CFE_cat-{j}.ini" for j in range(10)]
+    table = pa.table({"CFE": pa.array(files, type=pa.string())})
+    with SharedTable(table) as validation_table:
+        for backend in ["thread", "process"]:
+            matched_ids = schedule_validation(validation_table.path, len(files), {"CFE": "config/cat_config/CFE/CFE_{{id}}.ini"},
+                                              nprocs=2, backend=backend, chunk_size=3)
+            assert sorted(matched_ids["CFE"]) == sorted([f"cat-{j}" for j in range(10)])
+
+def test_schedule_validation_collect_all(tmp_path):
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    files = []
+    for j in range(4):
+        csv_file = tmp_path / f"cat-{j}.csv"
+        nlines = 2 if j == 3 else 3
+        lines = ["time,precip_rate"] + [f"{(start + datetime.timedelta(hours=k)).strftime('%Y-%m-%d %H:%M:%S')},0.0" for k in range(nlines)]
+        csv_file.write_text("\n".join(lines) + "\n")
+        files.append(str(csv_file))
+    realization = types.SimpleNamespace(time=types.SimpleNamespace(
+        start_time=start, end_time=start + datetime.timedelta(hours=2), output_interval=3600))
+    table = pa.table({"forcing": pa.array(files, type=pa.string()), CSV_CHECK_COLUMN: pa.array(files, type=pa.string())})
+    with SharedTable(table) as validation_table:
+        with pytest.raises(AssertionError, match="cat-3.csv"):
+            schedule_validation(validation_table.path, len(files), {"forcing": ".*{{id}}.csv"}, realization, nprocs=1)
+
+        entry = {"failures": [], "bytes_read": 0}
+        matched_ids = schedule_validation(validation_table.path, len(files), {"forcing": ".*{{id}}.csv"}, realization,
+                                          nprocs=2, backend="thread", chunk_size=1, entry=entry, collect_all=True)
+        assert len(matched_ids["forcing"]) == 4
+        assert len(entry["failures"]) == 1 and entry["failures"][0].startswith("cat-3.csv")
@@ -0,0 +1,67 @@
+import tarfile
+from datastreamcli.config_archive import ConfigArchive, pack_fragment
+
+def test_config_archive(tmp_path):
+    on_disk = tmp_path / "CFE_cat-2.ini"
+    on_disk.write_text("from disk")
+    archive_file = tmp_path / "ngen-bmi-configs.tar.gz"
+    with ConfigArchive(archive_file) as archive:
+        archive.add_dir("./cat_config/CFE/")
+        archive.add_files([("./cat_config/CFE/CFE_cat-0.ini", b"cat-0")])
+        # fragments compressed elsewhere (e.g. a worker process) are appended as is
+        archive.add_fragment(pack_fragment([("./cat_config/CFE/CFE_cat-1.ini", b"cat-1" * 1000)]))
+        archive.add_paths([("./cat_config/CFE/CFE_cat-2.ini", str(on_disk))])
+        archive.add_dir("./cat_config/")
+
+    with tarfile.open(archive_file, "r:gz") as tar:
+        names = tar.getnames()
+        assert names.count("./cat_config") == 1
+        assert {"./cat_config/CFE", "./cat_config/CFE/CFE_cat-0.ini", "./cat_config/CFE/CFE_cat-1.ini",
+                "./cat_config/CFE/CFE_cat-2.ini"} <= set(names)
+        assert tar.extractfile("./cat_config/CFE/CFE_cat-1.ini").read() == b"cat-1" * 1000
+        assert tar.extractfile("./cat_config/CFE/CFE_cat-2.ini").read() == b"from disk"
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_config_archive_dot_dir(tmp_path):
+    archive_file = tmp_path / "ngen-bmi-configs.tar.gz"
+    with ConfigArchive(archive_file) as archive:
+        archive.add_dir("./.ipynb_checkpoints/")
+        archive.add_dir("./cat_config/.hidden./")
+        archive.add_dir("./")
+
+    with tarfile.open(archive_file, "r:gz") as tar:
+        names = tar.getnames()
+    assert sorted(names) == [".", "./.ipynb_checkpoints", "./cat_config", "./cat_config/.hidden."]
+
+def test_config_archive_tree(tmp_path):
+    config_dir = tmp_path / "config"
+    (config_dir / "user" / "sub").mkdir(parents=True)
+    (config_dir / ".hfcache").mkdir()
+    (config_dir / "user" / "sub" / "notes.txt").write_text("keep me")
+    (config_dir / "troute.yaml").write_text("from generator")
+    for jfile in ["realization.json", "hf.gpkg", "weights.parquet", ".hfcache/layer.pkl"]:
+        (config_dir / jfile).write_text("excluded")
+    archive_file = tmp_path / "ngen-bmi-configs.tar.gz"
+    with ConfigArchive(archive_file) as archive:
+        archive.add_files([("./troute.yaml", b"from generator")])
+        archive.add_tree(config_dir, ["*realization*", "*.gpkg", "*.parquet", ".hfcache"],
+                         lambda jdir, jfile: jfile == "troute.yaml")
+
+    with tarfile.open(archive_file, "r:gz") as tar:
+        names = tar.getnames()
+        assert names.count("./troute.yaml") == 1
+        assert {"./user", "./user/sub", "./user/sub/notes.txt"} <= set(names)
+        assert not [x for x in names if "realization" in x or "gpkg" in x or "parquet" in x or "hfcache" in x]
+        assert tar.extractfile("./user/sub/notes.txt").read() == b"keep me"
+
+def test_config_archive_failure(tmp_path):
+    archive_file = tmp_path / "ngen-bmi-configs.tar.gz"
+    try:
+        with ConfigArchive(archive_file) as archive:
+            archive.add_files([("./troute.yaml", b"partial")])
+            with open(archive.fragment_path("CFE-0"), "wb") as fp:
+                fp.write(pack_fragment([("./CFE_cat-0.ini", b"cat-0")]))
+            raise RuntimeError("generation failed")
+    except RuntimeError:
+        pass
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,43 @@
+import pandas as pd
+from datastreamcli.config_manifest import (load_manifest, write_manifest, update_manifest, plan_model,
+                                           existing_configs, remove_configs, row_hashes, context_hash)
+
+def attrs(slopes):
+    return pd.DataFrame({"divide_id": [f"cat-{j}" for j in range(len(slopes))], "mean.slope": slopes})
+
+def test_plan_model(tmp_path):
+    model_dir = tmp_path / "CFE"
+    model_dir.mkdir()
+    for j in range(3):
+        (model_dir / f"CFE_cat-{j}.ini").write_text("")
+    context = context_hash("CFE", "1.0")
+
+    manifest = load_manifest(tmp_path)
+    hashes = row_hashes(attrs([1.0, 2.0, 3.0]))
+    stale, removed = plan_model(manifest, "CFE", hashes, context, existing_configs(model_dir, "CFE"))
+    assert sorted(stale) == ["cat-0", "cat-1", "cat-2"]
+    assert removed == []
+
+    write_manifest(tmp_path, update_manifest(manifest, "CFE", hashes, context))
+    manifest = load_manifest(tmp_path)
+    stale, removed = plan_model(manifest, "CFE", hashes, context, existing_configs(model_dir, "CFE"))
+    assert stale == [] and removed == []
+
+    # cat-1 changed, cat-2 disappeared
+    hashes = row_hashes(attrs([1.0, 5.0]))
+    stale, removed = plan_model(manifest, "CFE", hashes, context, existing_configs(model_dir, "CFE"))
+    assert stale == ["cat-1"]
+    assert removed == ["cat-2"]
+    remove_configs(model_dir, "CFE", removed)
+    assert sorted(existing_configs(model_dir, "CFE")) == ["cat-0", "cat-1"]
+
+    # template or realization change invalidates every divide
+    stale, _ = plan_model(manifest, "CFE", hashes, context_hash("CFE", "2.0"), existing_configs(model_dir, "CFE"))
+    assert sorted(stale) == ["cat-0", "cat-1"]
+
+def test_missing_config_is_stale(tmp_path):
+    hashes = row_hashes(attrs([1.0]))
+    context = context_hash("PET")
+    manifest = update_manifest(load_manifest(tmp_path), "PET", hashes, context)
+    stale, _ = plan_model(manifest, "PET", hashes, context, [])
+    assert stale == ["cat-0"]
@@ -0,0 +1,30 @@
+import h5py
+import numpy as np
+from datastreamcli.forcing_scan import scan_forcings, load_bounds
+
+def test_scan_forcings(tmp_path):
+    ncatch, nt = 50, 24
+    ids = np.array([f"cat-{j}" for j in range(ncatch)])
+    times = 1.7e9 + 3600.0 * np.arange(nt)
+    temperature = np.random.default_rng(0).uniform(250, 300, (ncatch, nt)).astype("f4")
+    temperature[7, 3:6] = np.nan
+    temperature[9, :] = 280.0
+    precip = np.zeros((ncatch, nt), dtype="f4")
+    precip[11, 20] = 5.0
+    nc_file = tmp_path / "1_forcings.nc"
+    with h5py.File(nc_file, "w") as fp:
+        fp.create_dataset("ids", data=ids.tolist(), dtype=h5py.string_dtype())
+        fp.create_dataset("Time", data=np.tile(times, (ncatch, 1)))
+        fp.create_dataset("TMP_2maboveground", data=temperature, chunks=(8, 8))
+        fp.create_dataset("precip_rate", data=precip)
+
+    summary = scan_forcings(str(nc_file), ids, times, load_bounds(), nthreads=2)
+    tmp = summary["variables"]["TMP_2maboveground"]
+    assert tmp["nan"] == 3 and tmp["flagged_catchments"] == 1
+    assert np.isclose(tmp["mean"], np.nanmean(temperature, dtype=np.float64))
+    assert summary["variables"]["precip_rate"]["max"] == 5.0
+    assert len(summary["issues"]) == 2
+    assert "(cat-7) during 2023-11-15 01:13 - 2023-11-15 03:13" in summary["issues"][0]
+    assert "(cat-11)" in summary["issues"][1]
+    assert summary["warnings"] == ["TMP_2maboveground is constant in time for 1 catchment(s) (cat-9)"]
+    assert summary["bytes"] == temperature.nbytes + precip.nbytes
@@ -0,0 +1,68 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+from datastreamcli.hydrofabric import read_layer, read_attributes, attributes_layer, cache_key, layer_cache_file
+
+@pytest.fixture
+def gpkg(tmp_path):
+    ids = [f"cat-{j}" for j in range(10)]
+    hf_file = tmp_path / "test.gpkg"
+    divides = gpd.GeoDataFrame(
+        {"divide_id": ids, "areasqkm": np.arange(10, dtype=float)},
+        geometry=[box(j, j, j + 1, j + 1) for j in range(10)],
+        crs="EPSG:5070",
+    )
+    divides.to_file(hf_file, layer="divides", driver="GPKG")
+    attrs = pd.DataFrame({"divide_id": ids, "mean.slope": np.linspace(0, 90, 10)})
+    gpd.GeoDataFrame(attrs).to_file(hf_file, layer="divide-attributes", driver="GPKG")
+    return hf_file
+
+def test_read_layer_matches_gpkg(gpkg):
+    for layer in ["divides", "divide-attributes"]:
+        expected = gpd.read_file(gpkg, layer=layer)
+        first = read_layer(gpkg, layer)
+        assert layer_cache_file(gpkg, layer).exists()
+        cached = read_layer(gpkg, layer)
+        assert type(cached) is type(expected)
+        pd.testing.assert_frame_equal(pd.DataFrame(first), pd.DataFrame(expected))
+        pd.testing.assert_frame_equal(pd.DataFrame(cached), pd.DataFrame(expected))
+
+def test_cache_dir_env(gpkg, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "persistent"
+    monkeypatch.setenv("DATASTREAM_HF_CACHE_DIR", str(cache_dir))
+    read_layer(gpkg, "divides")
+    assert layer_cache_file(gpkg, "divides").parent.parent == cache_dir
+    assert not (gpkg.parent / ".hfcache").exists()
+
+def test_uncached_layer(gpkg):
+    flowpaths = gpd.GeoDataFrame({"id": ["wb-0"]}, geometry=[box(0, 0, 1, 1)], crs="EPSG:5070")
+    flowpaths.to_file(gpkg, layer="flowpaths", driver="GPKG")
+    read_layer(gpkg, "flowpaths")
+    assert not (gpkg.parent / ".hfcache").exists()
+
+def test_cache_key_survives_touch(gpkg):
+    key = cache_key(gpkg)
+    os.utime(gpkg, ns=(0, 0))
+    assert cache_key(gpkg) == key
+
+def test_read_attributes_projection(gpkg):
+    df = read_attributes(gpkg, "divides", ["divide_id", "areasqkm"])
+    assert not isinstance(df, gpd.GeoDataFrame)
+    assert list(df.columns) == ["divide_id", "areasqkm"]
+    # divides has geometry and must not be decoded just to fill the cache
+    assert not layer_cache_file(gpkg, "divides").exists()
+
+    read_layer(gpkg, "divides")
+    df_cached = read_attributes(gpkg, "divides")
+    assert list(df_cached.columns) == ["divide_id", "areasqkm"]
+    pd.testing.assert_frame_equal(df, df_cached)
+
+    attrs = read_attributes(gpkg, "divide-attributes", ["mean.slope", "divide_id"])
+    assert list(attrs.columns) == ["mean.slope", "divide_id"]
+    assert layer_cache_file(gpkg, "divide-attributes").exists()
+
+def test_attributes_layer(gpkg):
+    assert attributes_layer(gpkg) == "divide-attributes"
@@ -0,0 +1,26 @@
+import datetime
+import pandas as pd
+from datastreamcli.noahowp_params import write_params, read_params, render_params, template_hash
+
+def test_params_store(tmp_path):
+    params = pd.DataFrame({"divide_id": ["cat-3", "cat-1", "cat-2"],
+                           "lat": [30.0, 31.0, 32.0],
+                           "lon": [-100.0, -101.0, -102.0],
+                           "terrain_slope": [0.1, 0.2, 0.3],
+                           "azimuth": [10.0, 20.0, 30.0]})
+    params_file = tmp_path / "noah-owp-modular-init.params.arrow"
+    write_params(params, params_file)
+
+    table = read_params(params_file)
+    assert table["divide_id"].to_pylist() == ["cat-1", "cat-2", "cat-3"]
+    assert table.schema.metadata[b"template_hash"].decode() == template_hash()
+
+    table = read_params(params_file, ["cat-2", "cat-4"])
+    assert table["divide_id"].to_pylist() == ["cat-2"]
+
+    batches = list(render_params(read_params(params_file), datetime.datetime(2020, 1, 1), datetime.datetime(2020, 1, 2), batch_size=2))
+    assert [len(x) for x in batches] == [2, 1]
+    jcatch, jconf = batches[1][0]
+    assert jcatch == "cat-3"
+    assert "  lon             = -100.0      ! longitude [degrees]\n" in jconf
+    assert '  enddate          = "202001020000"' in jconf
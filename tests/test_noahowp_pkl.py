@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from datastreamcli.noahowp_pkl import gen_noah_owp_confs
+
+def attributes(ndivides, hf_version):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"divide_id": [f"cat-{j}" for j in rng.permutation(ndivides)]})
+    if hf_version == "v2.2":
+        names = ["centroid_x", "centroid_y", "mean.elevation", "mean.slope", "circ_mean.aspect"]
+    else:
+        names = ["X", "Y", "slope_mean", "aspect_c_mean"]
+    for jname in names:
+        df[jname] = rng.uniform(0, 1, ndivides)
+    return df
+
+def test_gen_noah_owp_confs_by_name():
+    for hf_version in ["v2.1", "v2.2"]:
+        df = attributes(10, hf_version)
+        params = gen_noah_owp_confs(df, hf_version)
+        assert list(params.columns) == ["divide_id", "lat", "lon", "terrain_slope", "azimuth"]
+        assert params["divide_id"].is_monotonic_increasing
+        row = df.loc[df["divide_id"] == "cat-3"].iloc[0]
+        jparams = params.set_index("divide_id").loc["cat-3"]
+        if hf_version == "v2.2":
+            assert jparams["terrain_slope"] == row["mean.slope"] and jparams["lon"] == row["centroid_x"]
+        else:
+            assert jparams["azimuth"] == row["aspect_c_mean"] and jparams["lat"] == row["Y"]
+
+def test_gen_noah_owp_confs_vectorized(monkeypatch):
+    df = attributes(100_000, "v2.2")
+    expected = df.sort_values("divide_id").reset_index(drop=True)
+    # a per divide lookup goes through one of these, the parameters are selected for the whole frame
+    def per_divide(*args, **kwargs):
+        raise AssertionError("per divide lookup")
+    for jname in ["loc", "iloc", "at", "iterrows", "itertuples", "apply"]:
+        monkeypatch.setattr(pd.DataFrame, jname, property(per_divide))
+    params = gen_noah_owp_confs(df, "v2.2")
+    monkeypatch.undo()
+    assert len(params) == len(df)
+    assert params["divide_id"].tolist() == expected["divide_id"].tolist()
+    assert params["lat"].tolist() == expected["centroid_y"].tolist()
+    assert params["azimuth"].tolist() == expected["circ_mean.aspect"].tolist()
@@ -0,0 +1,22 @@
+from datastreamcli.noahowp_template import compile_template, render_configs, SLOT_PATTERNS, NOAHOWP_TEMPLATE
+
+def test_render_configs():
+    template, defaults = compile_template()
+    assert defaults["lat"] == "40.01" and defaults["lon"] == "-88.37"
+    assert defaults["startdate"] == "202402260100"
+
+    columns = {"lat": [30.5, 31.5], "lon": [-100.25, -101.25], "terrain_slope": [0.1, 0.2],
+               "azimuth": [180.0, 90.0], "startdate": ["202001010000"] * 2, "enddate": ["202001020000"] * 2}
+    confs = render_configs(template, columns)
+    assert len(confs) == 2
+    assert "  lon             = -101.25      ! longitude [degrees]\n" in confs[1]
+    assert '  startdate        = "202001010000" ! UTC time start' in confs[0]
+
+    # everything outside of the slots is the template verbatim
+    with open(NOAHOWP_TEMPLATE, 'r') as fp:
+        template_lines = fp.readlines()
+    conf_lines = confs[0].splitlines(keepends=True)
+    assert len(conf_lines) == len(template_lines)
+    for jconf, jtemplate in zip(conf_lines, template_lines):
+        if not any(jslot in jtemplate for jslot in SLOT_PATTERNS):
+            assert jconf == jtemplate
@@ -0,0 +1,51 @@
+import json, pickle, shutil
+from datetime import datetime
+from pathlib import Path
+from datastreamcli import realization_cache
+from datastreamcli.realization_cache import parse_realization, compact_realization
+
+REALIZATION_ORIG = Path(__file__).resolve().parent.parent / "configs/ngen/realization_sloth_nom_cfe_pet.json"
+
+def test_parse_realization(tmp_path, monkeypatch):
+    realization_file = tmp_path / "realization.json"
+    shutil.copy(REALIZATION_ORIG, realization_file)
+    cache_dir = tmp_path / "realization_cache"
+
+    real = parse_realization(realization_file, cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("realization_*.json"))) == 1
+    assert not list(cache_dir.glob("*.pkl"))
+
+    # copies, so one stage editing its realization does not change another's
+    interval = real.time.output_interval
+    real.time.output_interval = interval * 2
+    assert parse_realization(realization_file, cache_dir=cache_dir).time.output_interval == interval
+
+    # a new process rebuilds the persisted form without parsing or validating it
+    realization_cache.REALIZATIONS.clear()
+    def validate(*args, **kwargs):
+        raise AssertionError("validated again")
+    for jname in ["parse_raw", "parse_obj", "parse_file", "__init__"]:
+        monkeypatch.setattr(realization_cache.NgenRealization, jname, validate)
+    monkeypatch.setattr(realization_cache.MODEL_BASE, "__init__", validate)
+    real = parse_realization(realization_file, cache_dir=cache_dir)
+    assert isinstance(real, realization_cache.NgenRealization)
+    assert real.time.output_interval == interval
+    assert real.time.start_time == datetime(2024, 5, 20, 1)
+    monkeypatch.undo()
+
+    # only model classes of the realization packages are instantiated from a persisted realization
+    json_file = next(cache_dir.glob("realization_*.json"))
+    entry = json.loads(json_file.read_text())
+    json_file.write_text(json.dumps({**entry, "realization": {**entry["realization"], "__model__": "subprocess:Popen"}}))
+    realization_cache.REALIZATIONS.clear()
+    assert parse_realization(realization_file, cache_dir=cache_dir).time.output_interval == interval
+
+    # entries of another format (or key) are parsed again and rewritten
+    json_file.write_text(json.dumps({**entry, "format": 0}))
+    realization_cache.REALIZATIONS.clear()
+    assert parse_realization(realization_file, cache_dir=cache_dir).time.output_interval == interval
+    assert json.loads(json_file.read_text())["format"] == realization_cache.CACHE_FORMAT
+
+    compact = compact_realization(real)
+    assert pickle.loads(pickle.dumps(compact)) == compact
+    assert compact.time.end_time == real.time.end_time
@@ -0,0 +1,46 @@
+import io, tarfile, tempfile
+import pytest
+from datastreamcli import run_archive
+from datastreamcli.run_archive import RunArchive
+
+def add_member(tar, name, data=b""):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+@pytest.mark.parametrize("mode, suffix", [("w:gz", ".tar.gz"), ("w", ".tar")])
+def test_run_archive(tmp_path, mode, suffix):
+    tarball = tmp_path / f"ngen-run{suffix}"
+    with tarfile.open(tarball, mode) as tar:
+        add_member(tar, "ngen-run/config/realization.json", b'{"time": {}}')
+        add_member(tar, "ngen-run/config/cat_config/CFE/CFE_cat-2.ini")
+        add_member(tar, "ngen-run/config/cat_config/CFE/CFE_cat-1.ini")
+        add_member(tar, "ngen-run/forcings/1_forcings.nc", b"forcings")
+        add_member(tar, "ngen-run/outputs/ngen/cat-1.csv")
+
+    with RunArchive(tarball) as archive:
+        assert archive.root == "ngen-run"
+        index = archive.index({"outputs"})
+        assert index["config/cat_config/CFE"] == ["CFE_cat-1.ini", "CFE_cat-2.ini"]
+        assert index[""] == [] and "outputs/ngen" not in index
+        assert archive.read("config/realization.json") == b'{"time": {}}'
+        assert archive.read(f"{tarball}/forcings/1_forcings.nc") == b"forcings"
+        with pytest.raises(FileNotFoundError):
+            archive.open("forcings/2_forcings.nc")
+
+def test_run_archive_spooled(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_archive, "indexed_gzip", None)
+    tarball = tmp_path / "ngen-run.tar.gz"
+    data = bytes(range(256)) * 1024
+    with tarfile.open(tarball, "w:gz") as tar:
+        add_member(tar, "ngen-run/config/realization.json", b"{}")
+        add_member(tar, "ngen-run/forcings/1_forcings.nc", data)
+
+    with RunArchive(tarball) as archive:
+        assert not archive.random_access
+        with archive.open("forcings/1_forcings.nc") as fp:
+            assert isinstance(fp, tempfile.SpooledTemporaryFile)
+            fp.seek(len(data) - 256)
+            assert fp.read() == data[-256:]
+            fp.seek(0)
+            assert fp.read(256) == data[:256]
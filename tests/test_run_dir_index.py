@@ -0,0 +1,23 @@
+import os
+from datastreamcli.run_validator import index_run_dir, find_in_index, list_dir, in_index
+
+def test_index_run_dir(tmp_path):
+    data_dir = tmp_path / "ngen-run"
+    for jdir in ["config/cat_config/CFE", "forcings", "outputs/ngen", "config/.hfcache/v2.2"]:
+        os.makedirs(data_dir / jdir)
+    for jfile in ["config/realization.json", "config/nextgen_01.gpkg", "config/cat_config/CFE/CFE_cat-2.ini",
+                  "config/cat_config/CFE/CFE_cat-1.ini", "forcings/1_forcings.nc", "outputs/ngen/cat-1.csv",
+                  "config/.hfcache/v2.2/divides.parquet"]:
+        (data_dir / jfile).touch()
+
+    index = index_run_dir(str(data_dir))
+    assert "outputs" not in index and "outputs/ngen" not in index
+    assert not any(x.startswith("config/.hfcache") for x in index)
+    assert index["config/cat_config/CFE"] == ["CFE_cat-1.ini", "CFE_cat-2.ini"]
+
+    assert find_in_index(index, str(data_dir), "realization") == [str(data_dir / "config/realization.json")]
+    assert find_in_index(index, str(data_dir), ".gpkg") == [str(data_dir / "config/nextgen_01.gpkg")]
+    assert list_dir(index, str(data_dir), str(data_dir / "forcings")) == ["1_forcings.nc"]
+    assert list_dir(index, str(data_dir), str(data_dir / "forcings/1_forcings.nc")) is None
+    assert in_index(index, str(data_dir), str(data_dir / "forcings/./1_forcings.nc"))
+    assert not in_index(index, str(data_dir), str(data_dir / "config/troute.yaml"))
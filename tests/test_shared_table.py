@@ -0,0 +1,28 @@
+import os
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point
+from datastreamcli.shared_table import SharedTable, read_shared_table, read_shared_arrow
+
+def test_shared_table():
+    gdf = gpd.GeoDataFrame({"divide_id": [f"cat-{j}" for j in range(5)], "areasqkm": [1.0, 2.0, 3.0, 4.0, 5.0]},
+                           geometry=[Point(j, j) for j in range(5)], crs="EPSG:5070")
+    with SharedTable(gdf) as table:
+        assert os.path.exists(table.path)
+        assert table.num_rows == 5
+
+        shard = read_shared_table(table.path, 1, 3)
+        assert isinstance(shard, gpd.GeoDataFrame)
+        assert shard.crs == gdf.crs
+        assert shard["divide_id"].tolist() == ["cat-1", "cat-2"]
+        assert shard.geometry.iloc[1].equals(Point(2, 2))
+
+        ids = read_shared_arrow(table.path, 3, None, ["divide_id"])
+        assert ids.column_names == ["divide_id"]
+        assert ids["divide_id"].to_pylist() == ["cat-3", "cat-4"]
+    assert not os.path.exists(table.path)
+
+    with SharedTable(pd.DataFrame({"divide_id": ["cat-0"], "x": [1]})) as table:
+        df = read_shared_table(table.path)
+        assert not isinstance(df, gpd.GeoDataFrame)
+        assert df["x"].tolist() == [1]
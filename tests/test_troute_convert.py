@@ -1,7 +1,12 @@
-from datastreamcli.nc2parquet import nc2parquet
+from datastreamcli.nc2parquet import nc2parquet, Compression, whole_milliseconds
+from datastreamcli.nc2parquet_bench import nc2parquet_bench
 import pytest
 import xarray as xr
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as pds
 from pathlib import Path
 from tempfile import TemporaryDirectory
 import boto3
@@ -92,6 +97,185 @@ def test_nc2parquet_directory(download_troute_files):
             assert len(df) > 0
 
 
+def write_troute_nc(nc_file, nfeatures=50, ntimes=24, start="2026-01-01 01:00"):
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(
+        {x: (("feature_id", "time"), rng.random((nfeatures, ntimes), dtype="f4")) for x in ["flow", "velocity", "depth"]},
+        coords={"feature_id": np.arange(nfeatures, dtype="int64") * 10,
+                "time": pd.date_range(start, periods=ntimes, freq="h"),
+                "type": ("feature_id", np.where(np.arange(nfeatures) % 10 == 0, "wb", "ln"))})
+    ds.to_netcdf(nc_file)
+    return ds
+
+
+def test_nc2parquet_chunked(tmp_path):
+    nc_file = tmp_path / "troute_output_202601010100.nc"
+    ds = write_troute_nc(nc_file)
+    df_original = ds.to_dataframe().reset_index()
+
+    nc2parquet(str(nc_file), str(tmp_path / "out"), chunk_size=100)
+
+    output_file = tmp_path / "out" / f"{nc_file.stem}.parquet"
+    assert pq.ParquetFile(output_file).num_row_groups == 13
+    df = pd.read_parquet(output_file)
+    assert list(df.columns) == list(df_original.columns)
+    assert np.array_equal(df["feature_id"], df_original["feature_id"])
+    assert np.array_equal(df["flow"], df_original["flow"])
+    assert list(df["type"]) == list(df_original["type"])
+
+
+def test_nc2parquet_engines(tmp_path):
+    nc_file = tmp_path / "troute_output_202601010100.nc"
+    write_troute_nc(nc_file)
+    for engine in ["pandas", "arrow"]:
+        nc2parquet(str(nc_file), str(tmp_path / engine), chunk_size=100, engine=engine)
+
+    table_pandas = pq.read_table(tmp_path / "pandas" / f"{nc_file.stem}.parquet")
+    table_arrow = pq.read_table(tmp_path / "arrow" / f"{nc_file.stem}.parquet")
+    assert table_arrow.schema.equals(table_pandas.schema, check_metadata=True)
+    assert table_arrow.equals(table_pandas)
+
+
+def test_nc2parquet_bench(tmp_path):
+    write_troute_nc(tmp_path / "troute_output_202601010100.nc")
+    summary = nc2parquet_bench(str(tmp_path / "troute_output_202601010100.nc"), repeat=1)
+    assert sorted(summary) == ["arrow", "pandas"]
+    for result in summary.values():
+        assert result["rows_per_s"] > 0
+        assert result["peak_rss"] >= result["baseline_rss"] > 0
+
+def test_nc2parquet_workers(tmp_path):
+    in_dir = tmp_path / "troute"
+    in_dir.mkdir()
+    for j in range(3):
+        write_troute_nc(in_dir / f"troute_output_20260101{j:02d}00.nc", nfeatures=20 + j)
+    nc2parquet(str(in_dir), str(tmp_path / "serial"))
+    nc2parquet(str(in_dir), str(tmp_path / "parallel"), workers=2)
+    for j in range(3):
+        name = f"troute_output_20260101{j:02d}00.parquet"
+        assert pq.read_table(tmp_path / "parallel" / name).equals(pq.read_table(tmp_path / "serial" / name))
+
+    (in_dir / "troute_output_2026010101.nc").write_text("not a NetCDF file")
+    with pytest.raises(Exception):
+        nc2parquet(str(in_dir), str(tmp_path / "failed"), workers=2)
+    assert not (tmp_path / "failed" / "troute_output_2026010101.parquet").exists()
+
+
+def test_nc2parquet_dataset(tmp_path):
+    in_dir = tmp_path / "troute"
+    in_dir.mkdir()
+    for j in range(3):
+        write_troute_nc(in_dir / f"troute_output_202601{j + 1:02d}0100.nc", start=f"2026-01-{j + 1:02d} 01:00")
+    nc2parquet(str(in_dir), str(tmp_path / "files"))
+    sort_keys = [("feature_id", "ascending"), ("time", "ascending")]
+    expected = pa.concat_tables([pq.read_table(x) for x in sorted((tmp_path / "files").glob("*.parquet"))]).sort_by(sort_keys)
+
+    nc2parquet(str(in_dir), str(tmp_path / "by_date"), chunk_size=100, partition_by="date", bloom_filter=True, workers=2)
+    assert sorted(x.name for x in (tmp_path / "by_date").iterdir()) == [f"date=2026-01-{j:02d}" for j in range(1, 5)]
+    metadata = pq.ParquetFile(tmp_path / "by_date" / "date=2026-01-02" / "part-0.parquet").metadata
+    assert [x.column_index for x in metadata.row_group(0).sorting_columns] == [0, 1]
+    assert metadata.row_group(0).column(0).statistics.has_min_max
+    assert metadata.row_group(0).column(0).bloom_filter_offset is not None
+    table = pq.read_table(tmp_path / "by_date" / "date=2026-01-02" / "part-0.parquet")
+    assert table.equals(table.sort_by(sort_keys))
+
+    nc2parquet(str(in_dir), str(tmp_path / "by_bucket"), partition_by="feature_bucket", buckets=4)
+    for name in ["by_date", "by_bucket"]:
+        dataset = pds.dataset(tmp_path / name, partitioning="hive")
+        table = dataset.to_table(columns=expected.column_names).sort_by(sort_keys)
+        assert table.equals(expected)
+    table = pds.dataset(tmp_path / "by_bucket", partitioning="hive").to_table(filter=pds.field("feature_bucket") == 2)
+    assert set(table.column("feature_id").to_pylist()) == {x for x in range(0, 500, 10) if x % 4 == 2}
+
+    # a later dataset in the same directory leaves none of the earlier partitions behind
+    (in_dir / "troute_output_202601030100.nc").unlink()
+    nc2parquet(str(in_dir), str(tmp_path / "by_date"), partition_by="date")
+    assert sorted(x.name for x in (tmp_path / "by_date").iterdir()) == [f"date=2026-01-{j:02d}" for j in range(1, 4)]
+    nc2parquet(str(in_dir), str(tmp_path / "by_date"), partition_by="feature_bucket", buckets=4)
+    assert sorted(x.name for x in (tmp_path / "by_date").iterdir()) == ["feature_bucket=0", "feature_bucket=2"]
+
+
+def test_nc2parquet_dataset_schema_budget(tmp_path, capsys):
+    in_dir = tmp_path / "troute"
+    in_dir.mkdir()
+    write_troute_nc(in_dir / "troute_output_202601010100.nc")
+    # feature ids stored as int32 make the compact schema of this file differ from that of the first
+    ds = write_troute_nc(tmp_path / "source.nc", start="2026-01-02 01:00")
+    ds.to_netcdf(in_dir / "troute_output_202601020100.nc", encoding={"feature_id": {"dtype": "int32"}})
+    nc2parquet(str(in_dir), str(tmp_path / "by_bucket"), partition_by="feature_bucket", buckets=4, workers=8)
+    table = pds.dataset(tmp_path / "by_bucket", partitioning="hive").to_table()
+    assert table.schema.field("feature_id").type == pa.int64()
+    # feature ids are multiples of 10, only buckets 0 and 2 have rows
+    assert "2 file worker(s), 2 partition worker(s)" in capsys.readouterr().out
+    assert table.num_rows == 2 * 50 * 24
+
+    with pytest.raises(ValueError, match="--buckets"):
+        nc2parquet(str(in_dir), str(tmp_path / "over_budget"), max_memory_mb=0.01, chunk_size=100,
+                   partition_by="feature_bucket", buckets=4)
+    assert not (tmp_path / "over_budget").exists() or not list((tmp_path / "over_budget").iterdir())
+
+
+def test_nc2parquet_compact_schema(tmp_path):
+    in_dir = tmp_path / "troute"
+    in_dir.mkdir()
+    # the values differ between the files (ids beyond int32 in the second), the dtypes do not
+    write_troute_nc(in_dir / "troute_output_202601010100.nc")
+    ds = write_troute_nc(tmp_path / "source.nc", start="2026-01-02 01:00")
+    ds.assign_coords(feature_id=ds.feature_id + 2**31).to_netcdf(in_dir / "troute_output_202601020100.nc")
+    nc2parquet(str(in_dir), str(tmp_path / "files"))
+    schemas = [pq.read_schema(x) for x in sorted((tmp_path / "files").glob("*.parquet"))]
+    assert schemas[0].types[:2] == [pa.int64(), pa.timestamp("ms")]
+    assert schemas[1].equals(schemas[0])
+
+    # ids stored as int32 stay int32
+    ds.to_netcdf(tmp_path / "int32.nc", encoding={"feature_id": {"dtype": "int32"}})
+    nc2parquet(str(tmp_path / "int32.nc"), str(tmp_path / "int32"))
+    assert pq.read_schema(tmp_path / "int32" / "int32.parquet").field("feature_id").type == pa.int32()
+
+    # times encoded as floats keep nanoseconds
+    ds = write_troute_nc(tmp_path / "source.nc", start="2026-01-02 01:00")
+    ds.to_netcdf(tmp_path / "float.nc", encoding={"time": {"dtype": "float64", "units": "hours since 2026-01-02"}})
+    nc2parquet(str(tmp_path / "float.nc"), str(tmp_path / "float"))
+    assert pq.read_schema(tmp_path / "float" / "float.parquet").field("time").type == pa.timestamp("ns")
+    assert whole_milliseconds("seconds since 1970-01-01 00:00:00")
+    assert not whole_milliseconds("seconds since 1970-01-01 00:00:00.0000005")
+    assert not whole_milliseconds("microseconds since 1970-01-01")
+
+
+def test_nc2parquet_schema_codec(tmp_path, capsys):
+    nc_file = tmp_path / "troute_output_202601010100.nc"
+    ds = write_troute_nc(tmp_path / "source.nc")
+    ds["nudge"] = ds["flow"].astype("f8")
+    ds.to_netcdf(nc_file, encoding={"nudge": {"dtype": "int16", "scale_factor": 0.001, "_FillValue": -32768}})
+
+    nc2parquet(str(nc_file), str(tmp_path / "pandas"), schema_policy="pandas", compression=Compression("brotli"))
+    metadata = pq.ParquetFile(tmp_path / "pandas" / f"{nc_file.stem}.parquet").metadata
+    assert metadata.schema.to_arrow_schema().types[:2] == [pa.int64(), pa.timestamp("ns")]
+    assert metadata.schema.to_arrow_schema().field("nudge").type == pa.float64()
+    assert metadata.row_group(0).column(0).compression == "BROTLI"
+
+    nc2parquet(str(nc_file), str(tmp_path / "compact"))
+    output_file = tmp_path / "compact" / f"{nc_file.stem}.parquet"
+    schema = pq.read_schema(output_file)
+    assert schema.types[:2] == [pa.int64(), pa.timestamp("ms")]
+    assert schema.field("nudge").type == pa.float32()
+    column = pq.ParquetFile(output_file).metadata.row_group(0).column(schema.get_field_index("flow"))
+    assert column.compression == "ZSTD" and "BYTE_STREAM_SPLIT" in column.encodings
+    df = pd.read_parquet(output_file)
+    df_original = pd.read_parquet(tmp_path / "pandas" / f"{nc_file.stem}.parquet")
+    assert np.array_equal(df["feature_id"], df_original["feature_id"])
+    assert np.array_equal(df["time"], df_original["time"])
+    assert np.array_equal(df["flow"], df_original["flow"])
+    assert np.allclose(df["nudge"], df_original["nudge"], atol=1e-6)
+    assert "Compression: zstd (level 3)" in capsys.readouterr().out
+
+    for compression in [Compression("auto", target_mbps=0), Compression("auto", target_ratio=1000)]:
+        nc2parquet(str(nc_file), str(tmp_path / "auto"), compression=compression)
+        codec = capsys.readouterr().out.split("Codec auto: ")[1].split()[0].rstrip(",")
+        metadata = pq.ParquetFile(tmp_path / "auto" / f"{nc_file.stem}.parquet").metadata
+        assert metadata.row_group(0).column(0).compression.startswith(codec.upper())
+
+
 def test_nc2parquet_file_not_found():
     with TemporaryDirectory() as tmp_out:
         with pytest.raises(FileNotFoundError):
@@ -0,0 +1,26 @@
+import re
+import concurrent.futures as cf
+from datastreamcli.usage import report_usage
+
+def allocate(nbytes):
+    data = bytearray(nbytes)
+    data[::4096] = b"x" * len(data[::4096])
+    return len(data)
+
+def test_report_usage(capsys):
+    with report_usage("Stage"):
+        allocate(64 * 1024 * 1024)
+    out = capsys.readouterr().out
+    growth = float(re.search(r"peak RSS \+([0-9.]+) MB", out).group(1))
+    assert 0 < growth < float(re.search(r"process ([0-9.]+) MB", out).group(1))
+
+    # a later, smaller stage does not report the earlier peak
+    with report_usage("Smaller stage"):
+        allocate(1024)
+    assert "peak RSS +0.0 MB" in capsys.readouterr().out
+
+    with report_usage("Workers", children=True):
+        with cf.ProcessPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(allocate, 256 * 1024 * 1024).result() > 0
+    out = capsys.readouterr().out
+    assert float(re.search(r"largest worker ([0-9.]+) MB", out).group(1)) >= 256
@@ -73,7 +73,7 @@ def test_missing_bmi_config():
         validate_data_dir(TEST_DATA_DIR)
         assert False
     except Exception as inst:
-        assert inst.__str__() == "cat-1496145 -> File config/cat_config/CFE/CFE_cat-1496146.ini does not match pattern specified config/cat_config/CFE/CFE_{{id}}.ini"
+        assert inst.__str__() == "CFE is missing files for 1 catchment(s) with pattern config/cat_config/CFE/CFE_{{id}}.ini: cat-1496145"
 
 def test_missing_forcings():
     for f in Path(TEST_DATA_DIR).glob("forcings/*.nc"):
@@ -0,0 +1,46 @@
+import os
+from datastreamcli.validation_cache import ValidationCache
+
+def test_validation_cache(tmp_path):
+    run_dir = tmp_path / "ngen-run"
+    run_dir.mkdir()
+    files = []
+    for j in range(3):
+        jfile = run_dir / f"cat-{j}.csv"
+        jfile.write_text(f"time,precip_rate\n2020-01-01 00:00:00,{j}\n")
+        files.append(str(jfile))
+    cache_file = tmp_path / "datastream-metadata" / "validation_cache.parquet"
+
+    cache = ValidationCache(cache_file, run_dir)
+    assert cache.filter("forcing_csv", files, "realization-1") == files
+    cache.record("forcing_csv", files, "realization-1", content_hash=True)
+    cache.record("forcing_netcdf", files[1:2], "realization-1")
+    cache.save()
+
+    # unchanged, touched and modified files
+    os.utime(files[1], ns=(0, 0))
+    with open(files[2], "a") as fp:
+        fp.write("2020-01-01 01:00:00,0\n")
+    cache = ValidationCache(cache_file, run_dir)
+    assert cache.filter("forcing_csv", files, "realization-1") == [files[2]]
+    assert cache.hit_rates() == {"forcing_csv": {"lookups": 3, "hits": 2}}
+    # stat-only entries are not hashed, so a touched file misses
+    assert cache.entries[("forcing_netcdf", "cat-1.csv")]["sha256"] == ""
+    assert not cache.lookup("forcing_netcdf", files[1], "realization-1")
+
+    # a new realization invalidates every check that depends on it
+    assert cache.filter("forcing_csv", files, "realization-2") == files
+    assert cache.filter("forcing_netcdf", files[:1], "realization-1") == files[:1]
+
+def test_validation_cache_checks(tmp_path):
+    cache_file = tmp_path / "validation_cache.parquet"
+    cache = ValidationCache(cache_file, tmp_path)
+    assert not cache.lookup_check("CFE_configs", "context-1")
+    cache.record_check("CFE_configs", "context-1")
+    cache.save()
+
+    # checks of no single file survive a new run directory, files are not looked at
+    cache = ValidationCache(cache_file, tmp_path / "another-run")
+    assert cache.lookup_check("CFE_configs", "context-1")
+    assert not cache.lookup_check("CFE_configs", "context-2")
+    assert cache.hit_rates() == {"CFE_configs": {"lookups": 2, "hits": 1}}
@@ -0,0 +1,31 @@
+import json
+import pytest
+from datastreamcli.validation_report import ValidationReport
+
+def test_validation_report(tmp_path):
+    report = ValidationReport()
+    with report.check("index", required=True) as entry:
+        entry["files"] = 3
+    with pytest.raises(Exception, match="missing CFE"):
+        with report.check("CFE"):
+            raise Exception("missing CFE")
+    assert [x["status"] for x in report.checks] == ["passed", "failed"]
+
+    report = ValidationReport(collect_all=True)
+    with report.check("CFE") as entry:
+        report.fail(entry, Exception("missing cat-1"))
+        report.fail(entry, Exception("missing cat-2"))
+    with report.check("forcing"):
+        raise AssertionError("bad time axis")
+    with pytest.raises(Exception, match="no realization"):
+        with report.check("run_files", required=True):
+            raise Exception("no realization")
+    with pytest.raises(Exception, match="Validation found 4 failure\\(s\\)"):
+        report.raise_failures()
+
+    report.write(tmp_path / "report.json")
+    with open(tmp_path / "report.json") as fp:
+        summary = json.load(fp)
+    assert summary["valid"] is False
+    assert [x["check"] for x in summary["checks"]] == ["CFE", "forcing", "run_files"]
+    assert summary["checks"][0]["failures"] == ["missing cat-1", "missing cat-2"]